@@ -2,4 +2,4 @@ from django.apps import AppConfig
 
 
 class GoogleAssistantConfig(AppConfig):
-    name = 'google_assistant'
+    name = 'apps.google_assistant'
@@ -0,0 +1,111 @@
+from collections import deque, namedtuple
+
+
+EntityMatch = namedtuple('EntityMatch', ('start', 'end', 'entity'))
+
+
+class EntityMatcher(object):
+    """Finds every known entity (e.g. hero or ability) named in a piece of text in a single pass.
+
+    This is an Aho-Corasick automaton over all of the names added to it, so finding the entities
+    costs the same however many heroes and abilities there are. Each name belongs to a kind
+    (e.g. 'hero'), overlapping matches are resolved separately for each kind.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [[]]
+        self._patterns = {}
+        self._built = False
+
+    def add(self, pattern, kind, entity, whole_word=False):
+        """Adds a name to look for, pattern must already be lower case.
+
+        If whole_word is True then the pattern is only matched when it is not part of a longer
+        word, e.g. the alias 'am' will match 'is am good' but not 'pam'.
+        """
+        assert not self._built, "Can't add patterns after the matcher has been used"
+        if not pattern:
+            return
+        key = (pattern, kind, whole_word)
+        if key in self._patterns:
+            self._patterns[key].append(entity)
+            return
+        self._patterns[key] = [entity]
+
+        node = 0
+        for char in pattern:
+            try:
+                node = self._goto[node][char]
+            except KeyError:
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+                self._goto[node][char] = len(self._goto) - 1
+                node = len(self._goto) - 1
+        self._outputs[node].append(key)
+
+    def _build(self):
+        """Calculates the failure links of the automaton, breadth first"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+        self._built = True
+
+    def _all_matches(self, text):
+        """Yields (start, end, key) for every occurence of every pattern, including overlaps"""
+        if not self._built:
+            self._build()
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for key in outputs[node]:
+                pattern, _, whole_word = key
+                start = position + 1 - len(pattern)
+                if whole_word and not self._is_whole_word(text, start, position + 1):
+                    continue
+                yield start, position + 1, key
+
+    @staticmethod
+    def _is_whole_word(text, start, end):
+        return (
+            (start == 0 or not text[start - 1].isalnum())
+            and (end == len(text) or not text[end].isalnum()))
+
+    def find(self, text):
+        """Returns a dictionary mapping each kind to the list of EntityMatches found in the text.
+
+        The longest match wins when matches of the same kind overlap, so if 'Chemical Rage' is in
+        the text the ability 'Rage' will not be. The matches are in the order they appear in the
+        text, and each entity is only included once, at its first position.
+        """
+        candidates = {}
+        for start, end, key in self._all_matches(text):
+            candidates.setdefault(key[1], []).append((start, end, key))
+
+        result = {}
+        for kind, matches in candidates.items():
+            accepted = []
+            for start, end, key in sorted(matches, key=lambda m: (m[0] - m[1], m[0])):
+                if not any(start < e and s < end for s, e, _ in accepted):
+                    accepted.append((start, end, key))
+
+            seen = set()
+            result[kind] = []
+            for start, end, key in sorted(accepted, key=lambda m: m[0]):
+                for entity in self._patterns[key]:
+                    if entity not in seen:
+                        seen.add(entity)
+                        result[kind].append(EntityMatch(start, end, entity))
+        return result
@@ -0,0 +1,134 @@
+from apps.hero_advantages.models import Hero, Advantage, HeroCounters
+from apps.hero_advantages.advantage_matrix import AdvantageMatrix
+from apps.hero_abilities.models import Ability
+from apps.metadata.snapshot import Snapshot
+
+from .entity_matcher import EntityMatcher
+
+
+HERO = 'hero'
+ABILITY = 'ability'
+
+
+class KnowledgeBase(Snapshot):
+    """A read-only, in-memory snapshot of the heroes, abilities and advantages.
+
+    Everything needed to answer a question is loaded once, so answering questions doesn't touch
+    the database. Use current() to get the snapshot.
+
+    The model instances in the snapshot are shared between requests, they must not be modified.
+    """
+
+    def __init__(self, heroes, abilities, advantages, hero_counters=()):
+        self.heroes = tuple(heroes)
+        self.abilities = tuple(abilities)
+
+        self._heroes_by_name = {h.name: h for h in self.heroes}
+        self._abilities_by_hero = {}
+        self._abilities_by_name = {}
+        for ability in self.abilities:
+            self._abilities_by_hero.setdefault(ability.hero_id, []).append(ability)
+            self._abilities_by_name.setdefault(ability.name, []).append(ability)
+
+        self.advantage_matrix = AdvantageMatrix(self.heroes, advantages)
+
+        # {(hero_id, role, direction): (hard_counters, soft_counters)}
+        heroes_by_pk = {h.pk: h for h in self.heroes}
+        self._counters = {
+            (c.hero_id, c.role, c.direction): (
+                [heroes_by_pk[pk] for pk in c.hard_counter_ids],
+                [heroes_by_pk[pk] for pk in c.soft_counter_ids],
+            )
+            for c in hero_counters
+        }
+
+        self.entity_matcher = self._build_entity_matcher()
+
+    @classmethod
+    def load(cls):
+        """Loads a new snapshot of the active generation"""
+        heroes = {h.pk: h for h in cls.instances(Hero)}
+        abilities = cls.instances(Ability)
+        for ability in abilities:
+            # Share the hero instances, so ability.hero doesn't go back to the database
+            ability.hero = heroes[ability.hero_id]
+        advantages = cls.values_list(Advantage, 'hero_id', 'enemy_id', 'advantage')
+        return cls(heroes.values(), abilities, advantages, cls.instances(HeroCounters))
+
+    def _build_entity_matcher(self):
+        matcher = EntityMatcher()
+        for hero in self.heroes:
+            for alias in (a.lower() for a in hero.aliases):
+                if len(alias) >= 2:
+                    matcher.add(alias, HERO, hero, whole_word=(len(alias) == 2))
+        for ability in self.abilities:
+            matcher.add(ability.name.lower(), ABILITY, ability)
+        return matcher
+
+    def hero(self, name):
+        try:
+            return self._heroes_by_name[name]
+        except KeyError:
+            raise Hero.DoesNotExist("No hero called {}".format(name))
+
+    def ability(self, name):
+        """The ability called name, raises MultipleObjectsReturned if more than one hero has it"""
+        return self._single_ability(self._abilities_by_name.get(name, []))
+
+    def hero_abilities(self, hero, standard_only=False):
+        """The abilities of hero.
+
+        If standard_only is True then abilities from talents or Aghanim's Scepter are excluded.
+        """
+        abilities = self._abilities_by_hero.get(hero.pk, [])
+        if standard_only:
+            return [a for a in abilities if not (a.is_from_talent or a.is_from_aghanims)]
+        return list(abilities)
+
+    def ultimates(self, hero):
+        return [a for a in self.hero_abilities(hero) if a.is_ultimate]
+
+    def ultimate(self, hero):
+        return self._single_ability(self.ultimates(hero))
+
+    def ability_with_hotkey(self, hero, hotkey):
+        return self._single_ability([a for a in self.hero_abilities(hero) if a.hotkey == hotkey])
+
+    @staticmethod
+    def _single_ability(abilities):
+        if not abilities:
+            raise Ability.DoesNotExist
+        if len(abilities) > 1:
+            raise Ability.MultipleObjectsReturned
+        return abilities[0]
+
+    def advantage(self, hero, enemy):
+        """hero's advantage over enemy"""
+        advantage = self.advantage_matrix.advantage(hero, enemy)
+        if advantage is None:
+            raise Advantage.DoesNotExist(
+                "No advantage for {} against {}".format(hero, enemy))
+        return advantage
+
+    def counters(self, enemy, role=None):
+        """The heroes with a positive advantage over enemy, best first, as (hero, advantage)"""
+        return self.advantage_matrix.counters(enemy, role)
+
+    def advantages_over(self, hero, role=None):
+        """The heroes hero has a positive advantage over, biggest first, as (enemy, advantage)"""
+        return self.advantage_matrix.advantages_over(hero, role)
+
+    def hard_and_soft_counters(self, hero, role, direction):
+        """The hard and soft counters of hero (or the heroes hero counters), for the role.
+
+        These are precomputed by update_heroes, if they haven't been (e.g. the advantages were
+        added some other way) they're calculated now.
+        """
+        key = (hero.pk, role.value if role else None, direction)
+        if key not in self._counters:
+            self._counters[key] = HeroCounters.calculate(
+                self.advantage_matrix, hero, role, direction)
+        return self._counters[key]
+
+
+KnowledgeBase.invalidate_on_change(Hero, Ability, Advantage, HeroCounters)
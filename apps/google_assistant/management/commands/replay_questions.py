@@ -0,0 +1,35 @@
+import itertools
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.google_assistant.replay import Replayer, read_logs
+
+
+class Command(BaseCommand):
+    help = (
+        'Answers the questions in response logs again, and reports how quickly they were answered. '
+        'The questions are answered from the database in the settings (see --settings).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'log_files', nargs='+',
+            help='good-response and failed-response logs, in the text or JSON lines format')
+        parser.add_argument(
+            '--limit', type=int, default=None, help='Only replay the first LIMIT questions')
+
+    def handle(self, *args, **options):
+        try:
+            files = [open(name, encoding='utf8') for name in options['log_files']]
+        except OSError as exc:
+            raise CommandError('ERROR: {}'.format(exc))
+        try:
+            questions = itertools.islice(read_logs(files), options['limit'])
+            stats = Replayer().replay(questions)
+        finally:
+            for f in files:
+                f.close()
+
+        if not stats.seconds:
+            raise CommandError('No questions found in the logs')
+        for line in stats.report():
+            self.stdout.write(line)
@@ -3,8 +3,8 @@ import string
 from django.utils.functional import cached_property
 
 from apps.hero_advantages.roles import HeroRole
-from apps.hero_advantages.models import Hero
-from apps.hero_abilities.models import Ability
+
+from .knowledge_base import KnowledgeBase, HERO, ABILITY
 
 
 class QuestionParser(object):
@@ -15,71 +15,55 @@ class QuestionParser(object):
             #  question_text is None
             self.text = ""
         self.user_id = user_id
+        # Set to the classes which answered the question, once it's answered
+        self.context_class = None
+        self.response_class = None
 
     def __str__(self):
         return "User: {}. Question: '{}'. Abilities: {}, heroes: {}, role: {}.".format(
             self.user_id, self.text, self.abilities, self.heroes, self.role)
 
+    def log_data(self):
+        """What was found in the question, as a dict which can be serialised to JSON"""
+        return {
+            'user_id': self.user_id,
+            'question': self.text,
+            'abilities': [a.name for a in self.abilities],
+            'heroes': [h.name for h in self.heroes],
+            'role': self.role.name if self.role else None,
+            'context_class': self.context_class.__name__ if self.context_class else None,
+            'response_class': self.response_class.__name__ if self.response_class else None,
+        }
+
+    @cached_property
+    def knowledge_base(self):
+        return KnowledgeBase.current()
+
+    @cached_property
+    def _entity_matches(self):
+        return self.knowledge_base.entity_matcher.find(self.text)
+
     @cached_property
     def abilities(self):
-        """Returns a list of all abilities found in the question.
+        """Returns a list of all abilities found in the question, in the order they are in the text.
 
-        Does not include the names of abilities found whose name is a substring of another ability
-        whose name is in the question.
-        E.g. if 'Chemical Rage' is in the question then this will not return the ability 'Rage'.
+        Where the names of abilities found overlap in the text only the longest is kept, so
+        'Chemical Rage' doesn't also give 'Rage', but 'rage or chemical rage' gives both. Only
+        other ability names are compared, a hero's name can overlap an ability's.
         """
-        abilities_found = [
-            a for a in Ability.objects.all()
-            if a.name and a.name.lower() in self.text
-        ]
-        result = []
-        for ability in abilities_found:
-            other_ability_names = [a.name for a in abilities_found if a != ability]
-            if not any((ability.name in n) for n in other_ability_names):
-                result.append(ability)
-        return result
+        return [m.entity for m in self._entity_matches.get(ABILITY, [])]
 
     @cached_property
     def heroes(self):
-        # Find all the heroes referred to in the text, if we are using a two letter abbreviation
-        # of a heroes name then it must be a whole word
-        result = {}
-        for hero in Hero.objects.all():
-            for alias in (a.lower() for a in hero.aliases):
-                if (
-                        (len(alias) > 2 and alias in self.text)
-                        or (len(alias) == 2 and alias in self.words)
-                ):
-                    result[alias] = hero
-
-        if len(result) <= 1:
-            return list(result.values())
-
-        # Remove heroes which share common substrings by removing the those that we have already
-        # found, starting with the longer aliases.
-        no_overlaps_text = self.text
-        for alias in sorted(result, key=len, reverse=True):
-            if alias in no_overlaps_text:
-                no_overlaps_text = no_overlaps_text.replace(alias, '')
-            else:
-                del result[alias]
-
-        if len(result) <= 1:
-            return list(result.values())
-
-        # Order the heroes in the order they are in the text
-        positions = {}
-        for alias, hero in result.items():
-            if len(alias) > 2:
-                position = self.text.find(alias)
-            else:
-                # this excludes punctution, but it's close enough
-                word_number = self.words.index(alias)
-                position = sum((1 + len(word)) for word in self.words[:word_number])
-            if position != -1:
-                if not positions.get(hero) or position < positions[hero]:
-                    positions[hero] = position
-        return [k for k in sorted(positions, key=positions.get)]
+        """Returns a list of all heroes found in the question, in the order they are in the text.
+
+        If we are using a two letter abbreviation of a hero's name then it must be a whole word.
+        """
+        return [m.entity for m in self._entity_matches.get(HERO, [])]
+
+    def hero_position(self, hero):
+        """The position in the text of the first mention of hero"""
+        return next(m.start for m in self._entity_matches[HERO] if m.entity == hero)
 
     @cached_property
     def role(self):
@@ -113,7 +97,7 @@ class QuestionParser(object):
         if len(self.heroes) == 1:
             hotkeys = [
                 a.hotkey
-                for a in Ability.objects.filter(hero=self.heroes[0])
+                for a in self.knowledge_base.hero_abilities(self.heroes[0])
                 if a.hotkey
             ]
             hotkeys_in_question = [
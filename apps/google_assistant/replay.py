@@ -0,0 +1,211 @@
+import re
+import ast
+import json
+import time
+import logging
+from collections import namedtuple, defaultdict
+
+import numpy as np
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from apps.metadata.usage import usage_counters
+
+from .exceptions import DoNotUnderstandQuestion, Goodbye
+from .knowledge_base import KnowledgeBase
+from .question_parser import QuestionParser
+from .response import ResponseGenerator
+
+
+logger = logging.getLogger(__name__)
+
+
+# The conversation token wasn't logged, it's worked out from the user's previous question
+UNKNOWN = object()
+
+LoggedQuestion = namedtuple(
+    'LoggedQuestion',
+    ('time', 'user_id', 'text', 'conversation_token', 'follow_up_token', 'answered'))
+
+ReplayQuestion = namedtuple('ReplayQuestion', ('user_id', 'text', 'conversation_token'))
+
+
+# The text format of good-response.log and failed-response.log, e.g.
+# [2018-02-03 17:48:00,123] User: 123. Question: 'who counters axe'. Abilities: [], heroes: [<Hero:
+# Axe>], role: None. Context: {'context-class': 'HeroAdvantageContext'}. Response: <speak>...
+TEXT_LINE = re.compile(
+    r"^\[(?P<time>[^\]]*)\] User: (?P<user_id>.*?)\. Question: '(?P<text>.*?)'\. Abilities: ")
+TEXT_CONTEXT = re.compile(r"\. Context: (?P<context>None|\{.*\})\. Response: ")
+
+
+def parse_log_line(line):
+    """The LoggedQuestion from a line of a response log, None if the line isn't one"""
+    line = line.strip()
+    if line.startswith('{'):
+        return _parse_json_line(line)
+    return _parse_text_line(line)
+
+
+def _parse_json_line(line):
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return None
+    if 'question' not in data:
+        return None
+    return LoggedQuestion(
+        time=data.get('time', ''),
+        user_id=data.get('user_id'),
+        text=data['question'],
+        conversation_token=data.get('conversation_token', UNKNOWN),
+        follow_up_token=data.get('context'),
+        answered='response' in data,
+    )
+
+
+def _parse_text_line(line):
+    match = TEXT_LINE.match(line)
+    if not match:
+        return None
+    context = TEXT_CONTEXT.search(line, match.end())
+    user_id = match.group('user_id')
+    return LoggedQuestion(
+        time=match.group('time'),
+        user_id=None if user_id == 'None' else user_id,
+        text=match.group('text'),
+        conversation_token=UNKNOWN,
+        follow_up_token=ast.literal_eval(context.group('context')) if context else None,
+        answered=context is not None,
+    )
+
+
+def read_logs(files):
+    """The questions in the log files, in the order they were asked, as ReplayQuestions.
+
+    The good and failed response logs can be mixed. Where the conversation token wasn't logged,
+    the token given to the user with the answer to their previous question is used.
+    """
+    logged = []
+    for f in files:
+        for line in f:
+            question = parse_log_line(line)
+            if question is None:
+                if line.strip():
+                    logger.warning("Skipping unrecognised log line: %s", line.strip())
+                continue
+            logged.append(question)
+    logged.sort(key=lambda q: q.time)
+
+    follow_up_tokens = {}
+    for question in logged:
+        token = question.conversation_token
+        if token is UNKNOWN:
+            token = follow_up_tokens.get(question.user_id)
+        # When a question isn't understood the user keeps the token they had
+        if question.answered:
+            follow_up_tokens[question.user_id] = question.follow_up_token
+        yield ReplayQuestion(question.user_id, question.text, token)
+
+
+class ReplayStats(object):
+    """The latency and number of queries of each replayed question, grouped by what answered it"""
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self):
+        self.seconds = []
+        self.queries = []
+        self.outcomes = defaultdict(int)
+        # {(group, name): [indices into seconds and queries]}
+        self.groups = defaultdict(list)
+        self.total_seconds = 0
+
+    def add(self, question, outcome, seconds, queries):
+        index = len(self.seconds)
+        self.seconds.append(seconds)
+        self.queries.append(queries)
+        self.outcomes[outcome] += 1
+        self.groups['Context', self._name(question.context_class)].append(index)
+        self.groups['Response', self._name(question.response_class)].append(index)
+
+    @staticmethod
+    def _name(klass):
+        return klass.__name__ if klass else '(none)'
+
+    def summary(self, indices=None):
+        """A dict of the count, latency percentiles (in ms) and mean queries of the questions"""
+        if indices is None:
+            indices = range(len(self.seconds))
+        seconds = np.array([self.seconds[i] for i in indices])
+        queries = np.array([self.queries[i] for i in indices])
+        summary = {'count': len(seconds), 'queries': float(np.mean(queries)) if len(queries) else 0}
+        for percentile in self.PERCENTILES:
+            summary['p{}'.format(percentile)] = (
+                float(np.percentile(seconds, percentile)) * 1000 if len(seconds) else 0)
+        return summary
+
+    def report(self):
+        """The results, as a list of lines of text"""
+        total = len(self.seconds)
+        lines = [
+            "Replayed {} questions in {:.2f}s, {:.1f} questions/s".format(
+                total, self.total_seconds, total / self.total_seconds if self.total_seconds else 0),
+            ", ".join("{}: {}".format(k, v) for k, v in sorted(self.outcomes.items())),
+            "",
+        ]
+        header = "{:<32} {:>6} {:>9} {:>9} {:>9} {:>8}".format(
+            '', 'count', 'p50 ms', 'p95 ms', 'p99 ms', 'queries')
+        row = "{:<32} {count:>6} {p50:>9.2f} {p95:>9.2f} {p99:>9.2f} {queries:>8.2f}"
+        lines += [header, row.format('All', **self.summary())]
+        for group in ('Context', 'Response'):
+            lines += ["", "By {}".format(group)]
+            names = sorted(name for g, name in self.groups if g == group)
+            lines += [
+                row.format(name, **self.summary(self.groups[group, name])) for name in names]
+        return lines
+
+
+class Replayer(object):
+    """Answers logged questions again, measuring how long each takes and the queries it makes.
+
+    Nothing is saved: the usage counters are paused(), so the counts are never flushed and are
+    thrown away at the end, and the response loggers are disabled.
+    """
+    SILENCED_LOGGERS = ('good_response', 'failed_response', 'feedback')
+
+    def __init__(self):
+        self.stats = ReplayStats()
+
+    def replay(self, questions):
+        loggers = [logging.getLogger(name) for name in self.SILENCED_LOGGERS]
+        disabled = [l.disabled for l in loggers]
+        for l in loggers:
+            l.disabled = True
+        try:
+            with usage_counters.paused():
+                # Don't count loading the knowledge base against the first question
+                KnowledgeBase.current()
+                start = time.perf_counter()
+                for question in questions:
+                    self._replay_question(question)
+                self.stats.total_seconds += time.perf_counter() - start
+        finally:
+            for l, was_disabled in zip(loggers, disabled):
+                l.disabled = was_disabled
+        return self.stats
+
+    def _replay_question(self, question):
+        parser = QuestionParser(question.text, question.user_id)
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            try:
+                ResponseGenerator.respond_to_question(parser, question.conversation_token)
+                outcome = 'answered'
+            except DoNotUnderstandQuestion:
+                outcome = 'not understood'
+            except Goodbye:
+                outcome = 'goodbye'
+            except Exception:
+                logger.exception("Error replaying %s", question)
+                outcome = 'error'
+            seconds = time.perf_counter() - start
+        self.stats.add(parser, outcome, seconds, len(queries))
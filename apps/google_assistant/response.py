@@ -1,10 +1,10 @@
 import logging
-from enum import IntEnum, unique
 
-from apps.hero_advantages.models import Hero
 from apps.hero_abilities.models import Ability
+from apps.hero_advantages.models import CounterDirection
 
 from .exceptions import DoNotUnderstandQuestion, Goodbye
+from .knowledge_base import KnowledgeBase
 from .question_parser import QuestionParser
 from .response_text import (
     AbilityDescriptionResponse, AbilityListResponse, AbilityUltimateResponse,
@@ -27,8 +27,11 @@ class InnapropriateContextError(BaseException):
 class ResponseGenerator(object):
     @classmethod
     def respond(cls, question_text, conversation_token=None, user_id=None):
-        question = QuestionParser(question_text, user_id)
+        return cls.respond_to_question(QuestionParser(question_text, user_id), conversation_token)
 
+    @classmethod
+    def respond_to_question(cls, question, conversation_token=None):
+        """Like respond, but takes a QuestionParser, so the caller can use what was parsed"""
         context = Context.deserialise(conversation_token)
         try:
             if not context:
@@ -36,7 +39,8 @@ class ResponseGenerator(object):
 
             response, follow_up_context = context.generate_response(question)
         except DoNotUnderstandQuestion:
-            failed_response_logger.warning("%s", question)
+            failed_response_logger.warning("%s", question, extra={
+                'data': dict(question.log_data(), conversation_token=conversation_token)})
             raise
 
         new_converstaion_token = None
@@ -113,16 +117,15 @@ class Context(object):
                 return HeroAdvantageContext()
             if question.contains_any_string(cls.ULTIMATE_WORDS):
                 try:
-                    ability = Ability.objects.get(hero=question.heroes[0], is_ultimate=True)
+                    ability = question.knowledge_base.ultimate(question.heroes[0])
                 except Ability.MultipleObjectsReturned:
                     return MultipleUltimateContext()
                 return SingleAbilityContext(ability=ability)
             if question.contains_any_string(cls.ABILITY_WORDS):
                 return AbilityListContext()
             if question.ability_hotkey:
-                ability = Ability.objects.get(
-                    hero=question.heroes[0],
-                    hotkey=question.ability_hotkey)
+                ability = question.knowledge_base.ability_with_hotkey(
+                    question.heroes[0], question.ability_hotkey)
                 return SingleAbilityContext(ability=ability)
 
         if len(question.heroes) == 2:
@@ -172,6 +175,7 @@ class Context(object):
                 return new_context.generate_response(question)
 
         self.useage_count += 1
+        question.context_class = type(self)
         if not response[-1:] in ('.', '?') and not response[-2:] == "?'":
             response += '.'
 
@@ -207,14 +211,14 @@ class IntroductionContext(ContextWithBlankFollowUpQuestions):
     def _generate_response_text(self, question):
         if self.useage_count > 0:
             raise InnapropriateContextError
-        return IntroductionResponse.respond(user_id=question.user_id)
+        return IntroductionResponse.respond(question=question)
 
 
 class DescriptionContext(ContextWithBlankFollowUpQuestions):
     def _generate_response_text(self, question):
         if self.useage_count > 0:
             raise InnapropriateContextError
-        return DescriptionResponse.respond(user_id=question.user_id)
+        return DescriptionResponse.respond(question=question)
 
 
 class FreshContext(ContextWithBlankFollowUpQuestions):
@@ -224,7 +228,7 @@ class FreshContext(ContextWithBlankFollowUpQuestions):
             if question.no:
                 raise Goodbye
             raise InnapropriateContextError
-        return SampleQuestionResponse.respond(user_id=question.user_id)
+        return SampleQuestionResponse.respond(question=question)
 
 
 class SingleAbilityContext(Context):
@@ -251,7 +255,7 @@ class SingleAbilityContext(Context):
 
     def _deserialise(self, data):
         super()._deserialise(data)
-        self.ability = Ability.objects.get(name=data['ability'])
+        self.ability = KnowledgeBase.current().ability(data['ability'])
 
     def _generate_response_text(self, question):
         if self.useage_count == 0:
@@ -265,30 +269,30 @@ class SingleAbilityContext(Context):
                 raise InnapropriateContextError
 
         if question.contains_any_string(self.COOLDOWN_WORDS):
-            return AbilityCooldownResponse.respond(self.ability, user_id=question.user_id)
+            return AbilityCooldownResponse.respond(self.ability, question=question)
 
         if question.contains_any_string(self.SPELL_IMMUNITY_WORDS):
-            return AbilitySpellImmunityResponse.respond(self.ability, user_id=question.user_id)
+            return AbilitySpellImmunityResponse.respond(self.ability, question=question)
 
         if question.contains_any_string(self.DAMAGE_TYPE_WORDS):
-            return AbilityDamageTypeResponse.respond(self.ability, user_id=question.user_id)
+            return AbilityDamageTypeResponse.respond(self.ability, question=question)
 
         if self.useage_count == 0:
             if question.contains_any_string(self.ULTIMATE_WORDS):
-                return AbilityUltimateResponse.respond(self.ability, user_id=question.user_id)
+                return AbilityUltimateResponse.respond(self.ability, question=question)
             if question.ability_hotkey:
-                return AbilityHotkeyResponse.respond(self.ability, user_id=question.user_id)
-            return AbilityDescriptionResponse.respond(self.ability, user_id=question.user_id)
+                return AbilityHotkeyResponse.respond(self.ability, question=question)
+            return AbilityDescriptionResponse.respond(self.ability, question=question)
 
         if question.contains_any_word(('what', )):
-            return AbilityDescriptionResponse.respond(self.ability, user_id=question.user_id)
+            return AbilityDescriptionResponse.respond(self.ability, question=question)
 
         raise InnapropriateContextError
 
 
 class MultipleUltimateContext(Context):
     def _generate_response_text(self, question):
-        return MultipleUltimateResponse.respond(hero=question.heroes[0], user_id=question.user_id)
+        return MultipleUltimateResponse.respond(hero=question.heroes[0], question=question)
 
 
 class AbilityListContext(Context):
@@ -303,7 +307,7 @@ class AbilityListContext(Context):
             raise InnapropriateContextError
         if question.contains_any_string(self.COUNTER_WORDS):
             raise InnapropriateContextError
-        return AbilityListResponse.respond(question.heroes[0], user_id=question.user_id)
+        return AbilityListResponse.respond(question.heroes[0], question=question)
 
 
 class HeroAdvantageContext(Context):
@@ -311,10 +315,7 @@ class HeroAdvantageContext(Context):
     _first_follow_up_question = "Any specific role or hero you'd like to know about?"
     _second_follow_up_question = "Any others?"
 
-    @unique
-    class Direction(IntEnum):
-        WHO_COUNTERS_HERO = 1
-        WHO_DOES_HERO_COUNTER = 2
+    Direction = CounterDirection
 
     def __init__(self, hero=None, direction=None):
         super().__init__()
@@ -329,7 +330,7 @@ class HeroAdvantageContext(Context):
 
     def _deserialise(self, data):
         super()._deserialise(data)
-        self.hero = Hero.objects.get(name=data['hero'])
+        self.hero = KnowledgeBase.current().hero(data['hero'])
         self.direction = data['direction']
 
     def _generate_response_text(self, question):
@@ -355,14 +356,14 @@ class HeroAdvantageContext(Context):
         if len(all_heroes) == 2:
             other_hero = all_heroes.difference(set([self.hero])).pop()
             return TwoHeroAdvantageResponse.respond(
-                hero=other_hero, enemy=self.hero, user_id=question.user_id)
+                hero=other_hero, enemy=self.hero, question=question)
         if len(all_heroes) == 1:
             if self.direction == self.Direction.WHO_COUNTERS_HERO:
                 return SingleHeroCountersResponse.respond(
-                    all_heroes.pop(), question.role, user_id=question.user_id)
+                    all_heroes.pop(), question.role, question=question)
             elif self.direction == self.Direction.WHO_DOES_HERO_COUNTER:
                 return SingleHeroAdvantagesResponse.respond(
-                    all_heroes.pop(), question.role, user_id=question.user_id)
+                    all_heroes.pop(), question.role, question=question)
             else:
                 raise Exception("No direction specified")
         raise InnapropriateContextError
@@ -380,8 +381,7 @@ class HeroAdvantageContext(Context):
 
         counter_position = question.position_of_first_string(cls.COUNTER_WORDS)
         bad_against = question.text[:counter_position].endswith('bad ')
-        hero_position = question.position_of_first_string(
-            (a.lower() for a in question.heroes[0].aliases))
+        hero_position = question.hero_position(question.heroes[0])
 
         if counter_position <= hero_position:
             if not bad_against:
@@ -3,9 +3,12 @@ import random
 import logging
 
 from apps.hero_advantages.roles import HeroRole
+from apps.hero_advantages.models import CounterDirection
+from apps.hero_advantages.advantage_matrix import AdvantageMatrix
 from apps.metadata.models import ResponderUse
-from apps.hero_advantages.models import Hero, Advantage
-from apps.hero_abilities.models import Ability, SpellImmunity, DamageType
+from apps.hero_abilities.models import SpellImmunity, DamageType
+
+from .knowledge_base import KnowledgeBase
 
 
 logger = logging.getLogger(__name__)
@@ -20,9 +23,12 @@ class Response(object):
         raise NotImplemented
 
     @classmethod
-    def respond(cls, *args, **kwargs):
-        ResponderUse.log_use(cls.__name__, kwargs['user_id'])
-        del kwargs['user_id']
+    def respond(cls, *args, user_id=None, question=None, **kwargs):
+        """The response text, pass either the question being answered or the user's id"""
+        if question is not None:
+            user_id = question.user_id
+            question.response_class = cls
+        ResponderUse.log_use(cls.__name__, user_id)
         return cls._respond(*args, **kwargs)
 
     @staticmethod
@@ -150,7 +156,7 @@ class AbilityDescriptionResponse(AbilityResponse):
 class AbilityListResponse(AbilityResponse):
     @classmethod
     def _respond(cls, hero):
-        abilities = Ability.standard_objects.filter(hero=hero)
+        abilities = KnowledgeBase.current().hero_abilities(hero, standard_only=True)
         names = [a.name for a in cls.order_abilities(abilities)]
         return "{}'s abilities are {}".format(
             hero.name,
@@ -172,7 +178,7 @@ class AbilityUltimateResponse(AbilityResponse):
 class MultipleUltimateResponse(AbilityResponse):
     @classmethod
     def _respond(cls, hero):
-        abilities = Ability.objects.filter(hero=hero, is_ultimate=True)
+        abilities = KnowledgeBase.current().ultimates(hero)
         return "{} has multiple ultimates: {}".format(
             hero.name,
             cls.comma_separate_with_final_and([a.name for a in abilities]),
@@ -243,7 +249,7 @@ class AbilitySpellImmunityResponse(AbilityResponse):
 
 
 class AdvantageResponse(Response):
-    STRONG_ADVANTAGE = 2
+    STRONG_ADVANTAGE = AdvantageMatrix.STRONG_ADVANTAGE
 
     @staticmethod
     def _role_to_string(role):
@@ -257,25 +263,13 @@ class AdvantageResponse(Response):
         }
         return role_map[role]
 
-    @staticmethod
-    def _heroes_with_role(role):
-        role_map = {
-            HeroRole.CARRY: Hero.objects.filter(is_carry=True),
-            HeroRole.MIDDLE: Hero.objects.filter(is_mid=True),
-            HeroRole.SUPPORT: Hero.objects.filter(is_support=True),
-            HeroRole.OFF_LANE: Hero.objects.filter(is_off_lane=True),
-            HeroRole.JUNGLER: Hero.objects.filter(is_jungler=True),
-            HeroRole.ROAMING: Hero.objects.filter(is_roaming=True),
-        }
-        return role_map[role]
-
 
 class SingleHeroCountersResponse(AdvantageResponse):
     """Gives the list of heroes a hero is weak against"""
 
     @classmethod
     def _counters_hero_list(cls, heroes):
-        names = [h.hero.name for h in heroes]
+        names = [h.name for h in heroes]
         result = cls.comma_separate_with_final_and(names)
         if len(names) == 1:
             result += ' is'
@@ -285,13 +279,8 @@ class SingleHeroCountersResponse(AdvantageResponse):
 
     @classmethod
     def _respond(cls, enemy, role):
-        counters = Advantage.objects.filter(
-            enemy=enemy, advantage__gte=0).order_by('-advantage')
-        if role:
-            counters = counters.filter(hero__in=cls._heroes_with_role(role))
-
-        hard_counters = counters.filter(advantage__gte=cls.STRONG_ADVANTAGE)
-        soft_counters = [c for c in counters[:8] if c not in hard_counters]
+        hard_counters, soft_counters = KnowledgeBase.current().hard_and_soft_counters(
+            enemy, role, CounterDirection.WHO_COUNTERS_HERO)
         response = None
         if hard_counters:
             response = '{} very strong against {}'.format(
@@ -323,18 +312,13 @@ class SingleHeroAdvantagesResponse(AdvantageResponse):
 
     @classmethod
     def _advantage_hero_list(cls, heroes):
-        names = [h.enemy.name for h in heroes]
+        names = [h.name for h in heroes]
         return cls.comma_separate_with_final_and(names)
 
     @classmethod
     def _respond(cls, hero, role):
-        counters = Advantage.objects.filter(
-            hero=hero, advantage__gte=0).order_by('-advantage')
-        if role:
-            counters = counters.filter(enemy__in=cls._heroes_with_role(role))
-
-        hard_counters = counters.filter(advantage__gte=cls.STRONG_ADVANTAGE)
-        soft_counters = [c for c in counters[:8] if c not in hard_counters]
+        hard_counters, soft_counters = KnowledgeBase.current().hard_and_soft_counters(
+            hero, role, CounterDirection.WHO_DOES_HERO_COUNTER)
         response = None
         if hard_counters:
             response = '{} is very strong against {}'.format(
@@ -365,7 +349,7 @@ class SingleHeroAdvantagesResponse(AdvantageResponse):
 class TwoHeroAdvantageResponse(AdvantageResponse):
     @classmethod
     def _respond(cls, hero, enemy):
-        advantage = Advantage.objects.get(hero=hero, enemy=enemy).advantage
+        advantage = KnowledgeBase.current().advantage(hero, enemy)
         return "{hero} is {description} against {enemy}. {hero}'s advantage is {advantage}".format(
             hero=hero,
             description=cls.get_advantage_description_text(advantage),
@@ -0,0 +1,55 @@
+import unittest
+
+from .entity_matcher import EntityMatcher, EntityMatch
+
+
+class TestEntityMatcher(unittest.TestCase):
+    def setUp(self):
+        self.matcher = EntityMatcher()
+        self.matcher.add('storm spirit', 'hero', 'STORM')
+        self.matcher.add('storm', 'hero', 'STORM')
+        self.matcher.add('lich', 'hero', 'LICH')
+        self.matcher.add('lichen', 'hero', 'LYCAN')
+        self.matcher.add('am', 'hero', 'ANTI-MAGE', whole_word=True)
+        self.matcher.add('rage', 'ability', 'RAGE')
+        self.matcher.add('chemical rage', 'ability', 'CHEMICAL RAGE')
+        self.matcher.add('hex', 'ability', 'LION HEX')
+        self.matcher.add('hex', 'ability', 'SHAMAN HEX')
+
+    def test_finds_matches_with_offsets(self):
+        result = self.matcher.find('is lich good against storm spirit?')
+        assert result['hero'] == [
+            EntityMatch(3, 7, 'LICH'),
+            EntityMatch(21, 33, 'STORM'),
+        ]
+
+    def test_longest_match_wins(self):
+        assert self.matcher.find('lichen')['hero'] == [EntityMatch(0, 6, 'LYCAN')]
+        assert self.matcher.find('chemical rage')['ability'] == [
+            EntityMatch(0, 13, 'CHEMICAL RAGE')]
+
+    def test_non_overlapping_shorter_match_is_kept(self):
+        result = self.matcher.find('rage or chemical rage')
+        assert [m.entity for m in result['ability']] == ['RAGE', 'CHEMICAL RAGE']
+
+    def test_entities_only_included_once(self):
+        result = self.matcher.find('storm, storm spirit')
+        assert result['hero'] == [EntityMatch(0, 5, 'STORM')]
+
+    def test_whole_word(self):
+        assert self.matcher.find('am?')['hero'] == [EntityMatch(0, 2, 'ANTI-MAGE')]
+        assert 'hero' not in self.matcher.find('pam')
+        assert 'hero' not in self.matcher.find('amazing')
+
+    def test_kinds_do_not_overlap_each_other(self):
+        self.matcher.add('storm spirit', 'ability', 'NOT REALLY AN ABILITY')
+        result = self.matcher.find('storm spirit')
+        assert [m.entity for m in result['hero']] == ['STORM']
+        assert [m.entity for m in result['ability']] == ['NOT REALLY AN ABILITY']
+
+    def test_same_name_multiple_entities(self):
+        result = self.matcher.find('hex')
+        assert [m.entity for m in result['ability']] == ['LION HEX', 'SHAMAN HEX']
+
+    def test_nothing_found(self):
+        assert self.matcher.find('what is a pizza?') == {}
@@ -0,0 +1,111 @@
+import pytest
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.hero_advantages.roles import HeroRole
+from apps.hero_advantages.models import Hero, Advantage, HeroCounters, CounterDirection
+from apps.hero_advantages.factories import HeroFactory, AdvantageFactory
+from apps.hero_abilities.models import Ability
+from apps.hero_abilities.factories import AbilityFactory
+from apps.metadata.models import AdvantagesUpdate
+
+from .knowledge_base import KnowledgeBase
+from .response import ResponseGenerator
+
+
+@pytest.mark.django_db
+class TestKnowledgeBase(TestCase):
+    def setUp(self):
+        self.disruptor = HeroFactory(name='Disruptor', is_support=True)
+        self.sniper = HeroFactory(name='Sniper', is_support=False)
+        self.axe = HeroFactory(name='Axe', is_support=True)
+        AdvantageFactory(hero=self.disruptor, enemy=self.sniper, advantage=1.5)
+        AdvantageFactory(hero=self.axe, enemy=self.sniper, advantage=2.5)
+        AdvantageFactory(hero=self.sniper, enemy=self.axe, advantage=-0.5)
+        self.glimpse = AbilityFactory(
+            hero=self.disruptor, name='Glimpse', hotkey='W', is_ultimate=False)
+        self.static_storm = AbilityFactory(
+            hero=self.disruptor, name='Static Storm', hotkey='R', is_ultimate=True)
+
+    def test_lookups(self):
+        knowledge_base = KnowledgeBase.load()
+        assert knowledge_base.hero('Sniper') == self.sniper
+        assert knowledge_base.ability('Glimpse') == self.glimpse
+        assert knowledge_base.ultimate(self.disruptor) == self.static_storm
+        assert knowledge_base.ability_with_hotkey(self.disruptor, 'W') == self.glimpse
+        assert knowledge_base.advantage(self.axe, self.sniper) == 2.5
+
+    def test_loads_from_the_active_generation(self):
+        HeroCounters.update_all()
+        AdvantagesUpdate.start_new_update()
+        AdvantagesUpdate.finish_current_update(models=[Hero, Ability, Advantage, HeroCounters])
+        Ability.objects.all().delete()
+        Advantage.objects.all().delete()
+        knowledge_base = KnowledgeBase.load()
+        glimpse = knowledge_base.ability('Glimpse')
+        assert glimpse == self.glimpse
+        assert (glimpse.hero.name, glimpse.hotkey, glimpse.date_created) == (
+            'Disruptor', 'W', self.glimpse.date_created)
+        assert knowledge_base.advantage(self.axe, self.sniper) == 2.5
+        with self.assertNumQueries(0):
+            hard, soft = knowledge_base.hard_and_soft_counters(
+                self.sniper, None, CounterDirection.WHO_COUNTERS_HERO)
+        assert hard == [self.axe]
+
+    def test_missing_lookups_raise(self):
+        knowledge_base = KnowledgeBase.load()
+        with self.assertRaises(Hero.DoesNotExist):
+            knowledge_base.hero('Pudge')
+        with self.assertRaises(Ability.DoesNotExist):
+            knowledge_base.ultimate(self.sniper)
+        with self.assertRaises(Advantage.DoesNotExist):
+            knowledge_base.advantage(self.disruptor, self.axe)
+
+    def test_counters(self):
+        knowledge_base = KnowledgeBase.load()
+        assert knowledge_base.counters(self.sniper) == [(self.axe, 2.5), (self.disruptor, 1.5)]
+        assert knowledge_base.counters(self.axe) == []
+        assert knowledge_base.advantages_over(self.axe, HeroRole.SUPPORT) == []
+        assert knowledge_base.advantages_over(self.axe) == [(self.sniper, 2.5)]
+
+    def test_hard_and_soft_counters(self):
+        hard, soft = KnowledgeBase.load().hard_and_soft_counters(
+            self.sniper, None, CounterDirection.WHO_COUNTERS_HERO)
+        assert hard == [self.axe]
+        assert soft == [self.disruptor]
+
+    def test_uses_precomputed_counters(self):
+        HeroCounters.update_all()
+        HeroCounters.objects.filter(hero=self.sniper, role=None).update(
+            hard_counters_data='', soft_counters_data=str(self.axe.pk))
+        knowledge_base = KnowledgeBase.load()
+        with self.assertNumQueries(0):
+            hard, soft = knowledge_base.hard_and_soft_counters(
+                self.sniper, None, CounterDirection.WHO_COUNTERS_HERO)
+        assert hard == []
+        assert soft == [self.axe]
+
+    @patch('apps.google_assistant.response_text.ResponderUse')
+    def test_answers_questions_without_the_database(self, ResponderUse):
+        ResponseGenerator.respond("Who counters Sniper?")
+        with self.assertNumQueries(0):
+            response, _ = ResponseGenerator.respond("Who counters Sniper?")
+        assert "Axe" in response
+
+    def test_reloads_when_an_update_finishes(self):
+        first = KnowledgeBase.current()
+        assert KnowledgeBase.current() is first
+
+        Hero.objects.filter(pk=self.axe.pk).update(name='Mogul Khan')
+        AdvantagesUpdate.objects.create(update_finished=timezone.now())
+        KnowledgeBase._last_checked = 0
+        assert KnowledgeBase.current() is not first
+        assert KnowledgeBase.current().hero('Mogul Khan') == self.axe
+
+    def test_reloads_when_saving_a_hero(self):
+        first = KnowledgeBase.current()
+        HeroFactory(name='Pudge')
+        assert KnowledgeBase.current() is not first
+        assert KnowledgeBase.current().hero('Pudge')
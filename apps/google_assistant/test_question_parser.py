@@ -24,6 +24,18 @@ class TestQuestionParser(TestCase):
         parser = QuestionParser("What's the cooldown of Chemical Rage?", user_id=None)
         assert parser.abilities == [chemical_rage]
 
+    def test_log_data(self):
+        parser = QuestionParser("What's the cooldown of Disruptor's Glimpse?", user_id='USERID')
+        assert parser.log_data() == {
+            'user_id': 'USERID',
+            'question': "what's the cooldown of disruptor's glimpse?",
+            'abilities': ['Glimpse'],
+            'heroes': ['Disruptor'],
+            'role': None,
+            'context_class': None,
+            'response_class': None,
+        }
+
     def test_identify_hero(self):
         parser = QuestionParser("What are Disruptor's abilities?", user_id=None)
         assert parser.heroes == [self.disruptor]
@@ -67,3 +79,16 @@ class TestQuestionParser(TestCase):
     def test_yes(self):
         parser = QuestionParser("Yes.", user_id=None)
         assert parser.yes
+
+    def test_identify_hero_and_ability_with_the_same_name(self):
+        HeroFactory(name='Faceless Void', aliases_data='void')
+        void = AbilityFactory(name='Void')
+        parser = QuestionParser("What's the cooldown of void?", user_id=None)
+        assert parser.abilities == [void]
+        assert [h.name for h in parser.heroes] == ['Faceless Void']
+
+    def test_hero_position(self):
+        anti_mage = HeroFactory(name='Anti-Mage', aliases_data='AM')
+        parser = QuestionParser("Is Disruptor good against AM?", user_id=None)
+        assert parser.hero_position(self.disruptor) == 3
+        assert parser.hero_position(anti_mage) == 26
@@ -0,0 +1,126 @@
+import io
+import json
+import pytest
+import tempfile
+import time
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from apps.hero_advantages.factories import HeroFactory, AdvantageFactory
+from apps.hero_abilities.factories import AbilityFactory
+from apps.metadata.models import DailyUse, ResponderUse
+from apps.metadata.usage import usage_counters
+
+from .replay import parse_log_line, read_logs, Replayer, ReplayQuestion, UNKNOWN
+from .response import HeroAdvantageContext
+from .response_text import SingleHeroCountersResponse
+
+
+GOOD_TEXT_LINE = (
+    "[2018-02-03 17:48:00,123] User: USERID. Question: 'what's axe's ultimate'. Abilities: [], "
+    "heroes: [<Hero: Axe>], role: None. Context: {'context-class': 'SingleAbilityContext', "
+    "'useage-count': 1, 'ability': 'Culling Blade'}. Response: <speak>Culling Blade.</speak>\n")
+FAILED_TEXT_LINE = (
+    "[2018-02-03 17:49:00,000] User: USERID. Question: 'blah'. Abilities: [], heroes: [], "
+    "role: None.\n")
+
+
+class TestParseLogs(TestCase):
+    def test_good_text_line(self):
+        question = parse_log_line(GOOD_TEXT_LINE)
+        assert question.user_id == 'USERID'
+        assert question.text == "what's axe's ultimate"
+        assert question.conversation_token is UNKNOWN
+        assert question.follow_up_token['ability'] == 'Culling Blade'
+        assert question.answered
+
+    def test_failed_text_line(self):
+        question = parse_log_line(FAILED_TEXT_LINE)
+        assert question.text == 'blah'
+        assert not question.answered
+
+    def test_json_line(self):
+        question = parse_log_line(json.dumps({
+            'time': '2018-02-03 17:48:00,123',
+            'user_id': 'USERID',
+            'question': 'who counters axe',
+            'conversation_token': {'context-class': 'FreshContext'},
+            'context': None,
+            'response': '<speak>...</speak>',
+        }))
+        assert question.text == 'who counters axe'
+        assert question.conversation_token == {'context-class': 'FreshContext'}
+        assert question.answered
+
+    def test_other_lines(self):
+        assert parse_log_line("[2018-02-03 17:48:00,123] Something else\n") is None
+        assert parse_log_line('{"message": "Something else"}') is None
+
+    def test_conversation_tokens_follow_on(self):
+        follow_up = GOOD_TEXT_LINE.replace('17:48', '17:50').replace('USERID', 'OTHER')
+        questions = list(read_logs([
+            io.StringIO(FAILED_TEXT_LINE + follow_up),
+            io.StringIO(GOOD_TEXT_LINE),
+        ]))
+        assert questions[0] == ReplayQuestion('USERID', "what's axe's ultimate", None)
+        assert questions[1].text == 'blah'
+        assert questions[1].conversation_token['ability'] == 'Culling Blade'
+        # Other users have their own conversations
+        assert questions[2].conversation_token is None
+
+
+@pytest.mark.django_db
+class TestReplayer(TestCase):
+    def setUp(self):
+        usage_counters.clear()
+        axe = HeroFactory(name='Axe')
+        AdvantageFactory(hero=HeroFactory(name='Sniper'), enemy=axe, advantage=1)
+        AbilityFactory(hero=axe, name='Culling Blade', is_ultimate=True)
+
+    def test_replay(self):
+        stats = Replayer().replay([
+            ReplayQuestion('USERID', 'who counters axe', None),
+            ReplayQuestion('USERID', 'blah', None),
+        ])
+        assert stats.outcomes == {'answered': 1, 'not understood': 1}
+        counters = stats.summary(
+            stats.groups['Response', SingleHeroCountersResponse.__name__])
+        assert counters['count'] == 1
+        assert stats.groups['Context', HeroAdvantageContext.__name__] == [0]
+        assert stats.groups['Context', '(none)'] == [1]
+
+    def test_replay_does_not_save_usage(self):
+        Replayer().replay([ReplayQuestion('USERID', 'who counters axe', None)])
+        usage_counters.flush()
+        assert not ResponderUse.objects.exists()
+
+    def test_replay_does_not_flush_usage(self):
+        # Each question is asked well after the flush interval
+        start = time.time()
+        clock = (start + 1000 * i for i in range(1, 100))
+        with patch('apps.metadata.usage.time.time', lambda: next(clock)):
+            Replayer().replay([
+                ReplayQuestion('USERID', 'who counters axe', None),
+                ReplayQuestion('USERID', 'who counters axe', None),
+            ])
+        assert not ResponderUse.objects.exists()
+        assert not DailyUse.objects.exists()
+
+    def test_command(self):
+        out = io.StringIO()
+        path = self._write_log(GOOD_TEXT_LINE + FAILED_TEXT_LINE)
+        call_command('replay_questions', path, stdout=out)
+        output = out.getvalue()
+        assert 'Replayed 2 questions' in output
+        assert 'SingleAbilityContext' in output
+        assert 'AbilityUltimateResponse' in output
+
+    def _write_log(self, text):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = '{}/good-response.log'.format(directory.name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
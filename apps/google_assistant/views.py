@@ -94,11 +94,13 @@ def _respond_to_request(request):
     context = None
     if google_request.conversation_token:
         context = json.loads(google_request.conversation_token)
+    conversation_token = context
 
-    logger.info("Recieved question: {}, context: {}".format(google_request.text, context))
+    logger.info("Recieved question: %s, context: %s", google_request.text, context)
+    question = QuestionParser(google_request.text, user_id=user_id)
     try:
-        response, context = ResponseGenerator.respond(
-            google_request.text, conversation_token=context, user_id=user_id)
+        response, context = ResponseGenerator.respond_to_question(
+            question, conversation_token=context)
     except DoNotUnderstandQuestion:
         if google_request.text.lower().startswith('talk to'):
             return JsonResponse(AppResponse().tell((
@@ -123,10 +125,10 @@ def _respond_to_request(request):
         return JsonResponse(AppResponse().tell('Goodbye'))
 
     good_response_logger.info(
-        "%s Context: %s. Response: %s",
-        QuestionParser(google_request.text, user_id=user_id),
-        context,
-        response)
+        "%s Context: %s. Response: %s", question, context, response,
+        extra={'data': dict(
+            question.log_data(),
+            conversation_token=conversation_token, context=context, response=response)})
     DailyUse.log_use(success=True, user_id=user_id)
 
     if context:
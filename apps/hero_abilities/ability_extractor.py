@@ -0,0 +1,187 @@
+"""Extracts the abilities from a hero's gamepedia page.
+
+This doesn't use Django, or the database, so it can run in a pool of processes. The spell immunity
+and damage types are given as the names of the SpellImmunity and DamageType enums.
+"""
+import re
+import logging
+import traceback
+
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+
+
+logger = logging.getLogger(__name__)
+
+# Bump this when the extraction changes, so the pages are extracted again by the next update
+PARSER_VERSION = 1
+
+# The box on the left of each ability, only these are parsed
+ABILITY_BOX = SoupStrainer(style=re.compile('^flex: 0 1 450px;'))
+
+HEADER_STYLE = 'font-size: 110%'
+DESCRIPTION_STYLE = re.compile('vertical-align: top;.*border-top')
+HEADER_BACKGROUND_COLOUR = re.compile(r'.*background-color: (.*?);.*')
+
+CONTROLLED_UNIT_COLOUR = '#2277AA'
+TALENT_COLOUR = '#BDB76B'
+AGHANIMS_COLOUR = '#5B388F'
+ULTIMATE_COLOUR = '#414141'
+ABILITY_COLOUR = '#B44335'
+
+SPELL_IMMUNITY = {
+    'Does not pierce spell immunity.': 'DOES_NOT_PIERCE',
+    'Partially pierces spell immunity.': 'PARTIALLY_PIERCES',
+    'Pierces spell immunity.': 'PIERCES',
+}
+
+DAMAGE_TYPE = {
+    'Magical': 'MAGICAL',
+    'Physical': 'PHYSICAL',
+    'Pure': 'PURE',
+    # Spectre has this, no one else, probably just a bug on the wiki
+    'HP Removal': 'PURE',
+}
+
+
+class AbilityBox(object):
+    """The tags in an ability box that the ability's details come from, found in one pass"""
+
+    def __init__(self, box):
+        self.header = None
+        self.description = None
+        self.cooldown = None
+        self.hotkey = None
+        self.spell_immunity_images = []
+        self.header_images = []
+        self.damage_header = None
+
+        for tag in box.descendants:
+            if not isinstance(tag, Tag):
+                continue
+            style = tag.get('style')
+            if style:
+                if self.header is None and HEADER_STYLE in style:
+                    self.header = tag
+                if self.description is None and DESCRIPTION_STYLE.search(style):
+                    self.description = tag
+
+            title = tag.get('title')
+            if title:
+                if title == 'Cooldown' and self.cooldown is None:
+                    self.cooldown = tag
+                elif title == 'Hotkey' and self.hotkey is None and self._in_header(tag):
+                    self.hotkey = tag
+                if 'spell immunity' in title:
+                    self.spell_immunity_images.append(tag)
+
+            if tag.name == 'img' and self._in_header(tag):
+                self.header_images.append(tag)
+            elif tag.name == 'b' and self.damage_header is None and tag.text == 'Damage':
+                self.damage_header = tag
+
+    def _in_header(self, tag):
+        return self.header is not None and any(p is self.header for p in tag.parents)
+
+
+def extract_abilities(hero_name, content):
+    """The abilities on the hero's page, as (abilities, errors).
+
+    abilities is a list of dicts of the Ability fields, errors a list of the tracebacks of the
+    abilities which couldn't be extracted.
+    """
+    soup = BeautifulSoup(content, "html.parser", parse_only=ABILITY_BOX)
+    abilities, errors = [], []
+    hotkeys_loaded = []
+    for box in soup.find_all(style=ABILITY_BOX.attrs['style']):
+        try:
+            ability = _extract_ability(hero_name, AbilityBox(box))
+        except Exception:
+            errors.append(traceback.format_exc())
+            continue
+        if ability is None:
+            continue
+        hotkey = ability['hotkey']
+        if hotkey and hotkey in hotkeys_loaded:
+            continue
+        hotkeys_loaded.append(hotkey)
+        abilities.append(ability)
+    return abilities, errors
+
+
+def extract_page_abilities(page):
+    """extract_abilities of a (hero_name, content) page"""
+    hero_name, content = page
+    return extract_abilities(hero_name, content)
+
+
+def _extract_ability(hero_name, box):
+    header = box.header
+    name = next(header.stripped_strings)
+    description = box.description.text.replace('\n', '')
+    if description == '':
+        raise Exception("Could not load description")
+
+    header_background_colour = HEADER_BACKGROUND_COLOUR.match(header['style']).group(1)
+    if header_background_colour in (CONTROLLED_UNIT_COLOUR, TALENT_COLOUR, AGHANIMS_COLOUR):
+        return None
+    is_ultimate = (header_background_colour == ULTIMATE_COLOUR)
+    if not is_ultimate:
+        assert header_background_colour == ABILITY_COLOUR
+
+    damage_type, aghanims_damage_type = _damage_type(box.damage_header)
+
+    if box.cooldown is None:
+        cooldown = ''
+    else:
+        cooldown = box.cooldown.parent.parent.get_text(strip=True).split('(')[0]
+
+    return {
+        'name': name,
+        'description': description,
+        'cooldown': cooldown,
+        'hotkey': _hotkey(hero_name, box.hotkey),
+        'is_ultimate': is_ultimate,
+        'spell_immunity': _spell_immunity(box.header_images),
+        'spell_immunity_detail': _spell_immunity_detail(box.spell_immunity_images),
+        'damage_type': damage_type,
+        'aghanims_damage_type': aghanims_damage_type,
+    }
+
+
+def _spell_immunity(header_images):
+    for img in header_images:
+        if img['alt'] in SPELL_IMMUNITY:
+            return SPELL_IMMUNITY[img['alt']]
+
+
+def _spell_immunity_detail(spell_immunity_images):
+    if len(spell_immunity_images) == 2:
+        return spell_immunity_images[1].parent.parent.get_text(strip=True)
+    elif len(spell_immunity_images) > 2:
+        raise Exception("Unexpected number of spell immunity images")
+    return ''
+
+
+def _damage_type(damage_header):
+    if damage_header is None:
+        return None, None
+
+    damage_info = damage_header.find_next_siblings('a')
+    if len(damage_info) == 0:
+        logger.warning("Unable to load damage type. Ability: {}".format(damage_header))
+        return None, None
+    damage_type = DAMAGE_TYPE[damage_info[0].text]
+    if len(damage_info) == 1 or damage_info[1].get('title') in ("Damage types", "Talent"):
+        return damage_type, None
+
+    assert damage_info[1].get('title') == "Upgradable by Aghanim's Scepter."
+    aghanims_damage_type = DAMAGE_TYPE[damage_info[2].text]
+    return damage_type, aghanims_damage_type
+
+
+def _hotkey(hero_name, hotkey):
+    if hotkey is None:
+        return ''
+    if hero_name == 'Invoker' and len(hotkey.text) > 1:
+        return ''
+    return hotkey.text
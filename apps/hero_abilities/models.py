@@ -1,7 +1,13 @@
+import logging
 from enum import IntEnum, unique
+from functools import partial
+
 from django.db import models
 
-from apps.hero_advantages.models import Hero
+from apps.hero_advantages.models import Hero, PageHash
+
+
+logger = logging.getLogger(__name__)
 
 
 @unique
@@ -45,15 +51,49 @@ class Ability(models.Model):
     objects = models.Manager()
     standard_objects = StandardAbilityManager()
 
+    # The name of loading the abilities in AdvantagesUpdate's progress
+    UPDATE_STAGE = 'abilities'
+
     class Meta:
         unique_together = ('hero', 'name')
 
     def __str__(self):
         return self.name
 
-    @staticmethod
-    def update_from_web(request_handler=None):
+    @classmethod
+    def update_from_web(cls, request_handler=None, page_hashes=None, update=None, names=None,
+                        metrics=None):
+        """Loads the abilities, of only the heroes whose wiki page has changed if page_hashes
+        (a PageHashes) is given, the pages which gave errors are loaded again next time. If update
+        (an AdvantagesUpdate) is given, each hero is checkpointed in it, and the heroes it has
+        already done are skipped. If names is given only those heroes are loaded. The parse time,
+        rows written and abilities which couldn't be extracted are counted in metrics (a
+        StageMetrics) if it's given. Returns the TableDiff of what was written.
+        """
         from .web_scraper import WebScraper  # avoid circual dependency, eugh!
         web_scraper = WebScraper(request_handler)
-        for hero in Hero.objects.all():
-            web_scraper.load_hero_abilities(hero)
+        changed = partial(page_hashes.changed, PageHash.WIKI) if page_hashes else None
+        heroes = Hero.objects.all()
+        if names is not None:
+            heroes = heroes.filter(name__in=names)
+        if update:
+            heroes = heroes.exclude(name__in=update.heroes_done(cls.UPDATE_STAGE))
+
+        def saved(hero):
+            if update:
+                update.hero_done(cls.UPDATE_STAGE, hero.name)
+
+        def failed(hero):
+            if page_hashes:
+                page_hashes.discard(PageHash.WIKI, hero.name)
+
+        diff = web_scraper.load_abilities_for_heroes(heroes, changed, saved, failed)
+        if page_hashes:
+            page_hashes.save(PageHash.WIKI)
+        if metrics:
+            metrics.add_pipeline(web_scraper.pipeline)
+            metrics.add_diff(diff)
+            metrics.add(errors=web_scraper.errors)
+        for line in diff.summary():
+            logger.info(line)
+        return diff
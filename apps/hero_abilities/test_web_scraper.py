@@ -1,5 +1,6 @@
 import py
 import pytest
+from unittest.mock import patch
 
 from django.test import TestCase
 
@@ -8,6 +9,8 @@ from apps.hero_advantages.factories import HeroFactory
 
 from .models import Ability, SpellImmunity, DamageType
 from .web_scraper import WebScraper
+from .ability_extractor import extract_page_abilities
+from .factories import AbilityFactory
 
 mock_request_handler = MockRequestHandler(
     url_map={
@@ -123,3 +126,51 @@ class TestWebScraper(TestCase):
         self.scraper.load_hero_abilities(HeroFactory(name='Keeper of the Light'))
         illuminate = Ability.objects.get(name='Blinding Light')
         self.assertEqual(illuminate.damage_type, DamageType.MAGICAL)
+
+
+@pytest.mark.django_db
+class TestLoadAbilitiesForHeroes(TestCase):
+    def test_same_as_one_at_a_time(self):
+        names = ['Disruptor', 'Invoker', 'Sniper']
+        heroes = [HeroFactory(name=name) for name in names]
+        for hero in heroes:
+            WebScraper(request_handler=mock_request_handler).load_hero_abilities(hero)
+        one_at_a_time = self.abilities()
+        Ability.objects.all().delete()
+
+        # Parsed in a pool of processes, saved in this one
+        WebScraper(request_handler=mock_request_handler, processes=2).load_abilities_for_heroes(
+            heroes)
+        assert self.abilities() == one_at_a_time
+        assert len(one_at_a_time) > 12
+
+    def test_only_writes_changes(self):
+        heroes = [HeroFactory(name=name) for name in ('Disruptor', 'Sniper')]
+        scraper = WebScraper(request_handler=mock_request_handler, processes=1)
+        diff = scraper.load_abilities_for_heroes(heroes)
+        assert diff.inserted == len(self.abilities())
+
+        Ability.objects.filter(name='Glimpse').update(description='Old description')
+        AbilityFactory(hero=heroes[1], name='Removed')
+        diff = scraper.load_abilities_for_heroes(heroes)
+        assert (diff.inserted, diff.changed, diff.deleted) == (0, 1, 1)
+        assert Ability.objects.get(name='Glimpse').description != 'Old description'
+        assert not Ability.objects.filter(name='Removed').exists()
+
+    def test_heroes_with_errors_are_failed(self):
+        heroes = [HeroFactory(name=name) for name in ('Disruptor', 'Invoker', 'Sniper')]
+        # Sniper's page is extracted as normal
+        extracted = {'Disruptor': ([], ['Kinetic Field']), 'Invoker': ([], [])}
+        failed = []
+        with patch('apps.hero_abilities.web_scraper.extract_page_abilities',
+                   lambda page: extracted.get(page[0]) or extract_page_abilities(page)):
+            WebScraper(request_handler=mock_request_handler, processes=1).load_abilities_for_heroes(
+                heroes, failed=failed.append)
+        assert sorted(hero.name for hero in failed) == ['Disruptor', 'Invoker']
+
+    @staticmethod
+    def abilities():
+        return sorted(
+            Ability.objects.values_list(
+                'hero__name', 'name', 'description', 'cooldown', 'hotkey', 'is_ultimate',
+                'spell_immunity', 'spell_immunity_detail', 'damage_type', 'aghanims_damage_type'))
@@ -1,137 +1,129 @@
-import re
 import logging
+from collections import defaultdict
 
+from django.utils import timezone
+
+from apps.utils.upsert import upsert
+from apps.utils.pipeline import Pipeline, SKIP
+from apps.utils.table_diff import TableDiff
 from apps.utils.request_handler import RequestHandler
 
 from .models import Ability, SpellImmunity, DamageType
+from .ability_extractor import extract_abilities, extract_page_abilities
 
 logger = logging.getLogger(__name__)
 
+# The fields of an Ability which come from the web
+ABILITY_FIELDS = (
+    'description', 'cooldown', 'hotkey', 'is_ultimate', 'spell_immunity', 'spell_immunity_detail',
+    'damage_type', 'aghanims_damage_type',
+)
+
 
 class WebScraper(object):
-    def __init__(self, request_handler=None):
+    """Loads the heroes' abilities from their gamepedia pages.
+
+    When loading the abilities of several heroes the pages are parsed in a pool of processes
+    (os.cpu_count() of them, unless processes is given) while more are fetched, the abilities
+    are saved in this one.
+    """
+
+    def __init__(self, request_handler=None, processes=None):
         self.request_handler = request_handler or RequestHandler()
+        self.processes = processes
+        self.pipeline = None
+        # The number of abilities which couldn't be extracted
+        self.errors = 0
 
     def load_hero_abilities(self, hero):
-        soup = self.request_handler.get_soup(
-            'https://dota2.gamepedia.com/{}'.format(
-                hero.name.replace(' ', '_')))
-        abilities = soup.find_all(style=re.compile('^flex: 0 1 450px;.*'))  # the lhs ability box
-        hotkeys_loaded = []
-        for ability in abilities:
-            try:
-                header = ability.find(style=re.compile('.*font-size: 110%.*'))
-                name = next(header.stripped_strings)
-                description = ability.find(
-                    style=re.compile('vertical-align: top;.*border-top.*')
-                ).text.replace('\n', '')
-                if description == '':
-                    raise Exception("Could not load description")
-
-                header_background_colour = re.match(
-                    r'.*background-color: (.*?);.*',
-                    header['style']
-                ).group(1)
-                if header_background_colour == '#2277AA':
-                    continue  # Ability of controlled unit
-                if header_background_colour == '#BDB76B':
-                    continue  # Talent ability
-                if header_background_colour == '#5B388F':
-                    continue  # Ability from aghanims
-                is_ultimate = (header_background_colour == '#414141')
-                if not is_ultimate:
-                    assert header_background_colour == '#B44335'
-
-                spell_immunity = self._get_spell_immunity(header)
-                spell_immunity_detail = self._get_spell_immunity_detail(ability)
-
-                damage_type, aghanims_damage_type = self._get_damage_type(ability)
-
-                hotkey = self._get_hotkey(hero, header)
-                if hotkey and hotkey in hotkeys_loaded:
-                    continue
-                hotkeys_loaded += hotkey
-
-                try:
-                    cooldowns_including_talent = ability.find(
-                        title='Cooldown').parent.parent.get_text(strip=True)
-                except AttributeError:
-                    cooldown = ''
-                else:
-                    cooldown = cooldowns_including_talent.split('(')[0]
-                Ability.objects.update_or_create(
-                    hero=hero,
-                    name=name,
-                    defaults={
-                        'description': description,
-                        'cooldown': cooldown,
-                        'hotkey': hotkey,
-                        'is_ultimate': is_ultimate,
-                        # 'is_from_talent': is_from_talent,
-                        # 'is_from_aghanims': is_from_aghanims,
-                        'spell_immunity': spell_immunity,
-                        'spell_immunity_detail': spell_immunity_detail,
-                        'damage_type': damage_type,
-                        'aghanims_damage_type': aghanims_damage_type,
-                    })
-            except Exception as e:
-                print("{}: {} {}".format(hero, type(e), e))
-                logger.exception('Error loading ability for %s', hero)
-
-    _spell_immunity_map = {
-        'Does not pierce spell immunity.': SpellImmunity.DOES_NOT_PIERCE,
-        'Partially pierces spell immunity.': SpellImmunity.PARTIALLY_PIERCES,
-        'Pierces spell immunity.': SpellImmunity.PIERCES,
-    }
-
-    @classmethod
-    def _get_spell_immunity(cls, header):
-        for img in header.find_all('img'):
-            if img['alt'] in cls._spell_immunity_map.keys():
-                return cls._spell_immunity_map[img['alt']]
+        """Saves the hero's abilities, returns the TableDiff of what was written"""
+        content = self.request_handler.get(self._hero_url(hero))
+        diff = self._diff(hero=hero)
+        abilities, errors = extract_abilities(hero.name, content)
+        self.errors += len(errors)
+        self._save_abilities(hero, diff, abilities, errors)
+        return diff
+
+    def load_abilities_for_heroes(self, heroes, changed=None, saved=None, failed=None):
+        """Like load_hero_abilities for each hero, fetching and parsing the pages concurrently.
+
+        If changed is given, it's called with (url, content, hero name) for each page, and heroes
+        whose page it says hasn't changed are skipped. saved(hero) is called once each hero's
+        abilities are saved, and failed(hero) for the heroes whose page gave no abilities or some
+        which couldn't be extracted.
+        """
+        def fetch(hero):
+            url = self._hero_url(hero)
+            content = self.request_handler.get(url)
+            if changed is not None and not changed(url, content, hero.name):
+                return SKIP
+            return hero.name, content
+
+        diff = self._diff()
+        self.pipeline = Pipeline(
+            'Abilities',
+            fetch=fetch,
+            parse=extract_page_abilities,
+            fetch_workers=self.request_handler.max_workers,
+            parse_workers=self.processes)
+        for hero, (abilities, errors) in self.pipeline.run(heroes):
+            self.errors += len(errors)
+            self._save_abilities(hero, diff, abilities, errors)
+            if failed is not None and (errors or not abilities):
+                failed(hero)
+            if saved is not None:
+                saved(hero)
+        return diff
 
     @staticmethod
-    def _get_spell_immunity_detail(ability):
-        spell_immunity_images = ability.find_all(title=re.compile('.*spell immunity.*'))
-        if len(spell_immunity_images) == 2:
-            return spell_immunity_images[1].parent.parent.get_text(strip=True)
-        elif len(spell_immunity_images) > 2:
-            raise Exception("Unexpected number of spell immunity images")
-        return ''
-
-    _damage_type_map = {
-        'Magical': DamageType.MAGICAL,
-        'Physical': DamageType.PHYSICAL,
-        'Pure': DamageType.PURE,
-        # Spectre has this, no one else, probably just a bug on the wiki
-        'HP Removal': DamageType.PURE,
-    }
-
-    @classmethod
-    def _get_damage_type(cls, ability):
-        try:
-            damage_header = next(b for b in ability.find_all('b') if b.text == 'Damage')
-        except StopIteration:
-            return None, None
-
-        damage_info = damage_header.find_next_siblings('a')
-        if len(damage_info) == 0:
-            logger.warning("Unable to load damage type. Ability: {}".format(damage_header))
-            return None, None
-        damage_type = cls._damage_type_map[damage_info[0].text]
-        if len(damage_info) == 1 or damage_info[1].get('title') in ("Damage types", "Talent"):
-            return damage_type, None
-
-        assert damage_info[1].get('title') == "Upgradable by Aghanim's Scepter."
-        aghanims_damage_type = cls._damage_type_map[damage_info[2].text]
-        return damage_type, aghanims_damage_type
+    def _hero_url(hero):
+        return 'https://dota2.gamepedia.com/{}'.format(hero.name.replace(' ', '_'))
 
     @staticmethod
-    def _get_hotkey(hero, header):
-        try:
-            hotkey = header.find(title='Hotkey').text
-        except AttributeError:
-            return ''
-        if hero.name == 'Invoker' and len(hotkey) > 1:
-            return ''
-        return hotkey
+    def _diff(**filters):
+        """A TableDiff of the abilities in the database, {hero_id: {name: (ABILITY_FIELDS)}}"""
+        current = defaultdict(dict)
+        rows = Ability.objects.filter(**filters).values_list('hero', 'name', *ABILITY_FIELDS)
+        for hero_id, name, *values in rows:
+            current[hero_id][name] = tuple(values)
+        return TableDiff('Abilities', current)
+
+    @staticmethod
+    def _save_abilities(hero, diff, abilities, errors):
+        """Writes the abilities which are new or have changed, deletes those no longer listed"""
+        for error in errors:
+            logger.error('Error loading ability for %s: %s', hero, error)
+
+        new = {}
+        for ability in abilities:
+            ability = dict(
+                ability,
+                spell_immunity=_enum(SpellImmunity, ability['spell_immunity']),
+                damage_type=_enum(DamageType, ability['damage_type']),
+                aghanims_damage_type=_enum(DamageType, ability['aghanims_damage_type']),
+            )
+            new[ability['name']] = tuple(ability[f] for f in ABILITY_FIELDS)
+
+        # An ability which couldn't be extracted is still on the page, so isn't deleted
+        write, delete = diff.diff(hero.id, new, delete_missing=bool(new) and not errors)
+        now = timezone.now()
+        rows = [
+            dict(
+                zip(ABILITY_FIELDS, new[name]),
+                hero=hero.id,
+                name=name,
+                is_from_talent=False,
+                is_from_aghanims=False,
+                date_created=now,
+                date_modified=now,
+            )
+            for name in write
+        ]
+        upsert(
+            Ability, rows, key=('hero', 'name'), replace=ABILITY_FIELDS + ('date_modified',))
+        if delete:
+            Ability.objects.filter(hero=hero, name__in=delete).delete()
+
+
+def _enum(enum, name):
+    return enum[name] if name else None
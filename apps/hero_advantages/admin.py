@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Hero, Advantage
+from .models import Hero, Advantage, HeroCounters, PageHash
 
 
 class HeroAdmin(admin.ModelAdmin):
@@ -11,5 +11,15 @@ class AdvantageAdmin(admin.ModelAdmin):
     list_display = [f.name for f in Advantage._meta.fields]
 
 
+class HeroCountersAdmin(admin.ModelAdmin):
+    list_display = [f.name for f in HeroCounters._meta.fields]
+
+
+class PageHashAdmin(admin.ModelAdmin):
+    list_display = [f.name for f in PageHash._meta.fields]
+
+
 admin.site.register(Hero, HeroAdmin)
 admin.site.register(Advantage, AdvantageAdmin)
+admin.site.register(HeroCounters, HeroCountersAdmin)
+admin.site.register(PageHash, PageHashAdmin)
@@ -0,0 +1,140 @@
+import numpy as np
+
+from apps.metadata.snapshot import Snapshot
+
+from .roles import HeroRole
+
+
+class AdvantageMatrix(Snapshot):
+    """All the advantages between heroes, as a dense hero by hero matrix.
+
+    values[i, j] is the advantage of hero i over hero j (NaN if unknown), so the heroes who counter
+    hero j are column j, and the heroes hero i counters are row i. There are only around 120
+    heroes, so answering questions about counters is just slicing and sorting small arrays.
+
+    Use current() for the matrix of the advantages of the active generation.
+    """
+    STRONG_ADVANTAGE = 2
+    MAX_COUNTERS = 8
+
+    # The advantages are stored as float32, round them when giving them back as floats
+    PRECISION = 4
+
+    def __init__(self, heroes, advantages):
+        """heroes is a list of Heros, advantages an iterable of (hero_id, enemy_id, advantage)"""
+        self.heroes = tuple(heroes)
+        self.index = {h.pk: i for i, h in enumerate(self.heroes)}
+        self.heroes_by_name = {h.name: h for h in self.heroes}
+
+        self.values = np.full((len(self.heroes), len(self.heroes)), np.nan, dtype=np.float32)
+        for hero_id, enemy_id, advantage in advantages:
+            try:
+                self.values[self.index[hero_id], self.index[enemy_id]] = advantage
+            except KeyError:
+                pass  # an advantage for a hero we don't know about, perhaps it's just been added
+
+        self.role_masks = {
+            role: np.array([h.is_role(role) for h in self.heroes], dtype=bool)
+            for role in HeroRole
+        }
+
+    @classmethod
+    def load(cls):
+        from .models import Hero, Advantage  # avoid circular import
+        return cls(
+            cls.instances(Hero), cls.values_list(Advantage, 'hero_id', 'enemy_id', 'advantage'))
+
+    @classmethod
+    def from_tables(cls):
+        """The matrix of the advantages in the tables, rather than the active generation"""
+        from .models import Hero, Advantage  # avoid circular import
+        return cls(
+            Hero.objects.order_by('pk'),
+            Advantage.objects.values_list('hero_id', 'enemy_id', 'advantage'))
+
+    def to_float(self, value):
+        return round(float(value), self.PRECISION)
+
+    def role_mask(self, role):
+        if not role:
+            return np.ones(len(self.heroes), dtype=bool)
+        return self.role_masks[role]
+
+    def advantage(self, hero, enemy):
+        """hero's advantage over enemy, None if it isn't known"""
+        try:
+            value = self.values[self.index[hero.pk], self.index[enemy.pk]]
+        except KeyError:
+            return None
+        if np.isnan(value):
+            return None
+        return self.to_float(value)
+
+    def counters_of(self, enemy):
+        """Every hero's advantage over enemy, as an array in the order of self.heroes"""
+        return self.values[:, self.index[enemy.pk]]
+
+    def advantages_of(self, hero):
+        """hero's advantage over every other hero, as an array in the order of self.heroes"""
+        return self.values[self.index[hero.pk], :]
+
+    def top(self, values, k=None, role=None, minimum=None):
+        """The indices of the (up to) k largest values, largest first.
+
+        NaN values, heroes without the role, and values below minimum are excluded.
+        """
+        candidates = np.flatnonzero(~np.isnan(values) & self.role_mask(role))
+        if minimum is not None:
+            candidates = candidates[values[candidates] >= minimum]
+        if k is not None and k < len(candidates):
+            candidates = np.sort(candidates[np.argpartition(-values[candidates], k - 1)[:k]])
+        return candidates[np.argsort(-values[candidates], kind='stable')]
+
+    def counters(self, enemy, role=None, k=None):
+        """The heroes with a positive advantage over enemy, best first, as (hero, advantage)"""
+        return self._heroes_and_advantages(self.counters_of(enemy), k, role)
+
+    def advantages_over(self, hero, role=None, k=None):
+        """The heroes hero has a positive advantage over, biggest first, as (enemy, advantage)"""
+        return self._heroes_and_advantages(self.advantages_of(hero), k, role)
+
+    def _heroes_and_advantages(self, values, k, role):
+        return [
+            (self.heroes[i], self.to_float(values[i]))
+            for i in self.top(values, k, role, minimum=0)
+        ]
+
+    def hard_and_soft_counters(self, values, role=None):
+        """Splits the heroes in values, into hard and soft counters.
+
+        The hard counters are all those with a strong advantage, the soft counters are the rest of
+        the top MAX_COUNTERS.
+        """
+        hard = self.top(values, role=role, minimum=self.STRONG_ADVANTAGE)
+        soft = [
+            i for i in self.top(values, self.MAX_COUNTERS, role, minimum=0)
+            if values[i] < self.STRONG_ADVANTAGE
+        ]
+        return [self.heroes[i] for i in hard], [self.heroes[i] for i in soft]
+
+    def best_picks(self, enemies, allies=(), role=None, k=5):
+        """The best k heroes to pick against the enemies, ranked by their total advantage.
+
+        Heroes which have already been picked, by either team, or which we have no advantages for
+        against any of the enemies, are excluded. Returns a list of
+        (hero, total_advantage, advantages) where advantages has the hero's advantage over each
+        enemy (None if unknown).
+        """
+        enemy_indices = [self.index[e.pk] for e in enemies]
+        advantages = self.values[:, enemy_indices]
+        totals = np.nansum(advantages, axis=1)
+        totals[np.all(np.isnan(advantages), axis=1)] = np.nan
+        totals[enemy_indices + [self.index[a.pk] for a in allies]] = np.nan
+        return [
+            (
+                self.heroes[i],
+                self.to_float(totals[i]),
+                [None if np.isnan(a) else self.to_float(a) for a in advantages[i]],
+            )
+            for i in self.top(totals, k, role)
+        ]
@@ -0,0 +1,129 @@
+import itertools
+from collections import namedtuple
+
+import numpy as np
+
+from .roles import HeroRole
+
+
+Lineup = namedtuple('Lineup', ('heroes', 'roles', 'advantage'))
+
+
+class DraftPlanner(object):
+    """Suggests whole lineups to complete a team's draft against the enemy heroes.
+
+    Each hero in a lineup plays one of the lineup roles, and must have that role. The lineups are
+    scored by the total advantage of their heroes over the enemies, and found with a beam search:
+    the missing roles are filled one at a time, keeping only the best beam_width partial lineups
+    at each step. Every extension of every partial lineup is scored at once with NumPy.
+    """
+    LINEUP_ROLES = (
+        HeroRole.CARRY, HeroRole.MIDDLE, HeroRole.OFF_LANE, HeroRole.SUPPORT, HeroRole.SUPPORT)
+
+    def __init__(self, advantage_matrix, lineup_roles=LINEUP_ROLES):
+        self.advantage_matrix = advantage_matrix
+        self.lineup_roles = tuple(lineup_roles)
+
+    def plan(self, enemies, allies=(), beam_width=50, max_lineups=3):
+        """The best (up to) max_lineups Lineups including the allies, best first"""
+        matrix = self.advantage_matrix
+        ally_indices = [matrix.index[a.pk] for a in allies]
+        enemy_indices = [matrix.index[e.pk] for e in enemies]
+        assert len(ally_indices) <= len(self.lineup_roles), "Too many allies"
+
+        advantages = matrix.values[:, enemy_indices]
+        scores = np.nansum(advantages, axis=1).astype(np.float64)
+        if enemy_indices:
+            scores[np.all(np.isnan(advantages), axis=1)] = np.nan
+
+        available = ~np.isnan(scores)
+        available[enemy_indices + ally_indices] = False
+
+        # The allies may be able to play different roles, try each way of filling the lineup
+        lineups = []
+        for ally_roles, missing_roles in self._assign_allies_to_roles(ally_indices):
+            lineups += self._search(
+                ally_indices, ally_roles, missing_roles, scores, available, beam_width)
+        lineups.sort(key=lambda lineup: lineup.advantage, reverse=True)
+
+        result, seen = [], set()
+        for lineup in lineups:
+            key = frozenset(h.pk for h in lineup.heroes)
+            if key not in seen:
+                seen.add(key)
+                result.append(lineup)
+        return result[:max_lineups]
+
+    def _search(self, ally_indices, ally_roles, missing_roles, scores, available, beam_width):
+        """Beam search for the best heroes for the missing roles"""
+        matrix = self.advantage_matrix
+        # Each partial lineup in the beam is a row of hero indices, with its score
+        beam = np.array([ally_indices], dtype=np.intp).reshape(1, len(ally_indices))
+        beam_scores = np.array([np.nansum(scores[ally_indices])])
+        for role in missing_roles:
+            candidates = np.flatnonzero(available & matrix.role_mask(role))
+            if len(candidates) == 0:
+                return []
+            beam, beam_scores = self._extend(beam, beam_scores, candidates, scores, beam_width)
+            if len(beam) == 0:
+                return []
+
+        roles = list(ally_roles) + list(missing_roles)
+        return [
+            Lineup(
+                heroes=[matrix.heroes[i] for i in lineup],
+                roles=roles,
+                advantage=matrix.to_float(score),
+            )
+            for lineup, score in zip(beam, beam_scores)
+        ]
+
+    @staticmethod
+    def _extend(beam, beam_scores, candidates, scores, beam_width):
+        """Adds one more hero to every lineup in the beam, keeping the best beam_width"""
+        extended_scores = beam_scores[:, np.newaxis] + scores[candidates][np.newaxis, :]
+        # A hero can't be in the lineup twice
+        for column in beam.T:
+            extended_scores[column[:, np.newaxis] == candidates[np.newaxis, :]] = -np.inf
+
+        flat_scores = extended_scores.ravel()
+        best = np.argsort(-flat_scores, kind='stable')
+        new_beam, new_scores, seen = [], [], set()
+        for position in best:
+            if len(new_beam) == beam_width or flat_scores[position] == -np.inf:
+                break
+            row, column = divmod(position, len(candidates))
+            lineup = list(beam[row]) + [candidates[column]]
+            # The same heroes in different roles are the same lineup
+            key = frozenset(lineup)
+            if key in seen:
+                continue
+            seen.add(key)
+            new_beam.append(lineup)
+            new_scores.append(flat_scores[position])
+        return (
+            np.array(new_beam, dtype=np.intp).reshape(len(new_beam), beam.shape[1] + 1),
+            np.array(new_scores))
+
+    def _assign_allies_to_roles(self, ally_indices):
+        """The ways of giving each ally a lineup role, as a list of (ally_roles, missing_roles).
+
+        Allies are given roles they have where possible, any others are given whichever roles are
+        left over.
+        """
+        role_masks = self.advantage_matrix.role_masks
+        assignments, best_matches = {}, -1
+        for slots in itertools.permutations(range(len(self.lineup_roles)), len(ally_indices)):
+            matches = sum(
+                role_masks[self.lineup_roles[slot]][ally]
+                for slot, ally in zip(slots, ally_indices))
+            if matches < best_matches:
+                continue
+            if matches > best_matches:
+                assignments, best_matches = {}, matches
+            missing_roles = tuple(
+                role for slot, role in enumerate(self.lineup_roles) if slot not in slots)
+            # Lineups only depend on which roles are left to fill, not who plays what
+            assignments.setdefault(
+                missing_roles, tuple(self.lineup_roles[slot] for slot in slots))
+        return [(ally_roles, missing) for missing, ally_roles in assignments.items()]
@@ -1,2 +1,6 @@
 class InvalidEnemyNames(Exception):
     pass
+
+
+class InvalidDraft(Exception):
+    pass
@@ -1,27 +1,69 @@
+import os
 import logging
+from functools import partial
 
+from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 
 from apps.hero_abilities.models import Ability
-from apps.metadata.models import AdvantagesUpdate
-from apps.hero_advantages.models import Hero, Advantage
+from apps.metadata.models import AdvantagesUpdate, UpdateLock
+from apps.hero_advantages.models import Hero, Advantage, HeroCounters, PageHashes
+from apps.utils.stages import Stage, StageGraph, StageMetrics
+from apps.utils.table_diff import TableDiff
+from apps.utils.request_handler import RequestHandler, MeteredRequestHandler
+from apps.utils.http_cache import HttpCache
+from apps.utils.page_archive import PageArchive, RecordingRequestHandler, ReplayRequestHandler
 
 
 logger = logging.getLogger(__name__)
 
+STAGES = ['heroes', 'roles', 'aliases', Advantage.UPDATE_STAGE, Ability.UPDATE_STAGE, 'counters']
+
 
 class Command(BaseCommand):
     help = 'Updates the heroes data by scraping the web'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-cache', action='store_true',
+            help="Download every page, rather than revalidating the pages in SCRAPER_CACHE_DIR")
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Parse and save every page, even those that haven't changed since the last update")
+        parser.add_argument(
+            '--stages', nargs='+', choices=STAGES, metavar='STAGE',
+            help="Only run these stages ({}), not the stages they depend on".format(
+                ', '.join(STAGES)))
+        parser.add_argument(
+            '--heroes', nargs='+', metavar='HERO',
+            help="Only load the roles, aliases, advantages and abilities of these heroes")
+        parser.add_argument(
+            '--resume', action='store_true',
+            help="Carry on from the last checkpoint of the last update, if it didn't finish")
+        archive = parser.add_mutually_exclusive_group()
+        archive.add_argument(
+            '--record', metavar='DIR', help="Save every page fetched to an archive in DIR")
+        archive.add_argument(
+            '--replay', metavar='DIR',
+            help="Update from the pages archived in DIR by --record, without fetching anything. "
+                 "Every page is parsed and saved, as with --force")
+
     def handle(self, *args, **options):
+        request_handler = self._request_handler(options)
+        names = self._hero_names(options['heroes'])
+        update = self._start_update(options['resume'])
         try:
-            AdvantagesUpdate.start_new_update()
-            Hero.update_from_web()
-            Advantage.update_from_web()
-            Ability.update_from_web()
-            AdvantagesUpdate.finish_current_update()
+            diffs = self._run_stages(
+                update, request_handler,
+                # A replay is for running the parsers again, so it parses every page
+                PageHashes(force=options['force'] or bool(options['replay'])), names,
+                options['stages'])
+            # Everything the assistant needs is saved with the update, and served from then on
+            update.finish(models=[Hero, Ability, Advantage, HeroCounters])
         except Exception as exc:
             raise CommandError('ERROR: {}'.format(exc))
+        finally:
+            UpdateLock.release(update)
 
         for hero in Hero.objects.all():
             if Ability.standard_objects.filter(hero=hero).count() < 4:
@@ -30,4 +72,92 @@ class Command(BaseCommand):
                     hero,
                     Ability.standard_objects.filter(hero=hero))
 
+        for diff in diffs:
+            for line in diff.summary():
+                self.stdout.write(line)
         self.stdout.write(self.style.SUCCESS('Successfully updated heros'))
+
+    @staticmethod
+    def _start_update(resume):
+        """The update to run, holding the lock so no other update can run at the same time"""
+        update = AdvantagesUpdate.resumable_update() if resume else None
+        if resume and update is None:
+            logger.warning("There's no unfinished update to resume, starting a new one")
+        is_new = update is None
+        if is_new:
+            update = AdvantagesUpdate.start_new_update()
+        if not UpdateLock.acquire(update):
+            if is_new:
+                update.delete()
+            raise CommandError('ERROR: {} is still running'.format(UpdateLock.holder()))
+        return update
+
+    def _run_stages(self, update, request_handler, page_hashes, names, stages):
+        """Runs the stages the update hasn't finished, those which don't depend on each other
+        at the same time. The StageMetrics of each stage are saved with the update as it finishes.
+        Returns the TableDiffs of their writes.
+        """
+        metrics = {stage: StageMetrics() for stage in STAGES}
+
+        def pages(stage):
+            return MeteredRequestHandler(request_handler, metrics[stage])
+
+        graph = StageGraph([
+            Stage('heroes', partial(
+                Hero.update_hero_list, pages('heroes'), metrics=metrics['heroes'])),
+            Stage('roles', partial(
+                Hero.update_all_roles, pages('roles'), page_hashes,
+                created_since=update.update_started, names=names,
+                metrics=metrics['roles']), ['heroes']),
+            Stage('aliases', partial(
+                Hero.update_all_aliases, names, metrics=metrics['aliases']), ['heroes']),
+            Stage(Advantage.UPDATE_STAGE, partial(
+                Advantage.update_from_web, pages(Advantage.UPDATE_STAGE),
+                page_hashes=page_hashes, update=update, names=names,
+                metrics=metrics[Advantage.UPDATE_STAGE]), ['heroes']),
+            Stage(Ability.UPDATE_STAGE, partial(
+                Ability.update_from_web, pages(Ability.UPDATE_STAGE),
+                page_hashes=page_hashes, update=update, names=names,
+                metrics=metrics[Ability.UPDATE_STAGE]), ['heroes']),
+            Stage('counters', partial(
+                HeroCounters.update_all, metrics=metrics['counters']),
+                ['roles', Advantage.UPDATE_STAGE]),
+        ])
+        done = [stage for stage in STAGES if update.stage_is_finished(stage)]
+        for stage in done:
+            self.stdout.write('Skipping {}, it was finished before'.format(stage))
+
+        diffs = []
+
+        def finished(stage, result):
+            metrics[stage].wall_seconds = graph.seconds[stage]
+            update.finish_stage(stage, metrics[stage])
+            self.stdout.write('Finished {}: {}'.format(stage, metrics[stage]))
+            if isinstance(result, TableDiff):
+                diffs.append(result)
+
+        graph.run(stages, done=done, on_finished=finished)
+        return diffs
+
+    @staticmethod
+    def _hero_names(names):
+        """The names of the heroes given with --heroes, as they're stored, None if not given"""
+        if not names:
+            return None
+        stored = {name.lower(): name for name in Hero.objects.values_list('name', flat=True)}
+        unknown = [name for name in names if name.lower() not in stored]
+        if unknown:
+            raise CommandError('ERROR: unknown heroes {}'.format(', '.join(unknown)))
+        return [stored[name.lower()] for name in names]
+
+    @staticmethod
+    def _request_handler(options):
+        if options['replay']:
+            if not os.path.isdir(options['replay']):
+                raise CommandError('ERROR: no archive in {}'.format(options['replay']))
+            return ReplayRequestHandler(PageArchive(options['replay']))
+
+        cache = None if options['no_cache'] else HttpCache(settings.SCRAPER_CACHE_DIR)
+        if options['record']:
+            return RecordingRequestHandler(PageArchive(options['record']), cache=cache)
+        return RequestHandler(cache=cache)
@@ -0,0 +1,28 @@
+# Generated by Django 2.1.3 on 2026-10-18 10:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hero_advantages', '0004_hero_aliases_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeroCounters',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.IntegerField(blank=True, default=None, null=True)),
+                ('direction', models.IntegerField()),
+                ('hard_counters_data', models.CharField(blank=True, default='', max_length=1024)),
+                ('soft_counters_data', models.CharField(blank=True, default='', max_length=1024)),
+                ('hero', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='hero_advantages.Hero')),
+            ],
+            options={
+                'unique_together': {('hero', 'role', 'direction')},
+            },
+        ),
+    ]
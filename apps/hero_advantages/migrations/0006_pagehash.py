@@ -0,0 +1,24 @@
+# Generated by Django 2.1.3 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hero_advantages', '0005_herocounters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageHash',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(max_length=255, unique=True)),
+                ('source', models.CharField(max_length=32)),
+                ('hero_name', models.CharField(blank=True, default='', max_length=64)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('date_modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
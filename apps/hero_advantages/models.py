@@ -1,16 +1,39 @@
+import hashlib
 import logging
+import threading
+from enum import IntEnum, unique
+from functools import partial
+from collections import defaultdict
 
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+from apps.utils.upsert import upsert
+from apps.utils.table_diff import TableDiff
+from apps.hero_abilities.ability_extractor import PARSER_VERSION as ABILITIES_PARSER_VERSION
 
 from .aliases import hero_aliases
-from .exceptions import InvalidEnemyNames
-from .web_scraper import WebScraper, HeroRole
+from .advantage_matrix import AdvantageMatrix
+from .draft import DraftPlanner
+from .exceptions import InvalidEnemyNames, InvalidDraft
+from .web_scraper import WebScraper, HeroRole, COUNTERS_PARSER_VERSION, ROLES_PARSER_VERSION
 
 
 logger = logging.getLogger(__name__)
 
 
 class Hero(models.Model):
+    # The field saying whether the hero is of each role
+    ROLE_FIELDS = {
+        HeroRole.CARRY: 'is_carry',
+        HeroRole.SUPPORT: 'is_support',
+        HeroRole.OFF_LANE: 'is_off_lane',
+        HeroRole.JUNGLER: 'is_jungler',
+        HeroRole.MIDDLE: 'is_mid',
+        HeroRole.ROAMING: 'is_roaming',
+    }
+
     name = models.CharField(max_length=64, unique=True, db_index=True)
     aliases_data = models.CharField(max_length=512, blank=True, default='')  # comma separated list
     is_carry = models.BooleanField(default=False)
@@ -37,18 +60,8 @@ class Hero(models.Model):
             'is_roaming': self.is_roaming,
         }
 
-    def update_roles(self, web_scraper):
-        """Updates the hero's roles using the web scraper"""
-        self.is_carry = web_scraper.hero_is_role(self.name, HeroRole.CARRY)
-        self.is_support = web_scraper.hero_is_role(self.name, HeroRole.SUPPORT)
-        self.is_off_lane = web_scraper.hero_is_role(self.name, HeroRole.OFF_LANE)
-        self.is_jungler = web_scraper.hero_is_role(self.name, HeroRole.JUNGLER)
-        self.is_mid = web_scraper.hero_is_role(self.name, HeroRole.MIDDLE)
-        self.is_roaming = web_scraper.hero_is_role(self.name, HeroRole.ROAMING)
-
-        if not (self.is_carry or self.is_support or self.is_off_lane
-                or self.is_jungler or self.is_mid or self.is_roaming):
-            logger.warning('Hero %s has no role', self.name)
+    def is_role(self, role):
+        return getattr(self, self.ROLE_FIELDS[role])
 
     @property
     def aliases(self):
@@ -70,21 +83,211 @@ class Hero(models.Model):
                 self.aliases_data += ',{}'.format(additional_aliases_data)
 
     @staticmethod
-    def update_from_web(request_handler=None):
-        web_scraper = WebScraper(request_handler)
-        hero_names = list(web_scraper.get_hero_names())
+    def update_from_web(request_handler=None, page_hashes=None):
+        """Loads the heroes, their roles and aliases.
+
+        If page_hashes (a PageHashes) is given, the roles are only loaded for new heroes, unless
+        the lanes or roles pages have changed.
+        """
+        started = timezone.now()
+        Hero.update_hero_list(request_handler)
+        Hero.update_all_roles(request_handler, page_hashes, created_since=started)
+        Hero.update_all_aliases()
+
+    @staticmethod
+    def update_hero_list(request_handler=None, metrics=None):
+        """Adds the new heroes, and removes any which aren't in the game any more. The rows
+        written are counted in metrics (a StageMetrics) if it's given.
+        """
+        hero_names = list(WebScraper(request_handler).get_hero_names())
+        stored = set(Hero.objects.values_list('name', flat=True))
 
         # Remove any heroes from the database which aren't in the new list
-        extra_heroes = Hero.objects.exclude(name__in=hero_names)
-        for hero in extra_heroes:
-            logger.warning('Removing the hero %s from the database', hero)
-            hero.delete()
-
-        for name in hero_names:
-            hero, _ = Hero.objects.get_or_create(name=name)
-            hero.update_roles(web_scraper)
+        removed = stored.difference(hero_names)
+        if removed:
+            logger.warning('Removing the heroes %s from the database', ', '.join(sorted(removed)))
+            Hero.objects.filter(name__in=removed).delete()
+            PageHash.objects.filter(hero_name__in=removed).delete()
+
+        new = Hero.objects.bulk_create(
+            [Hero(name=name) for name in hero_names if name not in stored])
+        if metrics:
+            metrics.add(
+                inserted=len(new), deleted=len(removed), unchanged=len(stored) - len(removed))
+
+    @staticmethod
+    def update_all_roles(request_handler=None, page_hashes=None, created_since=None, names=None,
+                         metrics=None):
+        """Loads the heroes' roles, of only the heroes in names if it's given.
+
+        If page_hashes (a PageHashes) is given and the lanes and roles pages haven't changed, only
+        the roles of heroes created since created_since are loaded. If no heroes were found for a
+        role the pages are loaded again next time. The heroes updated are counted
+        in metrics (a StageMetrics) if it's given, heroes without a role count as errors.
+        """
+        web_scraper = WebScraper(request_handler)
+        heroes = Hero.objects.all()
+        if names is not None:
+            heroes = heroes.filter(name__in=names)
+        if page_hashes:
+            # Every page is hashed, so they're all stored
+            pages_changed = [
+                page_hashes.changed(PageHash.LANES, url, content)
+                for url, content in web_scraper.lane_pages().items()
+            ]
+            pages_changed.append(page_hashes.changed(PageHash.ROLES, *web_scraper.roles_page()))
+            if not any(pages_changed):
+                if created_since is None:
+                    heroes = heroes.none()
+                else:
+                    heroes = heroes.filter(date_created__gte=created_since)
+
+        fields = list(Hero.ROLE_FIELDS.values())
+        rows = list(heroes.values_list('id', 'name', *fields))
+        role_heroes = web_scraper.role_heroes if rows else None
+        # The heroes whose roles have changed, by their new roles
+        changed = defaultdict(list)
+        without_role = 0
+        for hero_id, name, *old_roles in rows:
+            roles = tuple(name in role_heroes[role] for role in Hero.ROLE_FIELDS)
+            if not any(roles):
+                logger.warning('Hero %s has no role', name)
+                without_role += 1
+            if roles != tuple(old_roles):
+                changed[roles].append(hero_id)
+
+        # Heroes with the same roles are updated together, there are only a few combinations
+        now = timezone.now()
+        with transaction.atomic():
+            for roles, hero_ids in changed.items():
+                Hero.objects.filter(id__in=hero_ids).update(
+                    date_modified=now, **dict(zip(fields, roles)))
+        if metrics:
+            updated = sum(len(hero_ids) for hero_ids in changed.values())
+            metrics.add(updated=updated, unchanged=len(rows) - updated, errors=without_role)
+        if page_hashes:
+            if role_heroes is not None and not all(role_heroes.values()):
+                # A page with no heroes of a role didn't parse, so they're parsed again next time
+                page_hashes.discard(PageHash.LANES)
+                page_hashes.discard(PageHash.ROLES)
+            page_hashes.save(PageHash.LANES, PageHash.ROLES)
+
+    @staticmethod
+    def update_all_aliases(names=None, metrics=None):
+        """Adds the aliases in hero_aliases to the heroes, of only the heroes in names if given.
+        The heroes updated are counted in metrics (a StageMetrics) if it's given.
+        """
+        heroes = Hero.objects.all()
+        if names is not None:
+            heroes = heroes.filter(name__in=names)
+        updated = unchanged = 0
+        for hero in heroes:
+            aliases_data = hero.aliases_data
             hero.load_aliases()
-            hero.save()
+            if hero.aliases_data != aliases_data:
+                # Only the aliases, as the roles stage may be writing the roles at the same time
+                hero.save(update_fields=['aliases_data', 'date_modified'])
+                updated += 1
+            else:
+                unchanged += 1
+        if metrics:
+            metrics.add(updated=updated, unchanged=unchanged)
+
+
+class PageHash(models.Model):
+    """The hash of a scraped page's content, and the version of its parser, from the last time it
+    was parsed and saved.
+
+    Each hero has a counters and a wiki page, the lanes and roles pages are shared by all the
+    heroes (their hero_name is blank).
+    """
+    COUNTERS = 'counters'
+    WIKI = 'wiki'
+    LANES = 'lanes'
+    ROLES = 'roles'
+
+    PARSER_VERSIONS = {
+        COUNTERS: COUNTERS_PARSER_VERSION,
+        WIKI: ABILITIES_PARSER_VERSION,
+        LANES: ROLES_PARSER_VERSION,
+        ROLES: ROLES_PARSER_VERSION,
+    }
+
+    url = models.CharField(max_length=255, unique=True)
+    source = models.CharField(max_length=32)
+    hero_name = models.CharField(max_length=64, blank=True, default='')
+    content_hash = models.CharField(max_length=64)
+    date_modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.url
+
+
+class PageHashes(object):
+    """Tells which pages have changed since they were last saved, by their hash.
+
+    changed() is given each page as it's fetched, and can be called from several threads. The
+    new hashes are only stored by save(), which should be called once everything from the pages
+    has been saved, so that a failed update doesn't leave pages marked as done. Each stage of an
+    update saves just the sources it has loaded, as the others may still be loading. Pages which
+    gave errors, or nothing, are discard()ed, so they're parsed again by the next update. With
+    force every page counts as changed.
+
+    The hash includes the version of the source's parser, so every page is parsed again once its
+    parser changes.
+    """
+
+    def __init__(self, force=False):
+        self.force = force
+        # Loaded now, so the threads that fetch pages don't use the database
+        self._hashes = dict(PageHash.objects.values_list('url', 'content_hash'))
+        self._new = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def hash_content(source, content):
+        if isinstance(content, str):
+            content = content.encode('utf8')
+        version = 'v{}\n'.format(PageHash.PARSER_VERSIONS[source]).encode('utf8')
+        return hashlib.sha256(version + content).hexdigest()
+
+    def changed(self, source, url, content, hero_name=''):
+        content_hash = self.hash_content(source, content)
+        with self._lock:
+            self._new[url] = (source, hero_name, content_hash)
+            return self.force or self._hashes.get(url) != content_hash
+
+    def discard(self, source, hero_name=''):
+        """Forgets the new hashes of the source's pages for the hero, so they aren't saved"""
+        with self._lock:
+            for url, (page_source, page_hero_name, _) in list(self._new.items()):
+                if page_source == source and page_hero_name == hero_name:
+                    del self._new[url]
+
+    def save(self, *sources):
+        """Stores the hashes of the pages from sources (all of them if none are given)"""
+        now = timezone.now()
+        with self._lock:
+            new = {
+                url: page for url, page in self._new.items() if not sources or page[0] in sources
+            }
+            if not new:
+                return
+            rows = [
+                {
+                    'url': url,
+                    'source': source,
+                    'hero_name': hero_name,
+                    'content_hash': content_hash,
+                    'date_modified': now,
+                }
+                for url, (source, hero_name, content_hash) in new.items()
+                if self._hashes.get(url) != content_hash
+            ]
+            upsert(PageHash, rows, key='url', replace=['content_hash', 'date_modified'])
+            for url, (source, hero_name, content_hash) in new.items():
+                self._hashes[url] = content_hash
+                del self._new[url]
 
 
 class Advantage(models.Model):
@@ -96,6 +299,9 @@ class Advantage(models.Model):
     date_created = models.DateTimeField(auto_now_add=True)
     date_modified = models.DateTimeField(auto_now=True)
 
+    # The name of loading the advantages in AdvantagesUpdate's progress
+    UPDATE_STAGE = 'advantages'
+
     class Meta:
         unique_together = ("hero", "enemy")
 
@@ -105,21 +311,25 @@ class Advantage(models.Model):
 
     @classmethod
     def generate_info_dict(cls, enemy_names):
+        advantage_matrix = AdvantageMatrix.current()
         enemy_names = cls._nature_bug_workaround(enemy_names)
         try:
             enemies = [
-                Hero.objects.get(name=enemy_name) if enemy_name != 'none' else None
+                advantage_matrix.heroes_by_name[enemy_name] if enemy_name != 'none' else None
                 for enemy_name in enemy_names
             ]
-        except Hero.DoesNotExist:
+        except KeyError:
             logger.debug(
                 'Attempting to generate_info_dict for invalid enemy names: %s', enemy_names)
             raise InvalidEnemyNames
 
+        enemy_ids = [e.pk for e in enemies if e]
         result = []
-        for h in Hero.objects.exclude(pk__in=[e.pk for e in enemies if e]):
+        for h in advantage_matrix.heroes:
+            if h.pk in enemy_ids:
+                continue
             advantages = list(
-                Advantage.objects.get(hero=h, enemy=enemy).advantage if enemy else None
+                advantage_matrix.advantage(h, enemy) if enemy else None
                 for enemy in enemies
             )
             info_dict = h.generate_info_dict()
@@ -127,6 +337,77 @@ class Advantage(models.Model):
             result.append(info_dict)
         return result
 
+    MAX_ENEMIES = 5
+
+    @classmethod
+    def generate_picks_info_dict(cls, enemy_names, ally_names=(), role_name=None, k=5):
+        """The k best heroes to pick against up to five enemies, best first.
+
+        Optionally only heroes of the role (e.g. 'carry') are included. The allies are only
+        excluded from the picks, as we don't have any data on how well heroes work together.
+        """
+        advantage_matrix = AdvantageMatrix.current()
+        enemies, allies = cls._draft_heroes(advantage_matrix, enemy_names, ally_names)
+        try:
+            role = HeroRole[role_name.upper()] if role_name else None
+            k = int(k)
+        except (KeyError, ValueError):
+            raise InvalidDraft
+        if k < 1:
+            raise InvalidDraft
+
+        result = []
+        for hero, advantage, advantages in advantage_matrix.best_picks(enemies, allies, role, k):
+            info_dict = hero.generate_info_dict()
+            info_dict['advantage'] = advantage
+            info_dict['advantages'] = advantages
+            result.append(info_dict)
+        return result
+
+    @classmethod
+    def generate_draft_info_dict(cls, enemy_names, ally_names=()):
+        """The best few lineups to complete the allies' team against the enemies, best first"""
+        advantage_matrix = AdvantageMatrix.current()
+        enemies, allies = cls._draft_heroes(advantage_matrix, enemy_names, ally_names)
+        if len(allies) > len(DraftPlanner.LINEUP_ROLES):
+            raise InvalidDraft
+
+        return [
+            {
+                'advantage': lineup.advantage,
+                'heroes': [
+                    {'name': hero.name, 'id_num': hero.pk, 'role': role.name.lower()}
+                    for hero, role in zip(lineup.heroes, lineup.roles)
+                ],
+            }
+            for lineup in DraftPlanner(advantage_matrix).plan(enemies, allies)
+        ]
+
+    @classmethod
+    def _draft_heroes(cls, advantage_matrix, enemy_names, ally_names):
+        """Looks up the enemy and ally heroes from their names"""
+        try:
+            enemies = [
+                advantage_matrix.heroes_by_name[name]
+                for name in cls._nature_bug_workaround(enemy_names)
+            ]
+        except KeyError:
+            raise InvalidEnemyNames
+        try:
+            allies = [
+                advantage_matrix.heroes_by_name[name]
+                for name in cls._nature_bug_workaround(ally_names)
+            ]
+        except KeyError:
+            raise InvalidDraft
+        if not 0 < len(enemies) <= cls.MAX_ENEMIES:
+            raise InvalidDraft
+        # Each hero can only be picked once in a game
+        heroes = enemies + allies
+        if len(set(heroes)) != len(heroes):
+            raise InvalidDraft
+        return enemies, allies
+
     @staticmethod
     def _nature_bug_workaround(enemy_names):
         return [
@@ -134,16 +415,158 @@ class Advantage(models.Model):
             for e in enemy_names
         ]
 
-    @staticmethod
-    def update_from_web(request_handler=None):
+    @classmethod
+    def update_from_web(cls, request_handler=None, tolerance=None, page_hashes=None, update=None,
+                        names=None, metrics=None):
+        """Loads the advantages, only writing those that have changed by more than tolerance.
+
+        If page_hashes (a PageHashes) is given, only the heroes whose counters page has changed
+        are loaded, and those without any advantages are loaded again next time. If update (an
+        AdvantagesUpdate) is given, each hero is checkpointed in it, and the heroes it has already
+        done are skipped. If names is given only those heroes are loaded. The parse time and rows
+        written are counted in metrics (a StageMetrics) if it's given, heroes without any
+        advantages count as errors. Returns the TableDiff of what was written.
+        """
+        if tolerance is None:
+            tolerance = settings.SCRAPER_ADVANTAGE_TOLERANCE
         web_scraper = WebScraper(request_handler)
-        for hero in Hero.objects.all():
-            advantages_data = web_scraper.load_advantages_for_hero(hero.name)
-            for advantage_data in advantages_data:
-                adv = advantage_data['advantage']
-                enemy = Hero.objects.get(name=advantage_data['enemy_name'])
-                Advantage.objects.update_or_create(
-                    hero=hero,
-                    enemy=enemy,
-                    defaults={'advantage': adv},
-                )
+        hero_ids = dict(Hero.objects.values_list('name', 'id'))
+        hero_names = {hero_id: name for name, hero_id in hero_ids.items()}
+        diff = TableDiff(
+            'Advantages', cls._current_advantages(), tolerance,
+            label=lambda hero, enemy: '{} over {}'.format(hero_names[hero], hero_names[enemy]))
+        changed = partial(page_hashes.changed, PageHash.COUNTERS) if page_hashes else None
+        done = update.heroes_done(cls.UPDATE_STAGE) if update else set()
+        # The pages are fetched and parsed in the background, the advantages are saved here
+        advantages = web_scraper.load_advantages_for_heroes([
+            name for name in hero_ids if name not in done and (names is None or name in names)
+        ], changed)
+        for hero_name, advantages_data in advantages:
+            if not advantages_data:
+                if metrics:
+                    metrics.add(errors=1)
+                if page_hashes:
+                    page_hashes.discard(PageHash.COUNTERS, hero_name)
+            cls.save_advantages(hero_ids[hero_name], advantages_data, hero_ids, diff)
+            if update:
+                update.hero_done(cls.UPDATE_STAGE, hero_name)
+        if page_hashes:
+            page_hashes.save(PageHash.COUNTERS)
+        if metrics:
+            metrics.add_pipeline(web_scraper.pipeline)
+            metrics.add_diff(diff)
+        for line in diff.summary():
+            logger.info(line)
+        return diff
+
+    @staticmethod
+    def _current_advantages(**filters):
+        """The advantages in the database, as {hero_id: {enemy_id: advantage}}"""
+        current = defaultdict(dict)
+        rows = Advantage.objects.filter(**filters).values_list('hero', 'enemy', 'advantage')
+        for hero_id, enemy_id, advantage in rows:
+            current[hero_id][enemy_id] = advantage
+        return current
+
+    @classmethod
+    def save_advantages(cls, hero_id, advantages_data, hero_ids, diff=None):
+        """Saves a hero's advantages, from the dicts the web scraper gives.
+
+        hero_ids is a {name: id} of all the heroes, enemies not in it are skipped. Only the
+        advantages which diff (a TableDiff of the current advantages) finds are new or changed
+        are written, in one statement, and those no longer listed are deleted.
+        """
+        if diff is None:
+            diff = TableDiff('Advantages', cls._current_advantages(hero_id=hero_id))
+        advantages = {}
+        for advantage_data in advantages_data:
+            enemy_id = hero_ids.get(advantage_data['enemy_name'])
+            if enemy_id is None:
+                logger.warning("Skipping advantage over unknown hero %s", advantage_data)
+                continue
+            advantages[enemy_id] = advantage_data['advantage']
+        if not advantages:
+            logger.warning("No advantages loaded for hero %s, keeping the old ones", hero_id)
+
+        write, delete = diff.diff(hero_id, advantages, delete_missing=bool(advantages))
+        now = timezone.now()
+        rows = [
+            {
+                'hero': hero_id,
+                'enemy': enemy_id,
+                'advantage': advantages[enemy_id],
+                'date_created': now,
+                'date_modified': now,
+            }
+            for enemy_id in write
+        ]
+        upsert(Advantage, rows, key=('hero', 'enemy'), replace=['advantage', 'date_modified'])
+        if delete:
+            Advantage.objects.filter(hero_id=hero_id, enemy_id__in=delete).delete()
+
+
+@unique
+class CounterDirection(IntEnum):
+    WHO_COUNTERS_HERO = 1
+    WHO_DOES_HERO_COUNTER = 2
+
+
+class HeroCounters(models.Model):
+    """The precomputed answer to who counters a hero, or who a hero counters, for a role.
+
+    These are calculated from the advantages by update_heroes, for every hero, role (or no role)
+    and direction, so answering a question about counters is a single lookup.
+    """
+    hero = models.ForeignKey(Hero, on_delete=models.CASCADE, db_index=True)
+    role = models.IntegerField(null=True, blank=True, default=None)  # HeroRole value
+    direction = models.IntegerField()  # CounterDirection
+    hard_counters_data = models.CharField(max_length=1024, blank=True, default='')  # hero ids
+    soft_counters_data = models.CharField(max_length=1024, blank=True, default='')  # hero ids
+
+    class Meta:
+        unique_together = ('hero', 'role', 'direction')
+
+    @property
+    def hard_counter_ids(self):
+        return [int(i) for i in self.hard_counters_data.split(',') if i]
+
+    @property
+    def soft_counter_ids(self):
+        return [int(i) for i in self.soft_counters_data.split(',') if i]
+
+    @staticmethod
+    def calculate(advantage_matrix, hero, role, direction):
+        """Calculates the hard and soft counters (as lists of Heros) from an AdvantageMatrix"""
+        if direction == CounterDirection.WHO_COUNTERS_HERO:
+            values = advantage_matrix.counters_of(hero)
+        else:
+            values = advantage_matrix.advantages_of(hero)
+        return advantage_matrix.hard_and_soft_counters(values, role)
+
+    @classmethod
+    def update_all(cls, metrics=None):
+        """Recalculates the counters of every hero, for every role and direction. The rows
+        written are counted in metrics (a StageMetrics) if it's given.
+        """
+        advantage_matrix = AdvantageMatrix.from_tables()
+        counters = []
+        for hero in advantage_matrix.heroes:
+            for direction in CounterDirection:
+                for role in [None] + list(HeroRole):
+                    hard, soft = cls.calculate(advantage_matrix, hero, role, direction)
+                    counters.append(cls(
+                        hero=hero,
+                        role=role.value if role else None,
+                        direction=direction,
+                        hard_counters_data=','.join(str(h.pk) for h in hard),
+                        soft_counters_data=','.join(str(h.pk) for h in soft),
+                    ))
+
+        with transaction.atomic():
+            deleted, _ = cls.objects.all().delete()
+            cls.objects.bulk_create(counters)
+        if metrics:
+            metrics.add(inserted=len(counters), deleted=deleted)
+
+
+AdvantageMatrix.invalidate_on_change(Hero, Advantage)
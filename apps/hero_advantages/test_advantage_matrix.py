@@ -0,0 +1,144 @@
+import pytest
+from django.test import TestCase
+
+from apps.metadata.models import AdvantagesUpdate
+
+from .roles import HeroRole
+from .models import Hero, Advantage
+from .advantage_matrix import AdvantageMatrix
+from .factories import HeroFactory, AdvantageFactory
+
+
+@pytest.mark.django_db
+class TestAdvantageMatrix(TestCase):
+    def setUp(self):
+        self.joe = HeroFactory(name="Joe", is_carry=False)
+        self.sb = HeroFactory(name="Super-Bob", is_carry=True)
+        self.sm = HeroFactory(name="Spacey Max", is_carry=False)
+        self.rex = HeroFactory(name="Rex", is_carry=True)
+        AdvantageFactory(hero=self.sb, enemy=self.joe, advantage=1.1)
+        AdvantageFactory(hero=self.sm, enemy=self.joe, advantage=2.14)
+        AdvantageFactory(hero=self.rex, enemy=self.joe, advantage=-0.3)
+        AdvantageFactory(hero=self.joe, enemy=self.sb, advantage=2)
+        self.matrix = AdvantageMatrix.load()
+
+    def test_advantage(self):
+        assert self.matrix.advantage(self.sm, self.joe) == 2.14
+        assert self.matrix.advantage(self.joe, self.sm) is None
+
+    def test_counters(self):
+        assert self.matrix.counters(self.joe) == [(self.sm, 2.14), (self.sb, 1.1)]
+        assert self.matrix.counters(self.joe, HeroRole.CARRY) == [(self.sb, 1.1)]
+        assert self.matrix.counters(self.joe, k=1) == [(self.sm, 2.14)]
+
+    def test_advantages_over(self):
+        assert self.matrix.advantages_over(self.joe) == [(self.sb, 2)]
+        assert self.matrix.advantages_over(self.rex) == []
+
+    def test_hard_and_soft_counters(self):
+        hard, soft = self.matrix.hard_and_soft_counters(self.matrix.counters_of(self.joe))
+        assert hard == [self.sm]
+        assert soft == [self.sb]
+
+    def test_best_picks(self):
+        assert self.matrix.best_picks([self.joe, self.sb]) == [
+            (self.sm, 2.14, [2.14, None]),
+            (self.rex, -0.3, [-0.3, None]),
+        ]
+
+    def test_best_picks_excludes_allies_and_other_roles(self):
+        assert self.matrix.best_picks([self.joe], allies=[self.sm]) == [
+            (self.sb, 1.1, [1.1]),
+            (self.rex, -0.3, [-0.3]),
+        ]
+        assert self.matrix.best_picks([self.joe], role=HeroRole.CARRY, k=1) == [
+            (self.sb, 1.1, [1.1])]
+
+
+@pytest.mark.django_db
+class TestGenerations(TestCase):
+    def setUp(self):
+        self.joe = HeroFactory(name="Joe", is_carry=True)
+        self.sb = HeroFactory(name="Super-Bob")
+        self.advantage = AdvantageFactory(hero=self.sb, enemy=self.joe, advantage=1.1)
+
+    def finish_update(self):
+        AdvantagesUpdate.start_new_update()
+        AdvantagesUpdate.finish_current_update(models=[Hero, Advantage])
+        AdvantageMatrix.invalidate()
+        return AdvantagesUpdate.last_update()
+
+    def test_loads_the_active_generation(self):
+        self.finish_update()
+        # Half way through the next update
+        self.advantage.advantage = 5
+        self.advantage.save()
+        HeroFactory(name="Rex")
+        matrix = AdvantageMatrix.load()
+        assert [h.name for h in matrix.heroes] == ["Joe", "Super-Bob"]
+        assert matrix.advantage(self.sb, self.joe) == 1.1
+        assert matrix.heroes_by_name["Joe"].is_carry
+
+        self.finish_update()
+        matrix = AdvantageMatrix.load()
+        assert [h.name for h in matrix.heroes] == ["Joe", "Super-Bob", "Rex"]
+        assert matrix.advantage(self.sb, self.joe) == 5
+
+    def test_rolling_back(self):
+        first = self.finish_update()
+        self.advantage.advantage = 5
+        self.advantage.save()
+        second = self.finish_update()
+        assert AdvantagesUpdate.active_update() == second
+
+        first.activate()
+        AdvantageMatrix.invalidate()
+        assert AdvantagesUpdate.active_update() == first
+        assert AdvantageMatrix.load().advantage(self.sb, self.joe) == 1.1
+
+    def test_old_generations_are_deleted(self):
+        updates = [self.finish_update() for _ in range(AdvantagesUpdate.KEEP_GENERATIONS + 2)]
+        kept = AdvantagesUpdate.objects.exclude(generation_data=None)
+        assert sorted(u.pk for u in kept) == [
+            u.pk for u in updates[-AdvantagesUpdate.KEEP_GENERATIONS:]]
+
+    def test_without_a_generation_the_tables_are_used(self):
+        AdvantagesUpdate.start_new_update()
+        AdvantagesUpdate.finish_current_update()
+        self.advantage.advantage = 5
+        self.advantage.save()
+        assert AdvantageMatrix.load().advantage(self.sb, self.joe) == 5
+
+    def test_saves_reload_the_snapshot_only_when_read_from_the_tables(self):
+        matrix = AdvantageMatrix.current()
+        self.advantage.advantage = 5
+        self.advantage.save()
+        assert AdvantageMatrix.current() is not matrix
+        assert AdvantageMatrix.current().advantage(self.sb, self.joe) == 5
+
+        self.finish_update()
+        matrix = AdvantageMatrix.current()
+        # Edits are served from the next update's generation
+        self.advantage.advantage = 6
+        self.advantage.save()
+        assert AdvantageMatrix.current() is matrix
+        self.finish_update()
+        assert AdvantageMatrix.current().advantage(self.sb, self.joe) == 6
+
+
+class TestTopK(TestCase):
+    def setUp(self):
+        heroes = [HeroFactory.build(pk=i, is_carry=(i % 2 == 0)) for i in range(12)]
+        self.matrix = AdvantageMatrix(heroes, [])
+
+    def test_top(self):
+        values = self.matrix.values[:, 0].copy()
+        values[:] = [3, -1, 1, 2, 0, 0.5, 0.1, 0.2, 0.3, 0.4, 0.6, float('nan')]
+        assert list(self.matrix.top(values, k=3)) == [0, 3, 2]
+        assert list(self.matrix.top(values, minimum=0.45)) == [0, 3, 2, 10, 5]
+        assert list(self.matrix.top(values, k=2, role=HeroRole.CARRY)) == [0, 2]
+
+    def test_top_keeps_hero_order_for_equal_values(self):
+        values = self.matrix.values[:, 0].copy()
+        values[:] = 1
+        assert list(self.matrix.top(values)) == list(range(12))
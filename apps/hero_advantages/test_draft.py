@@ -0,0 +1,77 @@
+import unittest
+
+from .models import Hero
+from .roles import HeroRole
+from .draft import DraftPlanner
+from .advantage_matrix import AdvantageMatrix
+
+
+def make_hero(pk, *roles):
+    return Hero(
+        pk=pk,
+        name='Hero {}'.format(pk),
+        is_carry=HeroRole.CARRY in roles,
+        is_mid=HeroRole.MIDDLE in roles,
+        is_support=HeroRole.SUPPORT in roles,
+        is_off_lane=HeroRole.OFF_LANE in roles,
+        is_jungler=HeroRole.JUNGLER in roles,
+        is_roaming=HeroRole.ROAMING in roles,
+    )
+
+
+class TestDraftPlanner(unittest.TestCase):
+    def setUp(self):
+        self.enemy = make_hero(1)
+        self.carry = make_hero(2, HeroRole.CARRY)
+        self.better_carry = make_hero(3, HeroRole.CARRY)
+        self.carry_or_mid = make_hero(4, HeroRole.CARRY, HeroRole.MIDDLE)
+        self.mid = make_hero(5, HeroRole.MIDDLE)
+        self.support = make_hero(6, HeroRole.SUPPORT)
+        self.other_support = make_hero(7, HeroRole.SUPPORT)
+        heroes = [
+            self.enemy, self.carry, self.better_carry, self.carry_or_mid, self.mid, self.support,
+            self.other_support,
+        ]
+        advantages = {
+            self.carry: 1, self.better_carry: 2, self.carry_or_mid: 5, self.mid: 1,
+            self.support: 0.5, self.other_support: -0.5,
+        }
+        self.matrix = AdvantageMatrix(
+            heroes, [(h.pk, self.enemy.pk, a) for h, a in advantages.items()])
+        self.planner = DraftPlanner(
+            self.matrix, lineup_roles=(HeroRole.CARRY, HeroRole.MIDDLE, HeroRole.SUPPORT))
+
+    def test_best_lineup(self):
+        lineups = self.planner.plan([self.enemy])
+        assert lineups[0].heroes == [self.better_carry, self.carry_or_mid, self.support]
+        assert lineups[0].roles == [HeroRole.CARRY, HeroRole.MIDDLE, HeroRole.SUPPORT]
+        assert lineups[0].advantage == 7.5
+
+    def test_lineups_are_different_and_in_order(self):
+        lineups = self.planner.plan([self.enemy], max_lineups=10)
+        assert len(set(frozenset(l.heroes) for l in lineups)) == len(lineups)
+        scores = [l.advantage for l in lineups]
+        assert scores == sorted(scores, reverse=True)
+
+    def test_allies_keep_their_roles(self):
+        lineups = self.planner.plan([self.enemy], allies=[self.carry_or_mid])
+        assert lineups[0].heroes == [self.carry_or_mid, self.better_carry, self.support]
+        assert lineups[0].roles == [HeroRole.MIDDLE, HeroRole.CARRY, HeroRole.SUPPORT]
+
+    def test_full_team(self):
+        lineups = self.planner.plan(
+            [self.enemy], allies=[self.carry, self.mid, self.other_support])
+        assert lineups == [(
+            [self.carry, self.mid, self.other_support],
+            [HeroRole.CARRY, HeroRole.MIDDLE, HeroRole.SUPPORT],
+            1.5,
+        )]
+
+    def test_not_enough_heroes_for_roles(self):
+        planner = DraftPlanner(self.matrix, lineup_roles=(HeroRole.JUNGLER, ))
+        assert planner.plan([self.enemy]) == []
+
+    def test_narrow_beam(self):
+        lineups = self.planner.plan([self.enemy], beam_width=1)
+        assert len(lineups) == 1
+        assert lineups[0].advantage <= 7.5
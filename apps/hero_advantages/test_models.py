@@ -1,13 +1,31 @@
+import py
 import pytest
+from unittest.mock import patch
+from bs4 import BeautifulSoup
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-from .models import Advantage
+from .roles import HeroRole
+from .models import Hero, Advantage, HeroCounters, CounterDirection, PageHash, PageHashes
 from .exceptions import InvalidEnemyNames
 from .factories import HeroFactory, AdvantageFactory
+from .web_scraper import WebScraper, TABLES, TEAMLIQUID_ROLES_URL
+from apps.utils.request_handler import MockRequestHandler
+from apps.utils.table_diff import TableDiff
+from apps.utils.stages import StageMetrics
+from apps.metadata.models import AdvantagesUpdate
 
 
 @pytest.mark.django_db
 class TestHeroModel(TestCase):
+    def test_update_all_aliases(self):
+        HeroFactory(name='Anti-Mage')
+        HeroFactory(name='Axe')
+        Hero.update_all_aliases(names=['Anti-Mage'])
+        assert Hero.objects.get(name='Anti-Mage').aliases_data
+        assert not Hero.objects.get(name='Axe').aliases_data
+
     def test_load_aliases(self):
         windranger = HeroFactory(name='Windranger')
         windranger.load_aliases()
@@ -82,3 +100,298 @@ class SimpleModelTestes(TestCase):
         AdvantageFactory(hero=qop, enemy=np, advantage=1.2)
         result = Advantage.generate_info_dict(["Nature"])
         self.assertEqual(result[0]['name'], "Queen of Pain")
+
+
+def heroes_request_handler(lane_page):
+    """Every lane has the same page"""
+    return MockRequestHandler(
+        url_map={
+            "http://wiki.teamliquid.net/dota2/Hero_Roles": "Hero Roles.html",
+            **{
+                "http://www.dotabuff.com/heroes/lanes?lane={}".format(lane): lane_page
+                for lane in ('safe', 'mid', 'off', 'jungle', 'roaming')
+            },
+        },
+        files_path=py.path.local().join("apps", "hero_advantages", "test_data"),
+    )
+
+
+@pytest.mark.django_db
+class TestHeroSync(TestCase):
+    @patch.object(WebScraper, 'get_hero_names', lambda self: ['Invoker', 'Axe', 'Riki'])
+    def test_update_hero_list(self):
+        HeroFactory(name='Axe')
+        old = HeroFactory(name='Old Hero')
+        PageHash.objects.create(
+            url='http://old', source=PageHash.WIKI, hero_name='Old Hero', content_hash='x')
+        with CaptureQueriesContext(connection) as queries:
+            Hero.update_hero_list(heroes_request_handler('Dotabuff Middle Lane.html'))
+        assert len([q for q in queries if q['sql'].startswith('INSERT')]) == 1
+        assert set(Hero.objects.values_list('name', flat=True)) == {'Invoker', 'Axe', 'Riki'}
+        assert not Hero.objects.filter(pk=old.pk).exists()
+        assert not PageHash.objects.exists()
+
+    def test_only_changed_roles_are_written(self):
+        HeroFactory(name='Invoker')
+        HeroFactory(name='Shadow Fiend')
+        request_handler = heroes_request_handler('Dotabuff Middle Lane.html')
+        Hero.update_all_roles(request_handler)
+        assert Hero.objects.get(name='Shadow Fiend').is_mid
+        assert Hero.objects.get(name='Invoker').is_mid
+
+        with CaptureQueriesContext(connection) as queries:
+            Hero.update_all_roles(request_handler)
+        assert not [q for q in queries if q['sql'].startswith('UPDATE')]
+
+    def test_aliases_and_roles_of_a_new_hero(self):
+        HeroFactory(name='Shadow Fiend')
+        request_handler = heroes_request_handler('Dotabuff Middle Lane.html')
+        load_aliases = Hero.load_aliases
+
+        def roles_loaded_meanwhile(hero):
+            # The roles stage runs alongside, and writes after the aliases stage reads the hero
+            Hero.update_all_roles(request_handler)
+            load_aliases(hero)
+
+        with patch.object(Hero, 'load_aliases', roles_loaded_meanwhile):
+            Hero.update_all_aliases()
+        shadow_fiend = Hero.objects.get(name='Shadow Fiend')
+        assert shadow_fiend.aliases_data == 'sf'
+        assert shadow_fiend.is_mid
+
+    def test_roles_are_set_operations_over_each_page(self):
+        request_handler = heroes_request_handler('Dotabuff Middle Lane.html')
+        web_scraper = WebScraper(request_handler)
+        with patch.object(request_handler, 'get', wraps=request_handler.get) as get, \
+                patch('apps.hero_advantages.web_scraper.BeautifulSoup',
+                      wraps=BeautifulSoup) as soup:
+            role_heroes = web_scraper.role_heroes
+        assert 'Anti-Mage' not in role_heroes[HeroRole.CARRY]
+        assert 'Shadow Fiend' in role_heroes[HeroRole.MIDDLE]
+        assert 'Disruptor' in role_heroes[HeroRole.SUPPORT]
+        # The Team Liquid page is fetched and parsed once for both its roles
+        assert [c[0][0] for c in get.call_args_list].count(TEAMLIQUID_ROLES_URL) == 1
+        assert len([c for c in soup.call_args_list if c[1]['parse_only'] is TABLES]) == 1
+
+
+@pytest.mark.django_db
+class TestPageHashes(TestCase):
+    def test_changed(self):
+        page_hashes = PageHashes()
+        assert page_hashes.changed(PageHash.WIKI, 'http://a', 'content', 'Axe')
+        page_hashes.save()
+        assert PageHash.objects.get().hero_name == 'Axe'
+
+        page_hashes = PageHashes()
+        assert not page_hashes.changed(PageHash.WIKI, 'http://a', 'content', 'Axe')
+        assert page_hashes.changed(PageHash.WIKI, 'http://b', 'content', 'Io')
+        assert PageHashes(force=True).changed(PageHash.WIKI, 'http://a', 'content', 'Axe')
+
+    def test_not_saved_until_save(self):
+        PageHashes().changed(PageHash.WIKI, 'http://a', 'content', 'Axe')
+        assert PageHashes().changed(PageHash.WIKI, 'http://a', 'content', 'Axe')
+
+    def test_changed_when_the_parser_changes(self):
+        page_hashes = PageHashes()
+        page_hashes.changed(PageHash.WIKI, 'http://a', 'content', 'Axe')
+        page_hashes.save()
+        with patch.dict(PageHash.PARSER_VERSIONS, {PageHash.WIKI: 2}):
+            assert PageHashes().changed(PageHash.WIKI, 'http://a', 'content', 'Axe')
+        assert not PageHashes().changed(PageHash.WIKI, 'http://a', 'content', 'Axe')
+
+    def test_discarded_pages_not_saved(self):
+        page_hashes = PageHashes()
+        page_hashes.changed(PageHash.WIKI, 'http://a', 'content', 'Axe')
+        page_hashes.changed(PageHash.WIKI, 'http://b', 'content', 'Io')
+        page_hashes.changed(PageHash.COUNTERS, 'http://c', 'content', 'Axe')
+        page_hashes.discard(PageHash.WIKI, 'Axe')
+        page_hashes.save()
+        assert sorted(PageHash.objects.values_list('url', flat=True)) == ['http://b', 'http://c']
+
+    def test_heroes_without_advantages_loaded_again(self):
+        HeroFactory(name='Axe')
+        HeroFactory(name='Io')
+
+        def load_advantages_for_heroes(self, heroes, changed):
+            for hero in heroes:
+                changed('http://{}'.format(hero), 'content', hero)
+                yield hero, [] if hero == 'Axe' else [{'enemy_name': 'Axe', 'advantage': 1.0}]
+
+        with patch.object(WebScraper, 'load_advantages_for_heroes', load_advantages_for_heroes):
+            Advantage.update_from_web(page_hashes=PageHashes())
+        assert list(PageHash.objects.values_list('hero_name', flat=True)) == ['Io']
+
+    @patch.object(WebScraper, 'get_hero_names', lambda self: ['Invoker', 'Axe'])
+    def test_hero_roles_only_loaded_when_pages_change(self):
+        Hero.update_from_web(heroes_request_handler('Dotabuff Middle Lane.html'), PageHashes())
+        assert Hero.objects.get(name='Invoker').is_mid
+        Hero.objects.filter(name='Invoker').update(is_mid=False)
+
+        Hero.update_from_web(heroes_request_handler('Dotabuff Middle Lane.html'), PageHashes())
+        assert not Hero.objects.get(name='Invoker').is_mid
+
+        Hero.update_from_web(
+            heroes_request_handler('Dotabuff Middle Lane.html'), PageHashes(force=True))
+        assert Hero.objects.get(name='Invoker').is_mid
+
+        Hero.update_from_web(heroes_request_handler('Dotabuff Roaming.html'), PageHashes())
+        assert not Hero.objects.get(name='Invoker').is_mid
+
+
+@pytest.mark.django_db
+class TestSaveAdvantages(TestCase):
+    def setUp(self):
+        self.axe = HeroFactory(name='Axe')
+        self.io = HeroFactory(name='Io')
+        self.sniper = HeroFactory(name='Sniper')
+        self.hero_ids = {h.name: h.id for h in (self.axe, self.io, self.sniper)}
+
+    def test_inserts_and_updates_in_one_query(self):
+        AdvantageFactory(hero=self.axe, enemy=self.io, advantage=1.0)
+        with CaptureQueriesContext(connection) as queries:
+            Advantage.save_advantages(self.axe.id, [
+                {'enemy_name': 'Io', 'advantage': -2.5},
+                {'enemy_name': 'Sniper', 'advantage': 3.0},
+            ], self.hero_ids)
+        assert len([q for q in queries if 'ON CONFLICT' in q['sql']]) == 1
+        assert sorted(Advantage.objects.values_list('enemy__name', 'advantage')) == [
+            ('Io', -2.5), ('Sniper', 3.0)]
+
+    def test_only_writes_changes(self):
+        unchanged = AdvantageFactory(hero=self.axe, enemy=self.io, advantage=1.0)
+        AdvantageFactory(hero=self.axe, enemy=self.axe, advantage=1.0)
+        diff = TableDiff('Advantages', Advantage._current_advantages(), tolerance=0.01)
+        Advantage.save_advantages(self.axe.id, [
+            {'enemy_name': 'Io', 'advantage': 1.005},
+            {'enemy_name': 'Sniper', 'advantage': 3.0},
+        ], self.hero_ids, diff)
+        assert (diff.inserted, diff.changed, diff.deleted, diff.unchanged) == (1, 0, 1, 1)
+        # Within the tolerance, so left alone
+        io = Advantage.objects.get(hero=self.axe, enemy=self.io)
+        assert (io.advantage, io.date_modified) == (1.0, unchanged.date_modified)
+        assert sorted(Advantage.objects.values_list('enemy__name', flat=True)) == ['Io', 'Sniper']
+
+    def test_keeps_old_advantages_if_none_loaded(self):
+        AdvantageFactory(hero=self.axe, enemy=self.io, advantage=1.0)
+        Advantage.save_advantages(self.axe.id, [], self.hero_ids)
+        assert Advantage.objects.count() == 1
+
+    def test_skips_unknown_enemies(self):
+        Advantage.save_advantages(self.axe.id, [
+            {'enemy_name': 'Io', 'advantage': 1.0},
+            {'enemy_name': 'Nobody', 'advantage': 3.0},
+        ], self.hero_ids)
+        assert list(Advantage.objects.values_list('enemy__name', 'advantage')) == [('Io', 1.0)]
+
+    def test_update_from_web(self):
+        # Every hero has Disruptor's counters page
+        request_handler = MockRequestHandler(
+            url_map={
+                'http://www.dotabuff.com/heroes/{}/counters'.format(name.lower()): 'Disruptor.html'
+                for name in ('Axe', 'Io', 'Sniper')
+            },
+            files_path=py.path.local().join("apps", "hero_advantages", "test_data"),
+        )
+        metrics = StageMetrics()
+        diff = Advantage.update_from_web(request_handler, metrics=metrics)
+        assert Advantage.objects.count() == 9
+        assert Advantage.objects.get(hero=self.sniper, enemy=self.io).advantage == -2.1
+        assert diff.inserted == 9
+        assert metrics.counts['inserted'] == 9
+        assert metrics.counts['parse_seconds'] > 0
+
+        Advantage.objects.filter(hero=self.sniper, enemy=self.io).update(advantage=-1.1)
+        diff = Advantage.update_from_web(request_handler)
+        assert (diff.inserted, diff.changed, diff.deleted, diff.unchanged) == (0, 1, 0, 8)
+        assert diff.summary()[-1] == '  Sniper over Io: -1.1 -> -2.1'
+
+    def test_update_from_web_skips_unchanged_pages(self):
+        request_handler = MockRequestHandler(
+            url_map={
+                'http://www.dotabuff.com/heroes/{}/counters'.format(name.lower()): 'Disruptor.html'
+                for name in ('Axe', 'Io', 'Sniper')
+            },
+            files_path=py.path.local().join("apps", "hero_advantages", "test_data"),
+        )
+        assert Advantage.update_from_web(request_handler, page_hashes=PageHashes()).inserted == 9
+        assert PageHash.objects.filter(source=PageHash.COUNTERS).count() == 3
+
+        Advantage.objects.filter(hero=self.sniper, enemy=self.io).update(advantage=-1.1)
+        diff = Advantage.update_from_web(request_handler, page_hashes=PageHashes())
+        assert (diff.inserted, diff.changed, diff.unchanged) == (0, 0, 0)
+        assert Advantage.objects.get(hero=self.sniper, enemy=self.io).advantage == -1.1
+
+        diff = Advantage.update_from_web(request_handler, page_hashes=PageHashes(force=True))
+        assert (diff.changed, diff.unchanged) == (1, 8)
+
+    def test_resumed_update_skips_heroes_done(self):
+        request_handler = MockRequestHandler(
+            url_map={
+                'http://www.dotabuff.com/heroes/{}/counters'.format(name.lower()): 'Disruptor.html'
+                for name in ('Io', 'Sniper')
+            },
+            files_path=py.path.local().join("apps", "hero_advantages", "test_data"),
+        )
+        update = AdvantagesUpdate.start_new_update()
+        update.hero_done(Advantage.UPDATE_STAGE, 'Axe')
+
+        diff = Advantage.update_from_web(request_handler, update=update)
+        assert diff.inserted == 6
+        assert not Advantage.objects.filter(hero=self.axe).exists()
+        assert update.heroes_done(Advantage.UPDATE_STAGE) == {'Axe', 'Io', 'Sniper'}
+
+    def test_update_from_web_of_some_heroes(self):
+        request_handler = MockRequestHandler(
+            url_map={'http://www.dotabuff.com/heroes/io/counters': 'Disruptor.html'},
+            files_path=py.path.local().join("apps", "hero_advantages", "test_data"),
+        )
+        assert Advantage.update_from_web(request_handler, names=['Io']).inserted == 3
+        assert set(Advantage.objects.values_list('hero__name', flat=True)) == {'Io'}
+
+
+@pytest.mark.django_db
+class TestHeroCounters(TestCase):
+    def setUp(self):
+        self.joe = HeroFactory(name="Joe")
+        self.sb = HeroFactory(name="Super-Bob", is_carry=True)
+        self.sm = HeroFactory(name="Spacey Max", is_carry=False)
+        self.rex = HeroFactory(name="Rex", is_carry=True)
+        AdvantageFactory(hero=self.sb, enemy=self.joe, advantage=1.1)
+        AdvantageFactory(hero=self.sm, enemy=self.joe, advantage=2.5)
+        AdvantageFactory(hero=self.rex, enemy=self.joe, advantage=-0.3)
+        AdvantageFactory(hero=self.joe, enemy=self.sb, advantage=2)
+        HeroCounters.update_all()
+
+    def get_counters(self, hero, role, direction):
+        return HeroCounters.objects.get(
+            hero=hero, role=role.value if role else None, direction=direction)
+
+    def test_who_counters_hero(self):
+        counters = self.get_counters(self.joe, None, CounterDirection.WHO_COUNTERS_HERO)
+        assert counters.hard_counter_ids == [self.sm.pk]
+        assert counters.soft_counter_ids == [self.sb.pk]
+
+    def test_who_counters_hero_with_role(self):
+        counters = self.get_counters(self.joe, HeroRole.CARRY, CounterDirection.WHO_COUNTERS_HERO)
+        assert counters.hard_counter_ids == []
+        assert counters.soft_counter_ids == [self.sb.pk]
+
+    def test_who_does_hero_counter(self):
+        counters = self.get_counters(self.joe, None, CounterDirection.WHO_DOES_HERO_COUNTER)
+        assert counters.hard_counter_ids == [self.sb.pk]
+        assert counters.soft_counter_ids == []
+
+    def test_every_hero_role_and_direction(self):
+        assert HeroCounters.objects.count() == 4 * (len(HeroRole) + 1) * len(CounterDirection)
+
+    def test_replaces_old_counters(self):
+        HeroCounters.update_all()
+        assert HeroCounters.objects.count() == 4 * (len(HeroRole) + 1) * len(CounterDirection)
+
+    def test_calculated_from_the_tables_not_the_active_generation(self):
+        AdvantagesUpdate.start_new_update()
+        AdvantagesUpdate.finish_current_update(models=[Hero, Advantage])
+        Advantage.objects.filter(hero=self.rex).update(advantage=3)
+        HeroCounters.update_all()
+        counters = self.get_counters(self.joe, None, CounterDirection.WHO_COUNTERS_HERO)
+        assert counters.hard_counter_ids == [self.rex.pk, self.sm.pk]
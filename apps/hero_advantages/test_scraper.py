@@ -2,7 +2,7 @@ import py
 import unittest
 
 from apps.utils.request_handler import MockRequestHandler
-from .web_scraper import WebScraper, Lane, HeroRole
+from .web_scraper import WebScraper, Lane, HeroRole, parse_advantages
 
 
 mock_request_handler = MockRequestHandler(
@@ -127,6 +127,14 @@ class TestScrapingOfAdvantages(unittest.TestCase):
         self.assertEqual(len(self.result), 110)
 
 
+class TestScrapingAdvantagesOfHeroes(unittest.TestCase):
+    def test_same_as_one_at_a_time(self):
+        scraper = WebScraper(request_handler=mock_request_handler)
+        (hero, advantages), = scraper.load_advantages_for_heroes(["Disruptor"])
+        self.assertEqual(hero, "Disruptor")
+        self.assertEqual(advantages, list(scraper.load_advantages_for_hero("Disruptor")))
+
+
 class TestScrapingOfNewAdvantagesFormat(unittest.TestCase):
     def test_new_disadvantage_format(self):
         scraper = WebScraper(request_handler=new_format_mock_request_handler)
@@ -136,6 +144,18 @@ class TestScrapingOfNewAdvantagesFormat(unittest.TestCase):
         self.assertEqual(top_disadvantage['advantage'], -3.67)
 
 
+class TestParseAdvantages(unittest.TestCase):
+    def test_table_without_thead_or_tbody(self):
+        content = (
+            '<table class="sortable"><tr><th>Hero</th><th>Disadvantage</th></tr>'
+            '<tr data-link-to="/heroes/axe"><td></td><td>Axe</td><td>1.5%</td></tr></table>')
+        self.assertEqual(parse_advantages(content), [{'enemy_name': 'Axe', 'advantage': -1.5}])
+
+    def test_page_without_a_table(self):
+        with self.assertRaises(ValueError):
+            parse_advantages('<html><body>Too many requests</body></html>')
+
+
 # class TestGetNumFromPercent(unittest.TestCase):
 #     def test_get_num_from_percent(self):
 #         string = "1.8%"
@@ -1,9 +1,10 @@
+import json
 import pytest
-from django.test import TestCase
+from django.test import TestCase, RequestFactory
 from django.utils.encoding import force_text
 
 from .models import Hero
-from .views import hero_list, hero_name, advantages
+from .views import hero_list, hero_name, advantages, picks, draft
 
 from .factories import HeroFactory, AdvantageFactory
 
@@ -83,3 +84,66 @@ class TestViews(TestCase):
                  }
              ]}
         )
+
+    def test_picks(self):
+        request = RequestFactory().get('/hero_advantages/picks/', {'enemies': 'Joe,Super-Bob'})
+        response = picks(request)
+        data = json.loads(force_text(response.content))['data']
+        assert [h['name'] for h in data] == ['Rex', 'Spacey Max']
+        assert data[0]['advantage'] == 1.8
+        assert data[0]['advantages'] == [-1.2, 3.0]
+
+    def test_picks_with_role_allies_and_k(self):
+        request = RequestFactory().get('/hero_advantages/picks/', {
+            'enemies': 'Joe',
+            'allies': 'Rex',
+            'role': 'carry',
+            'k': '1',
+        })
+        data = json.loads(force_text(picks(request).content))['data']
+        assert [h['name'] for h in data] == ['Spacey Max']
+
+    def test_picks_bad_requests(self):
+        for params in (
+                {'enemies': 'Joe,Mr Made Up'},
+                {'enemies': ''},
+                {'enemies': 'Joe', 'allies': 'Mr Made Up'},
+                {'enemies': 'Joe', 'role': 'tank'},
+                {'enemies': 'Joe', 'k': 'lots'},
+                {'enemies': 'Joe,Joe,Joe,Joe,Joe,Joe'},
+        ):
+            response = picks(RequestFactory().get('/hero_advantages/picks/', params))
+            assert response.status_code == 400
+
+    def test_draft(self):
+        # With Spacey Max and Rex, enough heroes to fill every role of a lineup
+        joe, super_bob = Hero.objects.get(name='Joe'), Hero.objects.get(name='Super-Bob')
+        for name, role, advantages in (
+                ('Cara', 'is_carry', (1, 1)),
+                ('Midas', 'is_mid', (0.5, None)),
+                ('Offa', 'is_off_lane', (0.25, 0.25)),
+                ('Suppy', 'is_support', (1, None)),
+        ):
+            roles = dict.fromkeys(
+                ('is_carry', 'is_support', 'is_off_lane', 'is_jungler', 'is_mid', 'is_roaming'),
+                False)
+            hero = HeroFactory(name=name, **dict(roles, **{role: True}))
+            for enemy, advantage in zip((joe, super_bob), advantages):
+                if advantage is not None:
+                    AdvantageFactory(hero=hero, enemy=enemy, advantage=advantage)
+
+        request = RequestFactory().get('/hero_advantages/draft/', {'enemies': 'Joe,Super-Bob'})
+        data = json.loads(force_text(draft(request).content))['data']
+        best = data[0]
+        assert [(h['name'], h['role']) for h in best['heroes']] == [
+            ('Cara', 'carry'), ('Midas', 'middle'), ('Offa', 'off_lane'), ('Rex', 'support'),
+            ('Suppy', 'support')]
+        assert best['advantage'] == pytest.approx(2 + 0.5 + 0.5 + 1.8 + 1)
+        assert all(lineup['advantage'] < best['advantage'] for lineup in data[1:])
+
+    def test_draft_bad_requests(self):
+        for params in (
+                {'enemies': 'Joe', 'allies': 'Mr Made Up'}, {'enemies': 'Mr Made Up'},
+                {'enemies': 'Joe,Joe'}, {'enemies': 'Joe', 'allies': 'Rex,Joe'}):
+            response = draft(RequestFactory().get('/hero_advantages/draft/', params))
+            assert response.status_code == 400
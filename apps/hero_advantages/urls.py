@@ -11,4 +11,8 @@ urlpatterns = [
     url(r'^(?P<hero_id>[0-9]+)/hero_name/$', views.hero_name, name='hero_name'),
     # eg: /hero_advantages/advantages/Axe/Pudge/
     url(r'^advantages/(?P<enemy_names>[a-zA-Z-/\' ]*)/$', views.advantages, name='advantages'),
+    # eg: /hero_advantages/picks/?enemies=Axe,Pudge&allies=Lion&role=carry&k=5
+    url(r'^picks/$', views.picks, name='picks'),
+    # eg: /hero_advantages/draft/?enemies=Axe,Pudge,Lion,Sniper,Zeus&allies=Lina
+    url(r'^draft/$', views.draft, name='draft'),
 ]
@@ -1,7 +1,8 @@
 from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest
 
 from .models import Hero, Advantage
-from .exceptions import InvalidEnemyNames
+from .advantage_matrix import AdvantageMatrix
+from .exceptions import InvalidEnemyNames, InvalidDraft
 
 
 def index(request):
@@ -9,12 +10,17 @@ def index(request):
 
 
 def hero_list(request):
-    hero_list = Hero.objects.all()
+    hero_list = AdvantageMatrix.current().heroes
     return JsonResponse({'Heroes': [h.name for h in hero_list]})
 
 
 def hero_name(request, hero_id):
-    return JsonResponse({'Name': format(Hero.objects.get(pk=hero_id))})
+    advantage_matrix = AdvantageMatrix.current()
+    try:
+        hero = advantage_matrix.heroes[advantage_matrix.index[int(hero_id)]]
+    except KeyError:
+        raise Hero.DoesNotExist
+    return JsonResponse({'Name': format(hero)})
 
 
 def advantages(request, enemy_names):
@@ -23,3 +29,29 @@ def advantages(request, enemy_names):
         return JsonResponse({'data': Advantage.generate_info_dict(enemy_names)})
     except InvalidEnemyNames:
         return HttpResponseBadRequest()
+
+
+def _names_parameter(request, key):
+    return [n for n in request.GET.get(key, '').split(',') if n]
+
+
+def picks(request):
+    try:
+        return JsonResponse({'data': Advantage.generate_picks_info_dict(
+            _names_parameter(request, 'enemies'),
+            _names_parameter(request, 'allies'),
+            request.GET.get('role'),
+            request.GET.get('k', 5),
+        )})
+    except (InvalidEnemyNames, InvalidDraft):
+        return HttpResponseBadRequest()
+
+
+def draft(request):
+    try:
+        return JsonResponse({'data': Advantage.generate_draft_info_dict(
+            _names_parameter(request, 'enemies'),
+            _names_parameter(request, 'allies'),
+        )})
+    except (InvalidEnemyNames, InvalidDraft):
+        return HttpResponseBadRequest()
@@ -1,9 +1,11 @@
 import re
 from enum import Enum, unique
 
+from bs4 import BeautifulSoup, SoupStrainer
 from django.utils.functional import cached_property
 
-from apps.utils.request_handler import RequestHandler
+from apps.utils.pipeline import Pipeline, SKIP
+from apps.utils.request_handler import RequestHandler, FAST_PARSER
 
 from .roles import HeroRole
 
@@ -17,9 +19,50 @@ class Lane(Enum):
     ROAMING = 5
 
 
+# The dotabuff pages have all the data we want in a sortable table, only that is parsed
+SORTABLE_TABLE = SoupStrainer("table", class_="sortable")
+
+# The roles are in the Team Liquid page's tables
+TABLES = SoupStrainer("table")
+
+LANE_URLS = {
+    Lane.SAFE: "http://www.dotabuff.com/heroes/lanes?lane=safe",
+    Lane.MIDDLE: "http://www.dotabuff.com/heroes/lanes?lane=mid",
+    Lane.OFF_LANE: "http://www.dotabuff.com/heroes/lanes?lane=off",
+    Lane.JUNGLE: "http://www.dotabuff.com/heroes/lanes?lane=jungle",
+    Lane.ROAMING: "http://www.dotabuff.com/heroes/lanes?lane=roaming",
+}
+TEAMLIQUID_ROLES_URL = "http://wiki.teamliquid.net/dota2/Hero_Roles"
+
+# Bump these when the parsing of the counters, or the lane and roles pages, changes, so the pages
+# are parsed again by the next update
+COUNTERS_PARSER_VERSION = 1
+ROLES_PARSER_VERSION = 1
+
+
 class WebScraper(object):
-    def __init__(self, request_handler=None):
+    """Loads the heroes, their roles and advantages from dotabuff and the Team Liquid wiki.
+
+    When loading the advantages of several heroes the counters pages are parsed in a pool of
+    processes (os.cpu_count() of them, unless processes is given) while more are fetched.
+    """
+
+    # The (cached) properties with the sets of the heroes of each role. Each page is fetched and
+    # parsed once, for all the heroes
+    ROLE_HEROES = {
+        HeroRole.CARRY: '_carry_heroes',
+        HeroRole.SUPPORT: '_support_heroes',
+        HeroRole.JUNGLER: '_jungle_heroes',
+        HeroRole.OFF_LANE: '_off_lane_heroes',
+        HeroRole.MIDDLE: '_middle_lane_heroes',
+        HeroRole.ROAMING: '_roaming_heroes',
+    }
+
+    def __init__(self, request_handler=None, processes=None):
         self.request_handler = request_handler or RequestHandler()
+        self.processes = processes
+        self.pipeline = None
+        self._pages = {}
 
     def get_hero_names(self, min_heroes=115):
         soup = self.request_handler.get_soup("http://www.dota2.com/heroes/")
@@ -35,27 +78,12 @@ class WebScraper(object):
         return result
 
     def hero_is_role(self, hero, role):
-        ROLE_TEST_MAP = {
-            HeroRole.CARRY: lambda h: (
-                h in self._carry_heroes
-            ),
-            HeroRole.SUPPORT: lambda h: (
-                h in self._support_heroes
-            ),
-            HeroRole.JUNGLER: lambda h: (
-                h in self._jungle_heroes
-            ),
-            HeroRole.OFF_LANE: lambda h: (
-                h in self._off_lane_heroes
-            ),
-            HeroRole.MIDDLE: lambda h: (
-                h in self._middle_lane_heroes
-            ),
-            HeroRole.ROAMING: lambda h: (
-                h in self._roaming_heroes
-            ),
-        }
-        return ROLE_TEST_MAP[role](hero)
+        return hero in getattr(self, self.ROLE_HEROES[role])
+
+    @property
+    def role_heroes(self):
+        """The names of the heroes of each role, {HeroRole: frozenset}"""
+        return {role: getattr(self, name) for role, name in self.ROLE_HEROES.items()}
 
     def load_advantages_for_hero(self, hero):
         """Gets the advantages hero has over the other heroes in the game.
@@ -66,65 +94,83 @@ class WebScraper(object):
             'advantage': ADVANTAGE_FLOAT,
         }
         """
-        soup = self.request_handler.get_soup(
-            "http://www.dotabuff.com/heroes/{}/counters".format(
-                hero.replace(' ', '-').replace("'", "").lower()
-            ))
-        soup = soup.find("table", class_="sortable")
-
-        for row in soup.find_all(lambda tag: tag.has_attr("data-link-to")):
-            enemy_name = row.find(class_="cell-xlarge").get_text()
-            advantage_cell = row.find(string=re.compile("[0-9]*%"))
-            advantage = float(advantage_cell.replace("%", ""))
-            if "Disadvantage" in row.parent.parent.text[:50]:
-                advantage = advantage * -1
-            yield {
-                'enemy_name': enemy_name,
-                'advantage': advantage,
-            }
+        return parse_advantages(self.request_handler.get(self._counters_url(hero)))
+
+    def load_advantages_for_heroes(self, heroes, changed=None):
+        """Like load_advantages_for_hero for each hero, fetching and parsing pages concurrently.
+
+        Yields (hero, advantages) as each hero's page is parsed, where advantages is a list of the
+        dictionaries load_advantages_for_hero yields. If changed is given, it's called with
+        (url, content, hero) for each page, and heroes whose page it says hasn't changed are
+        skipped.
+        """
+        def fetch(hero):
+            url = self._counters_url(hero)
+            content = self.request_handler.get(url)
+            if changed is not None and not changed(url, content, hero):
+                return SKIP
+            return content
+
+        self.pipeline = Pipeline(
+            'Advantages',
+            fetch=fetch,
+            parse=parse_advantages,
+            fetch_workers=self.request_handler.max_workers,
+            parse_workers=self.processes)
+        yield from self.pipeline.run(heroes)
+
+    def lane_pages(self):
+        """The contents of the lane pages the roles come from, {url: content}"""
+        return {url: self._get(url) for url in LANE_URLS.values()}
+
+    def roles_page(self):
+        """The url and content of the Team Liquid page the carry and support roles come from"""
+        return TEAMLIQUID_ROLES_URL, self._get(TEAMLIQUID_ROLES_URL)
+
+    def _get(self, url):
+        """The page's content, each page is only fetched once"""
+        if url not in self._pages:
+            self._pages[url] = self.request_handler.get(url)
+        return self._pages[url]
+
+    @staticmethod
+    def _counters_url(hero):
+        return "http://www.dotabuff.com/heroes/{}/counters".format(
+            hero.replace(' ', '-').replace("'", "").lower())
 
     @cached_property
     def _middle_lane_heroes(self):
-        return self._heroes_present_in_lane(Lane.MIDDLE)
+        return frozenset(self._heroes_present_in_lane(Lane.MIDDLE))
 
     @cached_property
     def _carry_heroes(self):
-        return list(
-            set(
-                self._heroes_present_in_lane(Lane.SAFE)
-            ).intersection(self._teamliquid_heroes_of_role(HeroRole.CARRY)))
+        return frozenset(self._heroes_present_in_lane(Lane.SAFE)).intersection(
+            self._teamliquid_heroes_of_role(HeroRole.CARRY))
 
     @cached_property
     def _off_lane_heroes(self):
-        return self._heroes_present_in_lane(Lane.OFF_LANE)
+        return frozenset(self._heroes_present_in_lane(Lane.OFF_LANE))
 
     @cached_property
     def _jungle_heroes(self):
-        return self._heroes_present_in_lane(Lane.JUNGLE)
+        return frozenset(self._heroes_present_in_lane(Lane.JUNGLE))
 
     @cached_property
     def _roaming_heroes(self):
-        return self._heroes_present_in_lane(Lane.ROAMING)
+        return frozenset(self._heroes_present_in_lane(Lane.ROAMING))
 
     @cached_property
     def _support_heroes(self):
-        return self._teamliquid_heroes_of_role(HeroRole.SUPPORT)
+        return frozenset(self._teamliquid_heroes_of_role(HeroRole.SUPPORT))
 
     def _heroes_present_in_lane(self, lane):
-        LANE_MAP = {
-            Lane.SAFE: "http://www.dotabuff.com/heroes/lanes?lane=safe",
-            Lane.MIDDLE: "http://www.dotabuff.com/heroes/lanes?lane=mid",
-            Lane.OFF_LANE: "http://www.dotabuff.com/heroes/lanes?lane=off",
-            Lane.JUNGLE: "http://www.dotabuff.com/heroes/lanes?lane=jungle",
-            Lane.ROAMING: "http://www.dotabuff.com/heroes/lanes?lane=roaming",
-        }
         min_presence = 30 if lane != Lane.ROAMING else 5
-        soup = self.request_handler.get_soup(LANE_MAP[lane])
+        soup = BeautifulSoup(self._get(LANE_URLS[lane]), FAST_PARSER, parse_only=SORTABLE_TABLE)
         table = soup.find("table", class_="sortable")
 
         result = []
-        for row in table.find_all("tr"):
-            columns = row.find_all("td")
+        for row in table.tbody.find_all("tr", recursive=False):
+            columns = row.find_all("td", recursive=False)
             if len(columns) == 0:
                 continue
             hero_name = columns[1].get_text()
@@ -134,16 +180,50 @@ class WebScraper(object):
         return result
 
     def _teamliquid_heroes_of_role(self, role):
+        return self._teamliquid_roles[role]
+
+    @cached_property
+    def _teamliquid_roles(self):
+        """The heroes of each role on the Team Liquid roles page, which is parsed once for all
+        the roles, {HeroRole: [hero name, ...]}
+        """
         ROLE_MAP = {
             HeroRole.CARRY: "Carry",
             HeroRole.SUPPORT: "Support",
             # HeroRole.JUNGLER: "Jungler",
         }
 
-        soup = self.request_handler.get_soup("http://wiki.teamliquid.net/dota2/Hero_Roles")
-        # The first table with the role name in its table heading ("th")
-        table = next((
-            t for t in soup.find_all("table")
-            if t.find_all("th", text=re.compile(".*{}".format(ROLE_MAP[role])))
-        ))
-        return [i.get("title") for i in table.find_all("a")]
+        soup = BeautifulSoup(self._get(TEAMLIQUID_ROLES_URL), "html.parser", parse_only=TABLES)
+        tables = soup.find_all("table")
+        roles = {}
+        for role, role_name in ROLE_MAP.items():
+            # The first table with the role name in its table heading ("th")
+            table = next((
+                t for t in tables
+                if t.find_all("th", text=re.compile(".*{}".format(role_name)))
+            ))
+            roles[role] = [i.get("title") for i in table.find_all("a")]
+        return roles
+
+
+def parse_advantages(content):
+    """The advantages in a counters page, as a list of the dicts load_advantages_for_hero gives"""
+    soup = BeautifulSoup(content, FAST_PARSER, parse_only=SORTABLE_TABLE)
+    table = soup.find("table", class_="sortable")
+    if table is None:
+        raise ValueError("The counters page has no table of advantages")
+    # The parsers don't add a thead or tbody the page leaves out, then the heading is the first
+    # row, and the rows are the table's own
+    heading = table.thead or table.find("tr")
+    body = table.tbody or table
+    # The table is either of advantages or disadvantages, it says which in the heading
+    sign = -1 if heading is not None and "Disadvantage" in heading.get_text() else 1
+
+    advantages = []
+    for row in body.find_all("tr", attrs={"data-link-to": True}, recursive=False):
+        columns = row.find_all("td", recursive=False)
+        advantages.append({
+            'enemy_name': columns[1].get_text(),
+            'advantage': sign * float(columns[2].get_text().replace("%", "")),
+        })
+    return advantages
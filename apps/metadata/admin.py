@@ -1,16 +1,53 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.utils.html import format_html_join
 
-from .models import AdvantagesUpdate, User, DailyUse, ResponderUse
+from .models import AdvantagesUpdate, UpdateLock, User, DailyUsers, DailyUse, ResponderUse
 
 
 class AdvantagesUpdateAdmin(admin.ModelAdmin):
-    list_display = [f.name for f in AdvantagesUpdate._meta.fields]
+    list_display = [
+        f.name for f in AdvantagesUpdate._meta.fields
+        if f.name not in ('generation_data', 'metrics_data')
+    ] + ['has_generation', 'stage_metrics']
+    exclude = ['metrics_data']
+    readonly_fields = ['stage_metrics']
+    actions = ['activate']
+
+    def has_generation(self, update):
+        return update.generation_data is not None
+    has_generation.boolean = True
+
+    def stage_metrics(self, update):
+        return format_html_join(
+            '<br>', '{}: {}', ((stage, str(m)) for stage, m in update.stage_metrics.items()))
+
+    def activate(self, request, queryset):
+        """Serves the selected update's data again, e.g. to roll back a bad update"""
+        if queryset.count() != 1:
+            self.message_user(request, "Select one update to activate", level=messages.ERROR)
+            return
+        update = queryset.get()
+        if update.generation_data is None:
+            self.message_user(request, "That update's data wasn't kept", level=messages.ERROR)
+            return
+        update.activate()
+        self.message_user(request, "Activated {}".format(update))
+    activate.short_description = "Serve the data of the selected update"
+
+
+class UpdateLockAdmin(admin.ModelAdmin):
+    list_display = [f.name for f in UpdateLock._meta.fields]
 
 
 class UserAdmin(admin.ModelAdmin):
     list_display = [f.name for f in User._meta.fields]
 
 
+class DailyUsersAdmin(admin.ModelAdmin):
+    list_display = ['date', 'unique_users']
+    exclude = ['sketch_data']
+
+
 class DailyUseAdmin(admin.ModelAdmin):
     list_display = [f.name for f in DailyUse._meta.fields]
 
@@ -20,6 +57,8 @@ class ResponderUseAdmin(admin.ModelAdmin):
 
 
 admin.site.register(AdvantagesUpdate, AdvantagesUpdateAdmin)
+admin.site.register(UpdateLock, UpdateLockAdmin)
 admin.site.register(User, UserAdmin)
+admin.site.register(DailyUsers, DailyUsersAdmin)
 admin.site.register(DailyUse, DailyUseAdmin)
 admin.site.register(ResponderUse, ResponderUseAdmin)
@@ -0,0 +1,66 @@
+import json
+import zlib
+import datetime
+
+
+class Generation(object):
+    """A copy of the tables loaded by an update, which the snapshots are loaded from.
+
+    update_heroes changes the tables in place, over several minutes. Rather than serving the data
+    while it's half updated, the snapshots are loaded from the generation saved when the update
+    finished, until the next update is activated. The older generations are kept for a while, so
+    an earlier update can be activated again if there's something wrong with the latest one.
+
+    Each table is stored as its field names and a list of rows, as compressed JSON.
+    """
+
+    def __init__(self, tables):
+        # {model label: {'fields': [attname, ...], 'rows': [[value, ...], ...]}}
+        self.tables = tables
+
+    @classmethod
+    def from_database(cls, models):
+        tables = {}
+        for model in models:
+            fields = [f.attname for f in model._meta.concrete_fields]
+            tables[model._meta.label] = {
+                'fields': fields,
+                'rows': [list(row) for row in model.objects.order_by('pk').values_list(*fields)],
+            }
+        return cls(tables)
+
+    def to_bytes(self):
+        return zlib.compress(json.dumps(self.tables, default=_json_default).encode('utf8'))
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(json.loads(zlib.decompress(bytes(data)).decode('utf8')))
+
+    def __contains__(self, model):
+        """Whether the model's table is in the generation, with the fields the model has now"""
+        table = self.tables.get(model._meta.label)
+        return table is not None and table['fields'] == [
+            f.attname for f in model._meta.concrete_fields]
+
+    def instances(self, model):
+        """The model's instances, in pk order. They aren't in the database, so mustn't be saved"""
+        table = self.tables[model._meta.label]
+        fields = model._meta.concrete_fields
+        attnames = table['fields']
+        return [
+            model.from_db(None, attnames, [f.to_python(v) for f, v in zip(fields, row)])
+            for row in table['rows']
+        ]
+
+    def values_list(self, model, *names):
+        """The values of the fields (attnames, e.g. hero_id) of each row, as tuples"""
+        table = self.tables[model._meta.label]
+        indices = [table['fields'].index(name) for name in names]
+        return [tuple(row[i] for i in indices) for row in table['rows']]
+
+
+def _json_default(value):
+    # Unlike DjangoJSONEncoder this keeps the microseconds
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError("Can't store {!r} in a generation".format(value))
@@ -0,0 +1,63 @@
+import zlib
+import hashlib
+
+import numpy as np
+
+
+class HyperLogLog(object):
+    """An approximate count of the distinct items added to it, in a fixed amount of memory.
+
+    Each item is hashed, the first PRECISION bits of the hash choose a register, and the register
+    keeps the longest run of leading zeros seen in the rest of the hash. With the default
+    precision there are 4096 one byte registers, and counts are within about 1.6% of the truth.
+    Sketches can be merged, the count of the merged sketch is the count of the union, so daily
+    sketches can be combined to count over any range of days.
+    """
+    PRECISION = 12
+    HASH_BITS = 64
+
+    def __init__(self, registers=None):
+        self.num_registers = 1 << self.PRECISION
+        if registers is None:
+            registers = np.zeros(self.num_registers, dtype=np.uint8)
+        assert len(registers) == self.num_registers, "Sketch has the wrong number of registers"
+        self.registers = registers
+
+    def add(self, item):
+        digest = hashlib.blake2b(item.encode('utf8'), digest_size=self.HASH_BITS // 8).digest()
+        value = int.from_bytes(digest, 'big')
+        remaining_bits = self.HASH_BITS - self.PRECISION
+        register = value >> remaining_bits
+        rest = value & ((1 << remaining_bits) - 1)
+        rank = remaining_bits - rest.bit_length() + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def merge(self, other):
+        """Adds all of other's items to this sketch"""
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        m = self.num_registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        empty = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and empty:
+            # Few items, so count the empty registers instead (linear counting)
+            estimate = m * np.log(m / empty)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        """The sketch, compressed, mostly empty sketches are much smaller"""
+        return zlib.compress(self.registers.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(np.frombuffer(zlib.decompress(bytes(data)), dtype=np.uint8).copy())
+
+    @classmethod
+    def union(cls, sketches):
+        result = cls()
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
@@ -0,0 +1,93 @@
+import os
+import copy
+import json
+import queue
+import logging
+import logging.handlers
+
+
+# The attributes every LogRecord has, the others were passed in extra
+_RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats each record as a line of JSON.
+
+    If the record was logged with extra={'data': {...}} then the data is written, otherwise the
+    message is.
+    """
+
+    def format(self, record):
+        line = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+        }
+        data = getattr(record, 'data', None)
+        if data is not None:
+            line.update(data)
+        else:
+            line['message'] = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line['exception'] = record.exc_text
+        return json.dumps(line, sort_keys=True, default=str)
+
+
+class BackgroundFileHandler(logging.handlers.QueueHandler):
+    """A FileHandler which formats and writes the records in a background thread.
+
+    Logging just puts the record on a queue, so requests don't wait for the disk. The thread is
+    started the first time something is logged (in each process, so it's safe to fork), and is
+    stopped, after writing everything that's still queued, when logging shuts down.
+    """
+
+    def __init__(self, filename, encoding='utf8'):
+        super().__init__(queue.Queue())
+        self.file_handler = logging.FileHandler(filename, encoding=encoding, delay=True)
+        self._listener = None
+        self._listener_pid = None
+
+    def setFormatter(self, fmt):
+        # The formatting is done by the file handler, in the background
+        self.file_handler.setFormatter(fmt)
+
+    def prepare(self, record):
+        """Makes a copy of the record which is safe to format later, in the other thread.
+
+        The values passed in extra are serialised here, as the dicts and lists in them may be
+        changed by the thread which logged them.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        for name, value in list(vars(record).items()):
+            if name not in _RECORD_ATTRIBUTES:
+                setattr(record, name, json.loads(json.dumps(value, default=str)))
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        if self._listener_pid != os.getpid():
+            self._start_listener()
+        super().emit(record)
+
+    def _start_listener(self):
+        self.acquire()
+        try:
+            if self._listener_pid != os.getpid():
+                self._listener = logging.handlers.QueueListener(self.queue, self.file_handler)
+                self._listener.start()
+                self._listener_pid = os.getpid()
+        finally:
+            self.release()
+
+    def close(self):
+        if self._listener and self._listener_pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+            self._listener_pid = None
+        self.file_handler.close()
+        super().close()
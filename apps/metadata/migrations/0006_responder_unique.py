@@ -0,0 +1,32 @@
+# Generated by Django 2.1.3 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+def merge_duplicate_responders(apps, schema_editor):
+    """Racing requests could create more than one row for a responder, add them together"""
+    ResponderUse = apps.get_model('metadata', 'ResponderUse')
+    first_uses = {}
+    for use in ResponderUse.objects.order_by('date_created', 'pk'):
+        first = first_uses.setdefault(use.responder, use)
+        if first is not use:
+            first.total_uses += use.total_uses
+            first.date_modified = max(first.date_modified, use.date_modified)
+            first.save()
+            use.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metadata', '0005_auto_20180203_1748'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_responders, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='responderuse',
+            name='responder',
+            field=models.CharField(db_index=True, max_length=32, unique=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.1.3 on 2026-10-18 10:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metadata', '0006_responder_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUsers',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True, unique=True)),
+                ('sketch_data', models.BinaryField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.1.3 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metadata', '0007_dailyusers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advantagesupdate',
+            name='generation_data',
+            field=models.BinaryField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='advantagesupdate',
+            name='is_active',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.1.3 on 2026-10-18 16:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metadata', '0008_advantagesupdate_generation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advantagesupdate',
+            name='last_checkpoint',
+            field=models.DateTimeField(default=None, null=True),
+        ),
+        migrations.AddField(
+            model_name='advantagesupdate',
+            name='progress_data',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.CreateModel(
+            name='UpdateLock',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, unique=True)),
+                ('heartbeat', models.DateTimeField(default=None, null=True)),
+                ('update', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, to='metadata.AdvantagesUpdate')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.3 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metadata', '0009_update_progress_and_lock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advantagesupdate',
+            name='metrics_data',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -1,37 +1,214 @@
-from django.db import models
+import json
+import time
+import datetime
+import threading
+
+from django.db import DatabaseError, IntegrityError, models, transaction
 from django.conf import settings
 from django.utils import timezone
 
+from apps.utils.upsert import upsert
+from apps.utils.stages import StageMetrics
+
+from .usage import usage_counters
+from .generation import Generation
+from .hyperloglog import HyperLogLog
+
+
+# The stages of an update run concurrently, and checkpoint their progress in the same row
+_progress_lock = threading.Lock()
+
 
 class AdvantagesUpdate(models.Model):
+    """A run of update_heroes.
+
+    When it finishes, the data it loaded can be saved with it as a Generation, which is then
+    served until the next update is activated. The last KEEP_GENERATIONS generations are kept,
+    so the previous data can be activated again.
+
+    The stages it has finished, and the heroes done in each stage, are checkpointed as it goes,
+    so an update which fails part way through can be resumed. The StageMetrics of each stage
+    are saved with it when the stage finishes.
+    """
+    KEEP_GENERATIONS = 3
+
     update_started = models.DateTimeField(default=timezone.now, unique=True)
     update_finished = models.DateTimeField(default=None, null=True, unique=True)
+    is_active = models.BooleanField(default=False)
+    generation_data = models.BinaryField(default=None, null=True, editable=False)
+    progress_data = models.TextField(blank=True, default='')  # JSON, see progress
+    last_checkpoint = models.DateTimeField(default=None, null=True)
+    metrics_data = models.TextField(blank=True, default='')  # JSON, see stage_metrics
+
+    def __str__(self):
+        return 'Update started {}'.format(self.update_started)
 
     @staticmethod
     def last_update():
         return AdvantagesUpdate.objects.order_by('update_started').last()
 
+    @staticmethod
+    def last_finished_update():
+        return AdvantagesUpdate.objects.exclude(
+            update_finished=None).order_by('update_finished').last()
+
+    @staticmethod
+    def active_update():
+        """The update whose data is served, the last to finish if none has been activated"""
+        updates = AdvantagesUpdate.objects.defer('generation_data')
+        active = updates.filter(is_active=True).first()
+        return active or updates.exclude(update_finished=None).order_by('update_finished').last()
+
     @classmethod
     def last_update_time(cls):
         if AdvantagesUpdate.objects.count() == 0:
             return timezone.datetime(1970, 1, 1)
         return cls.last_update().update_started.replace(tzinfo=None)
 
-    @classmethod
-    def update_in_progress(cls):
-        return cls.update_finished is None
+    @staticmethod
+    def update_in_progress():
+        """Whether an update is running, i.e. holds the UpdateLock"""
+        return UpdateLock.holder() is not None
 
     @classmethod
     def start_new_update(cls):
-        AdvantagesUpdate.objects.create()
+        return AdvantagesUpdate.objects.create()
 
     @classmethod
-    def finish_current_update(cls):
+    def resumable_update(cls):
+        """The last update, if it didn't finish, None otherwise"""
         last_update = cls.last_update()
-        if last_update.update_finished:
+        if last_update is None or last_update.update_finished:
+            return None
+        return last_update
+
+    @classmethod
+    def finish_current_update(cls, models=()):
+        cls.last_update().finish(models)
+
+    def finish(self, models=()):
+        """Finishes the update, saving the tables of models as its generation and activating it"""
+        if self.update_finished:
             raise Exception("current update already finished")
-        last_update.update_finished = timezone.datetime.now()
-        last_update.save()
+        if models:
+            self.generation_data = Generation.from_database(models).to_bytes()
+        self.update_finished = timezone.datetime.now()
+        self.save()
+        self.activate()
+
+    @property
+    def progress(self):
+        """The stages finished, and the heroes done in each unfinished stage, as a dict of
+        {'stages': [stage, ...], 'heroes': {stage: [hero_name, ...]}}
+        """
+        progress = json.loads(self.progress_data or '{}')
+        progress.setdefault('stages', [])
+        progress.setdefault('heroes', {})
+        return progress
+
+    def stage_is_finished(self, stage):
+        return stage in self.progress['stages']
+
+    def finish_stage(self, stage, metrics=None):
+        with _progress_lock:
+            progress = self.progress
+            progress['stages'].append(stage)
+            progress['heroes'].pop(stage, None)
+            if metrics is not None:
+                all_metrics = json.loads(self.metrics_data or '{}')
+                all_metrics[stage] = metrics.as_dict()
+                self.metrics_data = json.dumps(all_metrics)
+            self._save_progress(progress)
+
+    @property
+    def stage_metrics(self):
+        """The StageMetrics of each finished stage, {stage: StageMetrics}"""
+        return {
+            stage: StageMetrics.from_dict(metrics)
+            for stage, metrics in json.loads(self.metrics_data or '{}').items()
+        }
+
+    def heroes_done(self, stage):
+        """The names of the heroes done so far in the stage"""
+        return set(self.progress['heroes'].get(stage, []))
+
+    def hero_done(self, stage, hero_name):
+        """Records that a hero has been saved in the stage, so a resumed update can skip it"""
+        with _progress_lock:
+            progress = self.progress
+            progress['heroes'].setdefault(stage, []).append(hero_name)
+            self._save_progress(progress)
+
+    def _save_progress(self, progress):
+        self.progress_data = json.dumps(progress)
+        self.last_checkpoint = timezone.now()
+        self.save(update_fields=['progress_data', 'metrics_data', 'last_checkpoint'])
+        UpdateLock.objects.filter(update=self).update(heartbeat=self.last_checkpoint)
+
+    def activate(self):
+        """Serves the data of this update, switching from the active one in one transaction"""
+        if not self.update_finished:
+            raise Exception("can't activate an unfinished update")
+        with transaction.atomic():
+            AdvantagesUpdate.objects.filter(is_active=True).update(is_active=False)
+            AdvantagesUpdate.objects.filter(pk=self.pk).update(is_active=True)
+        self.is_active = True
+        self._delete_old_generations()
+
+    @staticmethod
+    def _delete_old_generations():
+        with_generations = AdvantagesUpdate.objects.exclude(generation_data=None)
+        keep = list(with_generations.order_by('-update_finished').values_list(
+            'pk', flat=True)[:AdvantagesUpdate.KEEP_GENERATIONS])
+        with_generations.exclude(pk__in=keep).exclude(is_active=True).update(
+            generation_data=None)
+
+    @property
+    def generation(self):
+        """The Generation saved when the update finished, None if there isn't one"""
+        if self.generation_data is None:
+            return None
+        return Generation.from_bytes(self.generation_data)
+
+
+class UpdateLock(models.Model):
+    """Stops two updates running at once.
+
+    There's a single row, the update holding the lock is set on it. Each checkpoint of the
+    update refreshes the heartbeat, if it's not refreshed for STALE_AFTER the update is assumed
+    to have died, and another can take the lock.
+    """
+    NAME = 'update_heroes'
+    STALE_AFTER = datetime.timedelta(minutes=30)
+
+    name = models.CharField(max_length=32, unique=True)
+    update = models.ForeignKey(
+        AdvantagesUpdate, null=True, blank=True, default=None, on_delete=models.SET_NULL)
+    heartbeat = models.DateTimeField(default=None, null=True)
+
+    @classmethod
+    def acquire(cls, update):
+        """Takes the lock for the update, returns False if another update holds it"""
+        now = timezone.now()
+        cls.objects.get_or_create(name=cls.NAME)
+        # A single conditional UPDATE, so only one of several updates can take the lock
+        taken = cls.objects.filter(name=cls.NAME).filter(
+            models.Q(update=None) | models.Q(update=update) |
+            models.Q(heartbeat__lt=now - cls.STALE_AFTER)
+        ).update(update=update, heartbeat=now)
+        return taken == 1
+
+    @classmethod
+    def release(cls, update):
+        cls.objects.filter(name=cls.NAME, update=update).update(update=None, heartbeat=None)
+
+    @classmethod
+    def holder(cls):
+        """The update holding the lock, None if it's free or the holder's gone stale"""
+        lock = cls.objects.filter(
+            name=cls.NAME, heartbeat__gte=timezone.now() - cls.STALE_AFTER).exclude(
+            update=None).select_related('update').defer('update__generation_data').first()
+        return lock.update if lock else None
 
 
 class User(models.Model):
@@ -42,21 +219,115 @@ class User(models.Model):
 
     @staticmethod
     def log_user(user_id):
-        if not User.objects.filter(user_id=user_id).exists():
-            User.objects.create(user_id=user_id)
-        else:
-            User.objects.filter(
-                user_id=user_id
-            ).update(
-                total_questions=models.F('total_questions') + 1,
-                date_modified=timezone.now(),
-            )
+        """Counts a question from the user, the count is saved later by usage_counters.
+
+        The user is always counted in the DailyUsers sketch, they only get a row in this table
+        if settings.LOG_EXACT_USERS is set.
+        """
+        usage_counters.log_user(user_id, exact=settings.LOG_EXACT_USERS)
+
+    @staticmethod
+    def add_questions(questions):
+        """Adds to the users' total_questions, questions is a {user_id: number_of_questions}"""
+        now = timezone.now()
+        upsert(
+            User,
+            [
+                {
+                    'user_id': user_id,
+                    'total_questions': total,
+                    'date_created': now,
+                    'date_modified': now,
+                }
+                for user_id, total in questions.items()
+            ],
+            key='user_id',
+            increment=['total_questions'],
+            replace=['date_modified'])
 
     @staticmethod
     def should_log_user(user_id):
         return user_id not in settings.USERS_NOT_TO_LOG
 
 
+class DailyUsers(models.Model):
+    """A HyperLogLog sketch of the users who asked a question on a day, to count unique users"""
+    date = models.DateField(unique=True, db_index=True)
+    sketch_data = models.BinaryField()
+
+    @property
+    def sketch(self):
+        return HyperLogLog.from_bytes(self.sketch_data)
+
+    @property
+    def unique_users(self):
+        return self.sketch.count()
+
+    # How many times to try merging a sketch, and the wait before the first retry, which doubles
+    # each time
+    MERGE_ATTEMPTS = 5
+    MERGE_RETRY_SECONDS = 0.01
+
+    @staticmethod
+    def add_sketches(sketches):
+        """Merges the users in sketches, a {date: HyperLogLog}, into the stored sketches.
+
+        Other processes can be merging into the same day's sketch, and SQLite can't lock the row,
+        so the merged sketch is only written if the stored one hasn't changed since it was read.
+        If it has, it's read and merged again, a few times, then DatabaseError is raised so that
+        the sketch can be merged later.
+        """
+        for date, sketch in sketches.items():
+            for attempt in range(DailyUsers.MERGE_ATTEMPTS):
+                if attempt:
+                    time.sleep(DailyUsers.MERGE_RETRY_SECONDS * 2 ** (attempt - 1))
+                if DailyUsers._merge_sketch(date, sketch):
+                    break
+            else:
+                raise DatabaseError(
+                    "The users sketch for {} kept changing while merging into it".format(date))
+
+    @staticmethod
+    def _merge_sketch(date, sketch):
+        """Whether the sketch was merged into the day's, False if another process wrote it first"""
+        stored_data = DailyUsers.objects.filter(date=date).values_list(
+            'sketch_data', flat=True).first()
+        if stored_data is None:
+            try:
+                with transaction.atomic():
+                    DailyUsers.objects.create(date=date, sketch_data=sketch.to_bytes())
+            except IntegrityError:
+                return False
+            return True
+        stored_data = bytes(stored_data)
+        stored = HyperLogLog.from_bytes(stored_data)
+        stored.merge(sketch)
+        return DailyUsers.objects.filter(date=date, sketch_data=stored_data).update(
+            sketch_data=stored.to_bytes()) == 1
+
+    @staticmethod
+    def count_unique_users(days=1, last_day=None):
+        """The approximate number of unique users over the days up to and including last_day"""
+        if last_day is None:
+            last_day = timezone.datetime.today().date()
+        first_day = last_day - timezone.timedelta(days=days - 1)
+        sketches = DailyUsers.objects.filter(
+            date__gte=first_day, date__lte=last_day).values_list('sketch_data', flat=True)
+        return HyperLogLog.union(HyperLogLog.from_bytes(s) for s in sketches).count()
+
+    @staticmethod
+    def unique_users_today():
+        return DailyUsers.count_unique_users(days=1)
+
+    @staticmethod
+    def unique_users_this_week():
+        return DailyUsers.count_unique_users(days=7)
+
+    @staticmethod
+    def unique_users_this_month():
+        return DailyUsers.count_unique_users(days=30)
+
+
 class DailyUse(models.Model):
     date = models.DateField(unique=True, db_index=True)
     total_uses = models.IntegerField(default=0)
@@ -67,18 +338,24 @@ class DailyUse(models.Model):
     def log_use(success, user_id):
         if not User.should_log_user(user_id):
             return
-        today = timezone.datetime.today()
-        if not DailyUse.objects.filter(date=today).exists():
-            DailyUse.objects.create(date=today)
-        DailyUse.objects.filter(date=today).update(
-            total_uses=models.F('total_uses') + 1,
-            total_successes=models.F('total_successes') + (1 if success else 0),
-            total_failures=models.F('total_failures') + (0 if success else 1),
-        )
+        usage_counters.log_daily_use(success)
+
+    @staticmethod
+    def add_uses(daily_uses):
+        """Adds to the daily totals, daily_uses is a {date: {'total_uses': ..., ...}}"""
+        increment = ['total_uses', 'total_successes', 'total_failures']
+        upsert(
+            DailyUse,
+            [
+                dict({'date': date}, **{f: uses.get(f, 0) for f in increment})
+                for date, uses in daily_uses.items()
+            ],
+            key='date',
+            increment=increment)
 
 
 class ResponderUse(models.Model):
-    responder = models.CharField(max_length=32, db_index=True)
+    responder = models.CharField(max_length=32, unique=True, db_index=True)
     total_uses = models.IntegerField(default=1)
     date_created = models.DateTimeField(auto_now_add=True)
     date_modified = models.DateTimeField(auto_now=True)
@@ -87,12 +364,23 @@ class ResponderUse(models.Model):
     def log_use(responder, user_id):
         if not User.should_log_user(user_id):
             return
-        if not ResponderUse.objects.filter(responder=responder).exists():
-            ResponderUse.objects.create(responder=responder)
-        else:
-            ResponderUse.objects.filter(
-                responder=responder
-            ).update(
-                total_uses=models.F('total_uses') + 1,
-                date_modified=timezone.now(),
-            )
+        usage_counters.log_responder_use(responder)
+
+    @staticmethod
+    def add_uses(responder_uses):
+        """Adds to the responders' total_uses, responder_uses is a {responder: number_of_uses}"""
+        now = timezone.now()
+        upsert(
+            ResponderUse,
+            [
+                {
+                    'responder': responder,
+                    'total_uses': total,
+                    'date_created': now,
+                    'date_modified': now,
+                }
+                for responder, total in responder_uses.items()
+            ],
+            key='responder',
+            increment=['total_uses'],
+            replace=['date_modified'])
@@ -0,0 +1,127 @@
+import abc
+import time
+import logging
+
+from django.db.models.signals import post_save, post_delete
+
+from .models import AdvantagesUpdate
+
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot(abc.ABC):
+    """Base class for read-only, in-memory copies of the hero data.
+
+    The data only changes when update_heroes runs, so rather than querying the database for every
+    request we load it once per process. Subclasses implement load(), and use current() to get the
+    snapshot. It's reloaded when another AdvantagesUpdate is activated (checked at most every
+    UPDATE_CHECK_INTERVAL seconds).
+
+    load() should get the data with instances() and values_list(), which read the active update's
+    Generation, so a snapshot never sees the tables while update_heroes is half way through them.
+    This means edits to the tables, e.g. in the admin, are only served once the next update
+    finishes and saves them in its generation. Only when a model is read from its table (there's
+    no active generation, or it doesn't have the model) does this process saving one of the
+    models passed to invalidate_on_change() reload the snapshot.
+    """
+
+    UPDATE_CHECK_INTERVAL = 30
+
+    _current = None
+    _current_key = None
+    _last_checked = 0
+    # The models the current snapshot read from their tables, rather than the generation
+    _tables_read = frozenset()
+
+    # The Generation last read, shared by all the snapshots, as (update pk, generation)
+    _generation = (None, None)
+
+    @classmethod
+    @abc.abstractmethod
+    def load(cls):
+        """A new snapshot of the data"""
+
+    @classmethod
+    def current(cls):
+        """The snapshot of the latest data, loading it if it's out of date"""
+        now = time.time()
+        if cls._current is None or now - cls._last_checked > cls.UPDATE_CHECK_INTERVAL:
+            key = cls._update_key()
+            cls._last_checked = now
+            if cls._current is None or key != cls._current_key:
+                logger.info("Loading %s for update %s", cls.__name__, key)
+                cls._current_key = key
+                cls._tables_read = frozenset()
+                cls._current = cls.load()
+        return cls._current
+
+    @staticmethod
+    def _update_key():
+        update = AdvantagesUpdate.active_update()
+        if not update:
+            return None
+        return update.pk, update.update_finished
+
+    @staticmethod
+    def active_generation():
+        """The Generation of the active update, None if it doesn't have one"""
+        update = AdvantagesUpdate.active_update()
+        if update is None:
+            return None
+        pk, generation = Snapshot._generation
+        if pk != update.pk:
+            generation = update.generation
+            Snapshot._generation = (update.pk, generation)
+        return generation
+
+    @classmethod
+    def instances(cls, model):
+        """The model's instances in pk order, from the active generation if it has them"""
+        generation = cls._generation_with(model)
+        if generation is None:
+            return list(model.objects.order_by('pk'))
+        return generation.instances(model)
+
+    @classmethod
+    def values_list(cls, model, *fields):
+        """The values of the fields (attnames, e.g. hero_id) of the model's rows, as tuples"""
+        generation = cls._generation_with(model)
+        if generation is None:
+            return list(model.objects.order_by('pk').values_list(*fields))
+        return generation.values_list(model, *fields)
+
+    @classmethod
+    def _generation_with(cls, model):
+        generation = cls.active_generation()
+        if generation is None:
+            cls._tables_read = cls._tables_read | {model}
+            return None
+        if model not in generation:
+            logger.warning(
+                "The active generation doesn't have the current %s fields, using the table",
+                model._meta.label)
+            cls._tables_read = cls._tables_read | {model}
+            return None
+        return generation
+
+    @classmethod
+    def invalidate(cls, **kwargs):
+        """Forces the snapshot to be reloaded the next time it is used"""
+        cls._current = None
+        Snapshot._generation = (None, None)
+
+    @classmethod
+    def invalidate_on_change(cls, *models):
+        """Reloads the snapshot when this process saves or deletes one of the models, if the
+        snapshot read it from its table. Changes to a model read from the generation aren't served
+        until the next update.
+        """
+        for model in models:
+            post_save.connect(cls._table_changed, sender=model)
+            post_delete.connect(cls._table_changed, sender=model)
+
+    @classmethod
+    def _table_changed(cls, sender, **kwargs):
+        if sender in cls._tables_read:
+            cls.invalidate()
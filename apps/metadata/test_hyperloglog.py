@@ -0,0 +1,35 @@
+from unittest import TestCase
+
+from .hyperloglog import HyperLogLog
+
+
+class TestHyperLogLog(TestCase):
+    def sketch(self, items):
+        sketch = HyperLogLog()
+        for item in items:
+            sketch.add(item)
+        return sketch
+
+    def test_empty(self):
+        assert HyperLogLog().count() == 0
+
+    def test_small_counts_are_exact(self):
+        assert self.sketch(['a', 'b', 'c', 'a', 'b']).count() == 3
+
+    def test_large_counts_are_close(self):
+        count = self.sketch('user{}'.format(i) for i in range(100000)).count()
+        assert abs(count - 100000) < 100000 * 0.05
+
+    def test_merge_counts_the_union(self):
+        first = self.sketch('user{}'.format(i) for i in range(0, 6000))
+        second = self.sketch('user{}'.format(i) for i in range(4000, 10000))
+        union = HyperLogLog.union([first, second])
+        assert abs(union.count() - 10000) < 10000 * 0.05
+        # merging doesn't change the sketches being merged
+        assert abs(first.count() - 6000) < 6000 * 0.05
+
+    def test_serialisation(self):
+        sketch = self.sketch('user{}'.format(i) for i in range(1000))
+        data = sketch.to_bytes()
+        assert len(data) < len(sketch.registers)
+        assert HyperLogLog.from_bytes(memoryview(data)).count() == sketch.count()
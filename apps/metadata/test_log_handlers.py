@@ -0,0 +1,65 @@
+import os
+import json
+import logging
+import tempfile
+from unittest import TestCase
+
+from .log_handlers import BackgroundFileHandler, JsonLinesFormatter
+
+
+class TestBackgroundFileHandler(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filename = os.path.join(directory.name, 'test.jsonl')
+
+        self.handler = BackgroundFileHandler(self.filename)
+        self.handler.setFormatter(JsonLinesFormatter())
+        self.logger = logging.getLogger('test_background_file_handler')
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def read_lines(self):
+        with open(self.filename) as f:
+            return [json.loads(line) for line in f]
+
+    def test_writes_json_lines(self):
+        data = {'question': 'who counters sniper', 'heroes': ['Sniper']}
+        self.logger.warning("Question: %s", 'who counters sniper', extra={'data': data})
+        self.logger.warning("No data %s", 1)
+        self.handler.close()
+
+        first, second = self.read_lines()
+        assert first['question'] == 'who counters sniper'
+        assert first['heroes'] == ['Sniper']
+        assert first['level'] == 'WARNING'
+        assert second['message'] == 'No data 1'
+
+    def test_writes_the_data_as_it_was_logged(self):
+        data = {'question': 'who counters sniper', 'heroes': ['Sniper']}
+        # Keeps the background thread from writing until the data has been changed
+        self.handler.file_handler.acquire()
+        try:
+            self.logger.warning("Question", extra={'data': data})
+            data['heroes'].append('Axe')
+        finally:
+            self.handler.file_handler.release()
+        self.handler.close()
+
+        line, = self.read_lines()
+        assert line['heroes'] == ['Sniper']
+
+    def test_writes_exceptions(self):
+        try:
+            raise ValueError("oops")
+        except ValueError:
+            self.logger.exception("Failed")
+        self.handler.close()
+
+        line, = self.read_lines()
+        assert 'ValueError: oops' in line['exception']
+
+    def test_nothing_written_until_used(self):
+        self.handler.close()
+        assert not os.path.exists(self.filename)
@@ -1,10 +1,19 @@
+import time
 import pytest
 import datetime
-from django.test import TestCase
+from unittest.mock import patch
 
-from .models import AdvantagesUpdate
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+
+from .models import AdvantagesUpdate, UpdateLock, User, DailyUsers, DailyUse, ResponderUse
+from .usage import usage_counters
+from .hyperloglog import HyperLogLog
 
 from .factories import AdvantagesUpdateFactory
+from apps.utils.stages import StageMetrics
 
 
 @pytest.mark.django_db
@@ -21,3 +30,243 @@ class TestModels(TestCase):
         AdvantagesUpdateFactory(update_started=datetime.datetime(2017, 1, 2))
 
         assert AdvantagesUpdate.last_update_time().day == 3
+
+
+@pytest.mark.django_db
+class TestUpdateLock(TestCase):
+    def test_only_one_update_holds_the_lock(self):
+        first = AdvantagesUpdate.start_new_update()
+        second = AdvantagesUpdate.start_new_update()
+
+        assert not AdvantagesUpdate.update_in_progress()
+        assert UpdateLock.acquire(first)
+        assert UpdateLock.acquire(first)
+        assert not UpdateLock.acquire(second)
+        assert UpdateLock.holder() == first
+        assert AdvantagesUpdate.update_in_progress()
+
+        UpdateLock.release(second)
+        assert UpdateLock.holder() == first
+        UpdateLock.release(first)
+        assert not AdvantagesUpdate.update_in_progress()
+        assert UpdateLock.acquire(second)
+
+    def test_stale_lock_can_be_taken(self):
+        first = AdvantagesUpdate.start_new_update()
+        second = AdvantagesUpdate.start_new_update()
+        UpdateLock.acquire(first)
+        UpdateLock.objects.update(
+            heartbeat=timezone.now() - UpdateLock.STALE_AFTER - datetime.timedelta(seconds=1))
+
+        assert UpdateLock.holder() is None
+        assert UpdateLock.acquire(second)
+        assert UpdateLock.holder() == second
+
+    def test_checkpoints_refresh_the_heartbeat(self):
+        update = AdvantagesUpdate.start_new_update()
+        UpdateLock.acquire(update)
+        UpdateLock.objects.update(heartbeat=timezone.now() - UpdateLock.STALE_AFTER)
+
+        update.hero_done('advantages', 'Axe')
+
+        assert UpdateLock.holder() == update
+
+
+@pytest.mark.django_db
+class TestUpdateProgress(TestCase):
+    def test_progress_is_checkpointed(self):
+        update = AdvantagesUpdate.start_new_update()
+        update.finish_stage('heroes')
+        update.hero_done('advantages', 'Axe')
+        update.hero_done('advantages', 'Io')
+
+        update = AdvantagesUpdate.resumable_update()
+        assert update.stage_is_finished('heroes')
+        assert not update.stage_is_finished('advantages')
+        assert update.heroes_done('advantages') == {'Axe', 'Io'}
+        assert update.last_checkpoint is not None
+
+        update.finish_stage('advantages')
+        assert update.stage_is_finished('advantages')
+        assert update.heroes_done('advantages') == set()
+
+    def test_stage_metrics_are_saved(self):
+        update = AdvantagesUpdate.start_new_update()
+        update.finish_stage('heroes', StageMetrics(wall_seconds=1.5, inserted=3))
+        update.finish_stage('roles')
+
+        metrics = AdvantagesUpdate.objects.get(pk=update.pk).stage_metrics
+        assert list(metrics) == ['heroes']
+        assert metrics['heroes'].wall_seconds == 1.5
+        assert metrics['heroes'].counts['inserted'] == 3
+
+    def test_finished_updates_are_not_resumed(self):
+        assert AdvantagesUpdate.resumable_update() is None
+        update = AdvantagesUpdate.start_new_update()
+        assert AdvantagesUpdate.resumable_update() == update
+        update.finish()
+        assert AdvantagesUpdate.resumable_update() is None
+
+
+@pytest.mark.django_db
+@override_settings(LOG_EXACT_USERS=True)
+class TestUsageCounters(TestCase):
+    def setUp(self):
+        usage_counters.clear()
+
+    def test_logging_does_not_query_the_database(self):
+        with self.assertNumQueries(0):
+            User.log_user('USERID')
+            DailyUse.log_use(success=True, user_id='USERID')
+            ResponderUse.log_use('AbilityDescriptionResponse', 'USERID')
+
+    def test_flush_creates_rows(self):
+        User.log_user('USERID')
+        User.log_user('USERID')
+        User.log_user('OTHER')
+        DailyUse.log_use(success=True, user_id='USERID')
+        DailyUse.log_use(success=False, user_id='USERID')
+        ResponderUse.log_use('AbilityDescriptionResponse', 'USERID')
+        with CaptureQueriesContext(connection) as queries:
+            usage_counters.flush()
+        assert len([q for q in queries if 'ON CONFLICT' in q['sql']]) == 3
+
+        assert User.objects.get(user_id='USERID').total_questions == 2
+        assert User.objects.get(user_id='OTHER').total_questions == 1
+        daily_use = DailyUse.objects.get()
+        assert daily_use.date == datetime.date.today()
+        assert (daily_use.total_uses, daily_use.total_successes, daily_use.total_failures) == (
+            2, 1, 1)
+        assert ResponderUse.objects.get(responder='AbilityDescriptionResponse').total_uses == 1
+
+    def test_flush_adds_to_existing_rows(self):
+        User.objects.create(user_id='USERID', total_questions=5)
+        DailyUse.objects.create(date=datetime.date.today(), total_uses=3, total_successes=3)
+        ResponderUse.objects.create(responder='AbilityDescriptionResponse', total_uses=7)
+
+        User.log_user('USERID')
+        DailyUse.log_use(success=False, user_id='USERID')
+        ResponderUse.log_use('AbilityDescriptionResponse', 'USERID')
+        usage_counters.flush()
+
+        assert User.objects.get(user_id='USERID').total_questions == 6
+        daily_use = DailyUse.objects.get()
+        assert (daily_use.total_uses, daily_use.total_successes, daily_use.total_failures) == (
+            4, 3, 1)
+        assert ResponderUse.objects.get(responder='AbilityDescriptionResponse').total_uses == 8
+
+    def test_flush_keeps_queries_under_the_parameter_limit(self):
+        ResponderUse.add_uses({'Responder{}'.format(i): 1 for i in range(1000)})
+        with CaptureQueriesContext(connection) as queries:
+            User.add_questions({'USER{}'.format(i): 1 for i in range(1000)})
+        # 4 fields a row, so 249 rows a query
+        assert len(queries) == 5
+        assert User.objects.count() == 1000
+        assert ResponderUse.objects.count() == 1000
+
+    def test_nothing_saved_while_paused(self):
+        ResponderUse.log_use('Before', 'USERID')
+        start = time.time()
+        # Well after the flush interval
+        with patch('apps.metadata.usage.time.time', lambda: start + 1000):
+            with usage_counters.paused():
+                ResponderUse.log_use('During', 'USERID')
+                usage_counters.flush()
+                assert not ResponderUse.objects.exists()
+        usage_counters.flush()
+        assert list(ResponderUse.objects.values_list('responder', flat=True)) == ['Before']
+
+    def test_flush_with_nothing_logged(self):
+        with self.assertNumQueries(0):
+            usage_counters.flush()
+
+    @patch('apps.metadata.models.settings')
+    def test_ignores_users_not_to_log(self, settings):
+        settings.USERS_NOT_TO_LOG = ['TESTER']
+        DailyUse.log_use(success=True, user_id='TESTER')
+        ResponderUse.log_use('AbilityDescriptionResponse', 'TESTER')
+        usage_counters.flush()
+        assert not DailyUse.objects.exists()
+        assert not ResponderUse.objects.exists()
+
+    def test_keeps_the_counts_if_saving_fails(self):
+        User.log_user('USERID')
+        with patch.object(User, 'add_questions', side_effect=DatabaseError):
+            usage_counters.flush()
+        assert not User.objects.exists()
+
+        usage_counters.flush()
+        assert User.objects.get(user_id='USERID').total_questions == 1
+
+
+@pytest.mark.django_db
+class TestDailyUsers(TestCase):
+    def setUp(self):
+        usage_counters.clear()
+
+    def test_counts_unique_users_without_user_rows(self):
+        for user_id in ('A', 'B', 'A', 'C', 'A'):
+            User.log_user(user_id)
+        usage_counters.flush()
+
+        assert DailyUsers.unique_users_today() == 3
+        assert DailyUsers.objects.get().unique_users == 3
+        assert not User.objects.exists()
+
+    def test_merges_with_the_stored_sketch(self):
+        User.log_user('A')
+        User.log_user('B')
+        usage_counters.flush()
+        User.log_user('B')
+        User.log_user('C')
+        usage_counters.flush()
+        assert DailyUsers.unique_users_today() == 3
+
+    def test_merges_sketches_written_meanwhile(self):
+        def sketch_of(*user_ids):
+            sketch = HyperLogLog()
+            for user_id in user_ids:
+                sketch.add(user_id)
+            return sketch
+
+        today = datetime.date.today()
+        DailyUsers.add_sketches({today: sketch_of('A')})
+        merge = HyperLogLog.merge
+
+        def other_process_merges_first(stored, sketch):
+            # Another process merges its users after this one read the stored sketch
+            if not DailyUsers.objects.filter(sketch_data=sketch_of('A', 'B').to_bytes()).exists():
+                DailyUsers.objects.update(sketch_data=sketch_of('A', 'B').to_bytes())
+            merge(stored, sketch)
+
+        with patch.object(HyperLogLog, 'merge', other_process_merges_first):
+            DailyUsers.add_sketches({today: sketch_of('C')})
+        assert DailyUsers.unique_users_today() == 3
+
+    def test_gives_up_merging_a_sketch_that_keeps_changing(self):
+        User.log_user('A')
+        usage_counters.flush()
+        User.log_user('B')
+        with patch.object(DailyUsers, '_merge_sketch', return_value=False) as merge_sketch, \
+                patch('apps.metadata.models.time.sleep') as sleep:
+            usage_counters.flush()
+        assert merge_sketch.call_count == DailyUsers.MERGE_ATTEMPTS
+        assert sleep.call_count == DailyUsers.MERGE_ATTEMPTS - 1
+
+        # The sketch is kept, and merged by the next flush
+        usage_counters.flush()
+        assert DailyUsers.unique_users_today() == 2
+
+    def test_counts_over_several_days(self):
+        today = datetime.date.today()
+        for days_ago, user_ids in ((0, 'AB'), (3, 'BC'), (10, 'DE'), (40, 'F')):
+            sketch = HyperLogLog()
+            for user_id in user_ids:
+                sketch.add(user_id)
+            DailyUsers.objects.create(
+                date=today - datetime.timedelta(days=days_ago), sketch_data=sketch.to_bytes())
+
+        assert DailyUsers.unique_users_today() == 2
+        assert DailyUsers.unique_users_this_week() == 3
+        assert DailyUsers.unique_users_this_month() == 5
+        assert DailyUsers.count_unique_users(days=1, last_day=today - datetime.timedelta(1)) == 0
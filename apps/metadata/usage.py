@@ -0,0 +1,127 @@
+import time
+import atexit
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.utils import timezone
+
+from .hyperloglog import HyperLogLog
+
+
+logger = logging.getLogger(__name__)
+
+
+class UsageCounters(object):
+    """Buffers the usage statistics in memory, and writes them to the database in batches.
+
+    Logging each question used to take several queries, now the counts are added up here and
+    written every FLUSH_INTERVAL seconds (and when the process exits) with one upsert per table.
+    The upserts add to the totals in the database, so several processes can share the tables.
+    """
+    FLUSH_INTERVAL = 30
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_flushed = time.time()
+        self._paused = False
+        self.clear()
+
+    def clear(self):
+        """Forgets the buffered counts without saving them"""
+        self.users = Counter()
+        # {date: HyperLogLog}
+        self.user_sketches = {}
+        # {date: Counter({'total_uses': ..., 'total_successes': ..., 'total_failures': ...})}
+        self.daily_uses = {}
+        self.responder_uses = Counter()
+
+    @contextmanager
+    def paused(self):
+        """Nothing is saved inside the block: the counts go on being added up, but aren't flushed,
+        and are thrown away at the end. Those counted before the block are kept for the next flush.
+        """
+        with self._lock:
+            if self._paused:
+                raise RuntimeError("The usage counters are already paused")
+            kept = (self.users, self.user_sketches, self.daily_uses, self.responder_uses)
+            self.clear()
+            self._paused = True
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.users, self.user_sketches, self.daily_uses, self.responder_uses = kept
+                self._paused = False
+
+    def log_user(self, user_id, exact=False):
+        """Counts the user in today's sketch, and if exact in their own row of the User table"""
+        today = timezone.datetime.today().date()
+        with self._lock:
+            self.user_sketches.setdefault(today, HyperLogLog()).add(user_id)
+            if exact:
+                self.users[user_id] += 1
+        self._flush_if_due()
+
+    def log_daily_use(self, success):
+        today = timezone.datetime.today().date()
+        with self._lock:
+            uses = self.daily_uses.setdefault(today, Counter())
+            uses['total_uses'] += 1
+            uses['total_successes' if success else 'total_failures'] += 1
+        self._flush_if_due()
+
+    def log_responder_use(self, responder):
+        with self._lock:
+            self.responder_uses[responder] += 1
+        self._flush_if_due()
+
+    def _flush_if_due(self):
+        if not self._paused and time.time() - self._last_flushed > self.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered counts to the database, unless the counters are paused()"""
+        from .models import User, DailyUsers, DailyUse, ResponderUse  # avoid circular import
+
+        with self._lock:
+            if self._paused:
+                return
+            self._last_flushed = time.time()
+            users, user_sketches = self.users, self.user_sketches
+            daily_uses, responder_uses = self.daily_uses, self.responder_uses
+            self.clear()
+        if not (users or user_sketches or daily_uses or responder_uses):
+            return
+
+        try:
+            with transaction.atomic():
+                User.add_questions(users)
+                DailyUsers.add_sketches(user_sketches)
+                DailyUse.add_uses(daily_uses)
+                ResponderUse.add_uses(responder_uses)
+        except Exception:
+            logger.exception("Failed to save the usage counts, will try again later")
+            with self._lock:
+                self.users.update(users)
+                for date, sketch in user_sketches.items():
+                    self.user_sketches.setdefault(date, HyperLogLog()).merge(sketch)
+                for date, uses in daily_uses.items():
+                    self.daily_uses.setdefault(date, Counter()).update(uses)
+                self.responder_uses.update(responder_uses)
+
+
+usage_counters = UsageCounters()
+
+
+def _flush_at_exit():
+    try:
+        usage_counters.flush()
+    except Exception:
+        # e.g. Django was never set up in this process
+        logger.exception("Failed to save the usage counts at exit")
+
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,70 @@
+import os
+import json
+import zlib
+import hashlib
+import tempfile
+from collections import namedtuple
+
+
+CachedPage = namedtuple('CachedPage', ('content', 'etag', 'last_modified'))
+
+
+def write_atomically(path, data):
+    """Writes the bytes to the file at path, creating its directory if needed.
+
+    They're written to a temporary file which then replaces the file, so readers never see it half
+    written. The temporary file is removed if anything goes wrong.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class HttpCache(object):
+    """Stores fetched pages on disk, compressed, with the headers needed to revalidate them.
+
+    Each URL has a file named by the hash of the URL, containing a line of JSON with the URL, ETag
+    and Last-Modified headers, followed by the zlib compressed content. Files are replaced
+    atomically, so a crash can't leave a half written page.
+    """
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+
+    def _path(self, url):
+        key = hashlib.sha256(url.encode('utf8')).hexdigest()
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, url):
+        """The CachedPage for url, None if it isn't cached"""
+        try:
+            with open(self._path(url), 'rb') as f:
+                headers = json.loads(f.readline().decode('utf8'))
+                content = zlib.decompress(f.read())
+        except (OSError, ValueError, zlib.error):
+            return None
+        if headers.get('url') != url:
+            return None
+        return CachedPage(content, headers.get('etag'), headers.get('last_modified'))
+
+    def set(self, url, content, etag=None, last_modified=None):
+        headers = {'url': url, 'etag': etag, 'last_modified': last_modified}
+        data = json.dumps(headers, sort_keys=True).encode('utf8') + b'\n' + zlib.compress(content)
+        write_atomically(self._path(url), data)
+
+    @staticmethod
+    def revalidation_headers(page):
+        """The headers to ask the server to only send the page if it's changed"""
+        headers = {}
+        if page.etag:
+            headers['If-None-Match'] = page.etag
+        if page.last_modified:
+            headers['If-Modified-Since'] = page.last_modified
+        return headers
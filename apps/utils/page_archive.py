@@ -0,0 +1,97 @@
+import os
+import json
+import zlib
+import hashlib
+import threading
+
+from .http_cache import write_atomically
+from .request_handler import RequestHandler, Page
+
+
+class PageNotArchived(Exception):
+    pass
+
+
+class PageArchive(object):
+    """A directory of fetched pages, so an update can be run again without the web.
+
+    The pages are content addressed: each is stored once, zlib compressed, in a file named by the
+    SHA-256 of its content. index.jsonl has a line of JSON for each page fetched, with its URL and
+    hash, the last line for a URL wins. Lines are only appended, so an interrupted recording can
+    still be replayed.
+    """
+    INDEX = 'index.jsonl'
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        self._lock = threading.Lock()
+        self._index = None
+
+    @property
+    def index(self):
+        """{url: hash} of the pages in the archive"""
+        with self._lock:
+            if self._index is None:
+                self._index = self._read_index()
+            return self._index
+
+    def _read_index(self):
+        index = {}
+        try:
+            with open(os.path.join(self.directory, self.INDEX), encoding='utf8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        index[entry['url']] = entry['sha256']
+        except FileNotFoundError:
+            pass
+        return index
+
+    def _object_path(self, sha256):
+        return os.path.join(self.directory, 'objects', sha256[:2], sha256)
+
+    def add(self, url, content):
+        if isinstance(content, str):
+            content = content.encode('utf8')
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = self._object_path(sha256)
+        if not os.path.exists(path):
+            write_atomically(path, zlib.compress(content))
+
+        index = self.index
+        with self._lock:
+            with open(os.path.join(self.directory, self.INDEX), 'a', encoding='utf8') as f:
+                f.write(json.dumps({'url': url, 'sha256': sha256}) + '\n')
+            index[url] = sha256
+
+    def get(self, url):
+        try:
+            sha256 = self.index[url]
+        except KeyError:
+            raise PageNotArchived("{} isn't in the archive {}".format(url, self.directory))
+        with open(self._object_path(sha256), 'rb') as f:
+            return zlib.decompress(f.read())
+
+
+class RecordingRequestHandler(RequestHandler):
+    """A RequestHandler which adds every page it fetches to a PageArchive"""
+
+    def __init__(self, archive, **kwargs):
+        super().__init__(**kwargs)
+        self.archive = archive
+
+    def get_page(self, url):
+        page = super().get_page(url)
+        self.archive.add(url, page.content)
+        return page
+
+
+class ReplayRequestHandler(RequestHandler):
+    """A RequestHandler which gets the pages from a PageArchive, rather than the web"""
+
+    def __init__(self, archive, **kwargs):
+        super().__init__(**kwargs)
+        self.archive = archive
+
+    def get_page(self, url):
+        return Page(url, self.archive.get(url), unchanged=False, not_modified=False)
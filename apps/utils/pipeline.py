@@ -0,0 +1,211 @@
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, Future
+
+
+logger = logging.getLogger(__name__)
+
+
+class StageStats(object):
+    """How many items a stage has processed, and how long it spent working on them"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.items += 1
+            self.busy_seconds += seconds
+
+    def __str__(self):
+        return "{}: {} items, {:.2f}s busy".format(self.name, self.items, self.busy_seconds)
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+class _Failed(object):
+    def __init__(self, item, exception):
+        self.item = item
+        self.exception = exception
+
+
+_DONE = object()
+
+# Returned by fetch for items that don't need parsing or writing
+SKIP = object()
+
+
+class Pipeline(object):
+    """Fetches, parses and writes items in stages, connected by bounded queues.
+
+    Items are fetched by fetch_workers threads, and each fetched page is parsed by a pool of
+    parse_workers processes (os.cpu_count() of them by default). With parse_workers=1 the pages
+    are parsed in a thread instead, as one other process would only add the cost of pickling.
+    run() yields the parsed items as they finish parsing, for the caller to write, so the database
+    is only used from one thread, and a page that's slow to parse doesn't hold up the others. The
+    stages overlap, so the whole run takes about as long as the slowest stage. At most queue_size
+    items wait to be parsed, and at most queue_size are being parsed or waiting to be written.
+
+    fetch(item) can be any callable, and returns SKIP for items which needn't be parsed or
+    written, e.g. as their page hasn't changed. parse(page) must be a module level function that
+    returns something which can be pickled (e.g. plain dicts), as it runs in other processes.
+
+    The parse processes are started by a forkserver, rather than forked from this process, as
+    forking while the fetch threads hold locks (e.g. requests' or logging's) can deadlock the new
+    process. So parse's module is imported afresh in them, and mustn't need Django to be set up.
+    """
+    FETCH_WORKERS = 8
+    QUEUE_SIZE = 16
+
+    def __init__(self, name, fetch, parse, fetch_workers=None, parse_workers=None,
+                 queue_size=None):
+        self.name = name
+        self.fetch = fetch
+        self.parse = parse
+        self.fetch_workers = fetch_workers or self.FETCH_WORKERS
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size or self.QUEUE_SIZE
+        self.stats = {stage: StageStats(stage) for stage in ('fetch', 'parse', 'write')}
+        self.skipped = 0
+        self.wall_seconds = 0
+
+    def run(self, items):
+        """Yields (item, parsed) for each item, in the order they finish parsing"""
+        start = time.perf_counter()
+        items = list(items)
+        self._stop = threading.Event()
+        self._items = queue.Queue()
+        for item in items:
+            self._items.put(item)
+        self._fetched = queue.Queue(maxsize=self.queue_size)
+        # The parsed items, in the order they finish, the semaphore bounds how many there can be
+        self._parsed = queue.Queue()
+        self._parse_slots = threading.BoundedSemaphore(self.queue_size)
+
+        fetchers = [
+            threading.Thread(target=self._fetch_items, daemon=True)
+            for _ in range(min(self.fetch_workers, len(items)))
+        ]
+        if self.parse_workers == 1:
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(
+                max_workers=self.parse_workers,
+                mp_context=multiprocessing.get_context('forkserver'))
+        dispatcher = threading.Thread(
+            target=self._parse_items, args=(executor, len(fetchers)), daemon=True)
+        try:
+            for thread in fetchers + [dispatcher]:
+                thread.start()
+            for _ in range(len(items)):
+                item, parsed = self._next_parsed()
+                if parsed is SKIP:
+                    self.skipped += 1
+                    continue
+                write_start = time.perf_counter()
+                yield item, parsed
+                self.stats['write'].add(time.perf_counter() - write_start)
+        finally:
+            self._stop.set()
+            self._drain(self._fetched)
+            if executor:
+                executor.shutdown(wait=True)
+            self.wall_seconds = time.perf_counter() - start
+            logger.info("%s", self)
+
+    def _fetch_items(self):
+        while not self._stop.is_set():
+            try:
+                item = self._items.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                page, seconds = _timed(self.fetch, item)
+            except Exception as exc:
+                self._put(self._fetched, _Failed(item, exc))
+                break
+            self.stats['fetch'].add(seconds)
+            self._put(self._fetched, (item, page))
+        self._put(self._fetched, _DONE)
+
+    def _parse_items(self, executor, num_fetchers):
+        finished_fetchers = 0
+        while finished_fetchers < num_fetchers and not self._stop.is_set():
+            try:
+                # Not waiting forever, as once the pipeline is stopped nothing more is fetched
+                fetched = self._fetched.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if fetched is _DONE:
+                finished_fetchers += 1
+                continue
+            while not self._parse_slots.acquire(timeout=0.1):
+                if self._stop.is_set():
+                    return
+            if isinstance(fetched, _Failed):
+                self._parsed.put(fetched)
+                continue
+            item, page = fetched
+            if page is SKIP:
+                future = Future()
+                future.set_result((SKIP, 0))
+            elif executor:
+                future = executor.submit(_timed, self.parse, page)
+            else:
+                future = Future()
+                try:
+                    future.set_result(_timed(self.parse, page))
+                except Exception as exc:
+                    future.set_exception(exc)
+            future.add_done_callback(partial(self._finished_parsing, item))
+
+    def _finished_parsing(self, item, future):
+        # Called from the executor's thread, so mustn't block
+        self._parsed.put((item, future))
+
+    def _next_parsed(self):
+        finished = self._parsed.get()
+        self._parse_slots.release()
+        if isinstance(finished, _Failed):
+            raise finished.exception
+        item, future = finished
+        parsed, seconds = future.result()
+        if parsed is not SKIP:
+            self.stats['parse'].add(seconds)
+        return item, parsed
+
+    def _put(self, q, value):
+        """Puts value on the bounded queue, unless the pipeline is stopped while waiting"""
+        while not self._stop.is_set():
+            try:
+                q.put(value, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    @staticmethod
+    def _drain(q):
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                return
+
+    def __str__(self):
+        stages = ", ".join(
+            "{} ({:.1f}/s)".format(
+                stats, stats.items / self.wall_seconds if self.wall_seconds else 0)
+            for stats in self.stats.values())
+        return "{} pipeline took {:.2f}s, skipped {}. {}".format(
+            self.name, self.wall_seconds, self.skipped, stages)
@@ -1,53 +1,205 @@
 import io
 import time
 import logging
+import threading
 import requests
-from requests.exceptions import ConnectionError
+from requests.adapters import HTTPAdapter
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from requests.exceptions import ConnectionError, Timeout, HTTPError
 
 from bs4 import BeautifulSoup
 
+try:
+    import lxml  # noqa: F401
+    FAST_PARSER = 'lxml'
+except ImportError:
+    FAST_PARSER = 'html.parser'
+
+from .http_cache import HttpCache
+
 
 logger = logging.getLogger(__name__)
 
 
+HostLimit = namedtuple('HostLimit', ('concurrency', 'min_interval'))
+
+# unchanged is True if the page is the same as the last time it was fetched (it's cached), and
+# not_modified if the server said so (a 304), so the content came from the cache not the network
+Page = namedtuple('Page', ('url', 'content', 'unchanged', 'not_modified'))
+
+
+class HostLimiter(object):
+    """Limits the requests to a host: how many are in flight, and how close together they start"""
+
+    def __init__(self, limit):
+        self.min_interval = limit.min_interval
+        self._semaphore = threading.BoundedSemaphore(limit.concurrency)
+        self._lock = threading.Lock()
+        self._next_start = 0
+
+    @contextmanager
+    def request(self):
+        with self._semaphore:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._next_start - now
+                self._next_start = max(now, self._next_start) + self.min_interval
+            if wait > 0:
+                time.sleep(wait)
+            yield
+
+
 class RequestHandler(object):
+    """Fetches web pages, politely.
+
+    get_all() fetches pages in a pool of max_workers threads, but the requests to each host are
+    limited by its HostLimit, to at most concurrency at once, and min_interval seconds apart.
+
+    All the requests share one session, so connections to each host are kept alive and reused.
+    Requests which fail, time out or get a server error are retried after each of the sleeps.
+
+    If given an HttpCache, pages are stored in it, and the next time they're fetched the server is
+    asked to only send them if they've changed.
+    """
+    HEADERS = {
+        "User-Agent": (
+            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1)"
+            "AppleWebKit/537.36 (KHTML, like Gecko)"
+            "Chrome/39.0.2171.95 Safari/537.36"),
+        "Accept-Encoding": "gzip, deflate",
+    }
+    # (connect, read) in seconds
+    TIMEOUT = (10, 30)
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    MAX_WORKERS = 8
+    DEFAULT_HOST_LIMIT = HostLimit(concurrency=2, min_interval=0.5)
+    HOST_LIMITS = {
+        'www.dotabuff.com': HostLimit(concurrency=2, min_interval=1),
+        'dota2.gamepedia.com': HostLimit(concurrency=4, min_interval=0.25),
+    }
+
+    def __init__(self, max_workers=None, host_limits=None, cache=None):
+        self.max_workers = max_workers or self.MAX_WORKERS
+        self.cache = cache
+        self.host_limits = dict(self.HOST_LIMITS, **(host_limits or {}))
+        self._host_limiters = {}
+        self._host_limiters_lock = threading.Lock()
+        self.session = self._create_session()
+
+    def _create_session(self):
+        session = requests.Session()
+        session.headers.update(self.HEADERS)
+        # Enough connections for every worker to keep its own alive
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=self.max_workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
     @property
     def sleeps(self):
         return [1, 5, 15]
 
-    def get(self, url, retry=0):
-        headers = {
-            "User-Agent": (
-                "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1)"
-                "AppleWebKit/537.36 (KHTML, like Gecko)"
-                "Chrome/39.0.2171.95 Safari/537.36"),
-        }
-        try:
-            r = requests.get(url, headers=headers)
-        except ConnectionError:
-            if retry == len(self.sleeps):
-                raise
-            sleep_lenght = self.sleeps[retry]
-            logger.warning(
-                "CONNECTION ERROR LOADING %s, retrying after sleep of %s",
-                url,
-                sleep_lenght,
-            )
-            time.sleep(sleep_lenght)
-            return cls.get(url, retry + 1)
-        return r.content
-
-    def get_soup(self, url):
-        return BeautifulSoup(self.get(url), "html.parser")
+    def _host_limiter(self, url):
+        host = urlsplit(url).netloc
+        with self._host_limiters_lock:
+            if host not in self._host_limiters:
+                self._host_limiters[host] = HostLimiter(
+                    self.host_limits.get(host, self.DEFAULT_HOST_LIMIT))
+            return self._host_limiters[host]
+
+    def get(self, url):
+        return self.get_page(url).content
+
+    def get_page(self, url):
+        """Fetches the Page at url, from the cache if it hasn't changed"""
+        cached = self.cache.get(url) if self.cache else None
+        headers = HttpCache.revalidation_headers(cached) if cached else {}
+        r = self._fetch(url, headers)
+        if cached and r.status_code == 304:
+            return Page(url, cached.content, unchanged=True, not_modified=True)
+
+        if self.cache and r.status_code == 200:
+            self.cache.set(
+                url, r.content, r.headers.get('ETag'), r.headers.get('Last-Modified'))
+        unchanged = cached is not None and cached.content == r.content
+        return Page(url, r.content, unchanged, not_modified=False)
+
+    def _fetch(self, url, headers):
+        for retry, sleep_length in enumerate(self.sleeps + [None]):
+            try:
+                with self._host_limiter(url).request():
+                    r = self.session.get(url, headers=headers, timeout=self.TIMEOUT)
+                if r.status_code in self.RETRY_STATUS_CODES:
+                    r.raise_for_status()
+            except (ConnectionError, Timeout, HTTPError) as exc:
+                if sleep_length is None:
+                    raise
+                logger.warning(
+                    "ERROR LOADING %s (%s), retrying after sleep of %s", url, exc, sleep_length)
+                time.sleep(sleep_length)
+            else:
+                return r
+
+    def get_soup(self, url, parse_only=None):
+        return self._soup(self.get(url), parse_only)
+
+    @staticmethod
+    def _soup(content, parse_only=None):
+        """The parsed page.
+
+        If parse_only (a SoupStrainer) is given only the matching parts of the page are parsed,
+        with lxml if it's installed.
+        """
+        if parse_only is not None:
+            return BeautifulSoup(content, FAST_PARSER, parse_only=parse_only)
+        return BeautifulSoup(content, "html.parser")
+
+    def get_all_pages(self, urls):
+        """Fetches the Pages concurrently, yields them in the same order as urls"""
+        urls = list(urls)
+        if not urls:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as executor:
+            yield from executor.map(self.get_page, urls)
+
+    def get_all(self, urls):
+        """Fetches the pages concurrently, yields their contents in the same order as urls"""
+        for page in self.get_all_pages(urls):
+            yield page.content
+
+    def get_all_soups(self, urls, parse_only=None):
+        for content in self.get_all(urls):
+            yield self._soup(content, parse_only)
+
+
+class MeteredRequestHandler(RequestHandler):
+    """Gets the pages with another RequestHandler, adding each one to metrics (a StageMetrics)"""
+
+    def __init__(self, request_handler, metrics):
+        # Everything is fetched by request_handler, so this doesn't need a session of its own
+        self.request_handler = request_handler
+        self.metrics = metrics
+        self.max_workers = request_handler.max_workers
+        self.cache = request_handler.cache
+
+    def get_page(self, url):
+        page = self.request_handler.get_page(url)
+        self.metrics.add_page(page)
+        return page
 
 
 class MockRequestHandler(RequestHandler):
     def __init__(self, url_map, files_path):
+        super().__init__()
         self.url_map = url_map
         self.files_path = files_path
 
-    def get(self, url):
+    def get_page(self, url):
         filename = self.url_map[url]
         path = str(self.files_path.join(filename))
         with io.open(path, mode='r', encoding='utf8') as f:
-            return f.read()
+            return Page(url, f.read(), unchanged=False, not_modified=False)
@@ -0,0 +1,183 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+
+class Stage(object):
+    """A step of a job, run(), which can only start once the stages named in depends_on finish"""
+
+    def __init__(self, name, run, depends_on=()):
+        self.name = name
+        self.run = run
+        self.depends_on = tuple(depends_on)
+
+    def __repr__(self):
+        return 'Stage({!r})'.format(self.name)
+
+
+class StageMetrics(object):
+    """What a stage did: how long it took, the pages it got, the time spent parsing them, and the
+    rows it wrote. It can be added to from several threads.
+
+    Pages the server says haven't changed since they were cached count as cached, the others as
+    fetched, and only the fetched pages count towards bytes_fetched.
+    """
+    COUNTERS = (
+        'pages_fetched', 'pages_cached', 'bytes_fetched', 'parse_seconds',
+        'inserted', 'updated', 'unchanged', 'deleted', 'errors',
+    )
+
+    def __init__(self, wall_seconds=0, **counts):
+        self.wall_seconds = wall_seconds
+        self.counts = dict(dict.fromkeys(self.COUNTERS, 0), **counts)
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for name, count in counts.items():
+                self.counts[name] += count
+
+    def add_page(self, page):
+        if page.not_modified:
+            self.add(pages_cached=1)
+        else:
+            self.add(pages_fetched=1, bytes_fetched=len(page.content))
+
+    def add_pipeline(self, pipeline):
+        """Adds the parse time of a Pipeline, if it was run"""
+        if pipeline is not None:
+            self.add(parse_seconds=pipeline.stats['parse'].busy_seconds)
+
+    def add_diff(self, diff):
+        """Adds the rows written, from a TableDiff"""
+        self.add(
+            inserted=diff.inserted, updated=diff.changed, unchanged=diff.unchanged,
+            deleted=diff.deleted)
+
+    def as_dict(self):
+        return dict(self.counts, wall_seconds=self.wall_seconds)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def __str__(self):
+        return (
+            "{wall_seconds:.1f}s, {pages_fetched} pages fetched ({kilobytes:.1f} KB), "
+            "{pages_cached} cached, {parse_seconds:.1f}s parsing, {inserted} inserted, "
+            "{updated} updated, {unchanged} unchanged, {deleted} deleted, {errors} errors").format(
+            kilobytes=self.counts['bytes_fetched'] / 1024, **self.as_dict())
+
+
+class StageGraph(object):
+    """Runs stages in the order of their dependencies, running the independent ones concurrently.
+
+    Each stage runs in a thread of its own (at most workers at once), with its own database
+    connection, which is closed when the stage finishes. With workers=1 they run one at a time in
+    the calling thread. How long each stage took is kept in seconds.
+    """
+
+    def __init__(self, stages, workers=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.workers = workers or len(self.stages)
+        self.seconds = {}
+        for stage in stages:
+            unknown = set(stage.depends_on) - set(self.stages)
+            if unknown:
+                raise ValueError("{} depends on unknown stages {}".format(stage, sorted(unknown)))
+        self.order()  # checks there's no cycle
+
+    def order(self, names=None):
+        """The names of the stages (all of them, or just those in names) in an order they can be
+        run in one at a time
+        """
+        names = list(self.stages) if names is None else list(names)
+        order = []
+        visiting = set()
+
+        def visit(name):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError("The stages depend on each other, through {}".format(name))
+            visiting.add(name)
+            for dependency in self.stages[name].depends_on:
+                visit(dependency)
+            visiting.remove(name)
+            order.append(name)
+
+        for name in names:
+            visit(name)
+        return [name for name in order if name in names]
+
+    def run(self, names=None, done=(), on_finished=None):
+        """Runs the stages in names (all of them by default) which aren't in done.
+
+        The stages not being run are taken to be done already, e.g. their data is in the database
+        from an earlier run. on_finished(name, result) is called, in this thread, as each stage
+        finishes. If a stage fails no more are started, and once the running ones have finished
+        its exception is raised. Returns a {name: result} of the stages run.
+        """
+        names = self.stages if names is None else names
+        unknown = set(names) - set(self.stages)
+        if unknown:
+            raise ValueError("Unknown stages {}".format(sorted(unknown)))
+        pending = [name for name in self.order(names) if name not in done]
+        if self.workers == 1:
+            return self._run_in_order(pending, on_finished)
+
+        results = {}
+        running = {}
+        failure = None
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while (pending and failure is None) or running:
+                for name in list(pending):
+                    if failure is None and len(running) < self.workers and self._ready(
+                            name, pending, running):
+                        pending.remove(name)
+                        running[executor.submit(self._run_stage, name)] = name
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as exc:
+                        failure = failure or exc
+                        continue
+                    if on_finished is not None:
+                        on_finished(name, results[name])
+        if failure is not None:
+            raise failure
+        return results
+
+    def _run_in_order(self, names, on_finished):
+        results = {}
+        for name in names:
+            results[name] = self._timed_run(name)
+            if on_finished is not None:
+                on_finished(name, results[name])
+        return results
+
+    def _ready(self, name, pending, running):
+        waiting_for = set(pending) | set(running.values())
+        return not waiting_for.intersection(self.stages[name].depends_on)
+
+    def _run_stage(self, name):
+        try:
+            return self._timed_run(name)
+        finally:
+            connections.close_all()
+
+    def _timed_run(self, name):
+        logger.info("Starting stage %s", name)
+        start = time.perf_counter()
+        result = self.stages[name].run()
+        self.seconds[name] = time.perf_counter() - start
+        logger.info("Finished stage %s in %.2fs", name, self.seconds[name])
+        return result
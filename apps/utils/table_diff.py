@@ -0,0 +1,74 @@
+import heapq
+from numbers import Number
+from collections import namedtuple
+
+
+Mover = namedtuple('Mover', ('group', 'key', 'old', 'new'))
+
+
+class TableDiff(object):
+    """Works out which rows of a table need writing, by comparing them with the current values.
+
+    current is {group: {key: value}} of the rows in the table, e.g. {hero: {enemy: advantage}}.
+    diff() is given the new values of a group, numbers are only counted as changed if they've moved
+    by more than tolerance. The number of rows inserted, changed, deleted and unchanged is kept,
+    along with the changes in numbers, to report the largest movers.
+    """
+    TOP_MOVERS = 10
+
+    def __init__(self, name, current, tolerance=0, label=None):
+        self.name = name
+        self.current = current
+        self.tolerance = tolerance
+        self.label = label or (lambda group, key: '{} {}'.format(group, key))
+        self.inserted = 0
+        self.changed = 0
+        self.deleted = 0
+        self.unchanged = 0
+        self.movers = []
+
+    def diff(self, group, new, delete_missing=True):
+        """The keys of the rows to write (inserted or changed), and of the rows to delete"""
+        current = self.current.get(group, {})
+        write = []
+        for key, value in new.items():
+            if key not in current:
+                self.inserted += 1
+                write.append(key)
+            elif self._changed(current[key], value):
+                self.changed += 1
+                write.append(key)
+                if self._is_number(value):
+                    self.movers.append(Mover(group, key, current[key], value))
+            else:
+                self.unchanged += 1
+
+        delete = [key for key in current if key not in new] if delete_missing else []
+        self.deleted += len(delete)
+        return write, delete
+
+    def _changed(self, old, new):
+        if self._is_number(old) and self._is_number(new):
+            return abs(new - old) > self.tolerance
+        return old != new
+
+    @staticmethod
+    def _is_number(value):
+        return isinstance(value, Number) and not isinstance(value, bool)
+
+    def largest_movers(self, n=None):
+        return heapq.nlargest(
+            n or self.TOP_MOVERS, self.movers, key=lambda m: abs(m.new - m.old))
+
+    def summary(self):
+        """The number of rows written, and the largest movers, as a list of lines of text"""
+        lines = ['{}: {} inserted, {} changed, {} deleted, {} unchanged'.format(
+            self.name, self.inserted, self.changed, self.deleted, self.unchanged)]
+        movers = self.largest_movers()
+        if movers:
+            lines.append('Largest movers:')
+            lines += [
+                '  {}: {:g} -> {:g}'.format(self.label(m.group, m.key), m.old, m.new)
+                for m in movers
+            ]
+        return lines
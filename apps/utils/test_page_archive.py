@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from .page_archive import (
+    PageArchive, PageNotArchived, RecordingRequestHandler, ReplayRequestHandler)
+from .request_handler import RequestHandler, Page
+
+
+class TestPageArchive(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_add_and_get(self):
+        archive = PageArchive(self.directory)
+        archive.add('http://a.com/1', b'page one')
+        archive.add('http://a.com/2', 'page two')
+        assert archive.get('http://a.com/1') == b'page one'
+        assert archive.get('http://a.com/2') == b'page two'
+
+        # Read back from the disk
+        archive = PageArchive(self.directory)
+        assert archive.get('http://a.com/1') == b'page one'
+        assert archive.get('http://a.com/2') == b'page two'
+
+    def test_pages_stored_once(self):
+        archive = PageArchive(self.directory)
+        archive.add('http://a.com/1', b'same page')
+        archive.add('http://a.com/2', b'same page')
+        archive.add('http://a.com/1', b'same page')
+        objects = [f for _, _, files in os.walk(os.path.join(self.directory, 'objects'))
+                   for f in files]
+        assert len(objects) == 1
+
+    def test_latest_page_wins(self):
+        archive = PageArchive(self.directory)
+        archive.add('http://a.com/', b'old')
+        archive.add('http://a.com/', b'new')
+        assert PageArchive(self.directory).get('http://a.com/') == b'new'
+
+    @patch('apps.utils.http_cache.os.replace', side_effect=OSError)
+    def test_failed_write_leaves_no_files(self, replace):
+        archive = PageArchive(self.directory)
+        with self.assertRaises(OSError):
+            archive.add('http://a.com/', b'page')
+        assert not [f for _, _, files in os.walk(os.path.join(self.directory, 'objects'))
+                    for f in files]
+
+    def test_missing(self):
+        with self.assertRaises(PageNotArchived):
+            PageArchive(self.directory).get('http://a.com/')
+
+
+class TestRecordAndReplay(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.archive = PageArchive(directory.name)
+
+    @patch.object(RequestHandler, 'get_page')
+    def test_replays_recorded_pages(self, get_page):
+        get_page.side_effect = lambda url: Page(
+            url, url.encode('utf8'), unchanged=False, not_modified=False)
+        urls = ['http://a.com/{}'.format(i) for i in range(5)]
+        recorded = list(RecordingRequestHandler(self.archive).get_all(urls))
+
+        replayed = list(ReplayRequestHandler(PageArchive(self.archive.directory)).get_all(urls))
+        assert replayed == recorded
+        assert get_page.call_count == 5
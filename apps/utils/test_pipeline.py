@@ -0,0 +1,98 @@
+import time
+import threading
+import unittest
+
+from .pipeline import Pipeline, SKIP
+
+
+def parse(page):
+    return {'page': page, 'length': len(page)}
+
+
+def parse_slowly(page):
+    if page == 'page 0':
+        time.sleep(0.5)
+    return parse(page)
+
+
+def fail_to_parse(page):
+    raise ValueError(page)
+
+
+def fetch(item):
+    time.sleep(0.01)
+    return 'page {}'.format(item)
+
+
+class TestPipeline(unittest.TestCase):
+    def test_every_item_is_parsed(self):
+        pipeline = Pipeline('Test', fetch, parse, fetch_workers=4, parse_workers=2, queue_size=2)
+        results = dict(pipeline.run(range(20)))
+        assert results == {i: parse('page {}'.format(i)) for i in range(20)}
+
+    def test_yielded_as_they_finish_parsing(self):
+        pipeline = Pipeline(
+            'Test', fetch, parse_slowly, fetch_workers=1, parse_workers=2, queue_size=4)
+        items = [item for item, _ in pipeline.run(range(4))]
+        # The others aren't held up by the first
+        assert items[-1] == 0
+        assert sorted(items) == [0, 1, 2, 3]
+
+    def test_parse_in_this_process(self):
+        pipeline = Pipeline('Test', fetch, parse, parse_workers=1)
+        assert dict(pipeline.run([1, 2])) == {1: parse('page 1'), 2: parse('page 2')}
+
+    def test_nothing_to_do(self):
+        assert list(Pipeline('Test', fetch, parse, parse_workers=1).run([])) == []
+
+    def test_counts_each_stage(self):
+        pipeline = Pipeline('Test', fetch, parse, parse_workers=1)
+        for _ in pipeline.run(range(5)):
+            time.sleep(0.01)
+        for stage in ('fetch', 'parse', 'write'):
+            assert pipeline.stats[stage].items == 5
+        assert pipeline.stats['fetch'].busy_seconds >= 0.05
+        assert pipeline.stats['write'].busy_seconds >= 0.05
+        assert pipeline.wall_seconds > 0
+        assert str(pipeline).startswith('Test pipeline took')
+
+    def test_stages_overlap(self):
+        pipeline = Pipeline('Test', fetch, parse, fetch_workers=1, parse_workers=1)
+        for _ in pipeline.run(range(10)):
+            time.sleep(0.01)
+        # Writing one item while the next is fetched, rather than one after the other
+        assert pipeline.wall_seconds < 0.18
+
+    def test_fetch_errors_are_raised(self):
+        def fail_to_fetch(item):
+            if item == 3:
+                raise IOError("Can't fetch")
+            return fetch(item)
+
+        pipeline = Pipeline('Test', fail_to_fetch, parse, fetch_workers=2, parse_workers=1)
+        with self.assertRaises(IOError):
+            list(pipeline.run(range(10)))
+
+    def test_parse_errors_are_raised(self):
+        pipeline = Pipeline('Test', fetch, fail_to_parse, parse_workers=2)
+        with self.assertRaises(ValueError):
+            list(pipeline.run(range(3)))
+
+    def test_stopping_early_leaves_no_threads(self):
+        threads = threading.active_count()
+        results = Pipeline(
+            'Test', fetch, parse, fetch_workers=2, parse_workers=1, queue_size=1).run(range(20))
+        next(results)
+        results.close()
+        deadline = time.time() + 2
+        while threading.active_count() > threads and time.time() < deadline:
+            time.sleep(0.01)
+        assert threading.active_count() == threads
+
+    def test_skipped_items_are_not_parsed(self):
+        def skip_odd(item):
+            return SKIP if item % 2 else fetch(item)
+
+        pipeline = Pipeline('Test', skip_odd, parse, parse_workers=1)
+        assert sorted(dict(pipeline.run(range(6)))) == [0, 2, 4]
+        assert (pipeline.skipped, pipeline.stats['parse'].items) == (3, 3)
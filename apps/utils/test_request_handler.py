@@ -0,0 +1,195 @@
+import os
+import time
+import tempfile
+import threading
+import unittest
+from unittest.mock import Mock, patch
+
+from requests.exceptions import ConnectionError, Timeout, HTTPError
+
+from .request_handler import RequestHandler, MeteredRequestHandler, HostLimit, HostLimiter, Page
+from .stages import StageMetrics
+from .http_cache import HttpCache, CachedPage
+
+
+class CountingRequestHandler(RequestHandler):
+    """Pretends to fetch pages, recording how many are fetched at once from each host"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.max_in_flight = {}
+
+    def get_page(self, url):
+        host = url.split('/')[2]
+        with self._host_limiter(url).request():
+            with self.lock:
+                self.in_flight[host] = self.in_flight.get(host, 0) + 1
+                self.max_in_flight[host] = max(
+                    self.max_in_flight.get(host, 0), self.in_flight[host])
+            time.sleep(0.01)
+            with self.lock:
+                self.in_flight[host] -= 1
+        return Page(url, url, unchanged=False, not_modified=False)
+
+
+class TestRequestHandler(unittest.TestCase):
+    def test_get_all_keeps_the_order(self):
+        handler = CountingRequestHandler(
+            max_workers=4, host_limits={'a.com': HostLimit(concurrency=4, min_interval=0)})
+        urls = ['http://a.com/{}'.format(i) for i in range(10)]
+        assert list(handler.get_all(urls)) == urls
+
+    def test_get_all_limits_each_host(self):
+        handler = CountingRequestHandler(max_workers=8, host_limits={
+            'a.com': HostLimit(concurrency=1, min_interval=0),
+            'b.com': HostLimit(concurrency=3, min_interval=0),
+        })
+        urls = ['http://{}/{}'.format(host, i) for i in range(6) for host in ('a.com', 'b.com')]
+        list(handler.get_all(urls))
+        assert handler.max_in_flight['a.com'] == 1
+        assert 1 < handler.max_in_flight['b.com'] <= 3
+
+    def test_get_all_nothing(self):
+        assert list(RequestHandler().get_all([])) == []
+
+
+class TestHostLimiter(unittest.TestCase):
+    def test_requests_are_spaced_out(self):
+        limiter = HostLimiter(HostLimit(concurrency=3, min_interval=0.05))
+        starts = []
+
+        def request():
+            with limiter.request():
+                starts.append(time.monotonic())
+
+        threads = [threading.Thread(target=request) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        starts.sort()
+        assert all(b - a >= 0.04 for a, b in zip(starts, starts[1:]))
+
+
+class NoSleepRequestHandler(RequestHandler):
+    @property
+    def sleeps(self):
+        return [0, 0]
+
+
+def mock_response(status_code=200, content=b'page', headers=None):
+    response = Mock(status_code=status_code, content=content, headers=headers or {})
+    if status_code >= 400:
+        response.raise_for_status.side_effect = HTTPError(str(status_code))
+    return response
+
+
+class TestRequestHandlerRetries(unittest.TestCase):
+    def setUp(self):
+        self.handler = NoSleepRequestHandler()
+        patcher = patch.object(self.handler.session, 'get')
+        self.session_get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_uses_the_session_with_a_timeout(self):
+        self.session_get.return_value = mock_response()
+        assert self.handler.get('http://a.com/') == b'page'
+        self.session_get.assert_called_once_with(
+            'http://a.com/', headers={}, timeout=RequestHandler.TIMEOUT)
+
+    def test_retries_connection_errors_and_timeouts(self):
+        self.session_get.side_effect = [ConnectionError(), Timeout(), mock_response()]
+        assert self.handler.get('http://a.com/') == b'page'
+        assert self.session_get.call_count == 3
+
+    def test_retries_server_errors(self):
+        self.session_get.side_effect = [mock_response(503), mock_response()]
+        assert self.handler.get('http://a.com/') == b'page'
+
+    def test_gives_up(self):
+        self.session_get.side_effect = ConnectionError()
+        with self.assertRaises(ConnectionError):
+            self.handler.get('http://a.com/')
+        assert self.session_get.call_count == 3
+
+    def test_does_not_retry_not_found(self):
+        self.session_get.return_value = mock_response(404, b'not found')
+        assert self.handler.get('http://a.com/') == b'not found'
+        assert self.session_get.call_count == 1
+
+
+class TestRequestHandlerCache(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = HttpCache(directory.name)
+        self.handler = NoSleepRequestHandler(cache=self.cache)
+        patcher = patch.object(self.handler.session, 'get')
+        self.session_get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_caches_pages(self):
+        self.session_get.return_value = mock_response(
+            content=b'page', headers={'ETag': '"abc"', 'Last-Modified': 'Sat, 01 Dec 2018'})
+        page = self.handler.get_page('http://a.com/')
+        assert page == Page('http://a.com/', b'page', unchanged=False, not_modified=False)
+        assert self.cache.get('http://a.com/') == CachedPage(
+            b'page', '"abc"', 'Sat, 01 Dec 2018')
+
+    def test_revalidates_cached_pages(self):
+        self.cache.set('http://a.com/', b'page', '"abc"', 'Sat, 01 Dec 2018')
+        self.session_get.return_value = mock_response(304, b'')
+        page = self.handler.get_page('http://a.com/')
+        assert page == Page('http://a.com/', b'page', unchanged=True, not_modified=True)
+        self.session_get.assert_called_once_with('http://a.com/', headers={
+            'If-None-Match': '"abc"',
+            'If-Modified-Since': 'Sat, 01 Dec 2018',
+        }, timeout=RequestHandler.TIMEOUT)
+
+    def test_changed_pages(self):
+        self.cache.set('http://a.com/', b'old page', '"abc"')
+        self.session_get.return_value = mock_response(content=b'new page', headers={'ETag': '"d"'})
+        assert not self.handler.get_page('http://a.com/').unchanged
+        assert self.cache.get('http://a.com/') == CachedPage(b'new page', '"d"', None)
+
+    def test_same_content_is_unchanged(self):
+        # e.g. the server doesn't support conditional requests
+        self.cache.set('http://a.com/', b'page')
+        self.session_get.return_value = mock_response(content=b'page')
+        page = self.handler.get_page('http://a.com/')
+        assert page.unchanged and not page.not_modified
+        self.session_get.assert_called_once_with(
+            'http://a.com/', headers={}, timeout=RequestHandler.TIMEOUT)
+
+    def test_metered(self):
+        self.cache.set('http://a.com/', b'page', '"abc"')
+        metrics = StageMetrics()
+        handler = MeteredRequestHandler(self.handler, metrics)
+        self.session_get.return_value = mock_response(304, b'')
+        assert handler.get('http://a.com/') == b'page'
+        self.session_get.return_value = mock_response(content=b'new page')
+        assert handler.get('http://b.com/') == b'new page'
+        # The same content again, but downloaded in full
+        self.session_get.return_value = mock_response(content=b'new page')
+        assert handler.get('http://b.com/') == b'new page'
+        assert metrics.counts['pages_cached'] == 1
+        assert metrics.counts['pages_fetched'] == 2
+        assert metrics.counts['bytes_fetched'] == 2 * len(b'new page')
+
+
+class TestHttpCache(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = HttpCache(directory.name)
+
+    def test_missing(self):
+        assert self.cache.get('http://a.com/') is None
+
+    def test_compresses_pages(self):
+        content = b'<html>' + b'hero ' * 1000 + b'</html>'
+        self.cache.set('http://a.com/', content)
+        assert self.cache.get('http://a.com/').content == content
+        assert os.path.getsize(self.cache._path('http://a.com/')) < len(content) / 10
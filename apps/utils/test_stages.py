@@ -0,0 +1,126 @@
+import threading
+import unittest
+
+from .stages import Stage, StageGraph, StageMetrics
+from .table_diff import TableDiff
+
+
+class Recorder(object):
+    """Stages which record when they start and finish"""
+
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def stage(self, name, depends_on=(), fail=False):
+        def run():
+            self.record('start', name)
+            if fail:
+                raise ValueError(name)
+            self.record('finish', name)
+            return name.upper()
+        return Stage(name, run, depends_on)
+
+    def record(self, event, name):
+        with self.lock:
+            self.events.append((event, name))
+
+    def index(self, event, name):
+        return self.events.index((event, name))
+
+
+class TestStageGraph(unittest.TestCase):
+    def setUp(self):
+        self.recorder = Recorder()
+
+    def graph(self, workers=None, **stages):
+        return StageGraph([
+            self.recorder.stage(name, **options) for name, options in stages.items()
+        ], workers=workers)
+
+    def test_dependencies_run_first(self):
+        graph = self.graph(
+            heroes={}, advantages={'depends_on': ['heroes']},
+            counters={'depends_on': ['advantages']})
+        assert graph.run() == {'heroes': 'HEROES', 'advantages': 'ADVANTAGES',
+                               'counters': 'COUNTERS'}
+        assert self.recorder.index('finish', 'heroes') < self.recorder.index('start', 'advantages')
+        assert self.recorder.index('finish', 'advantages') < self.recorder.index(
+            'start', 'counters')
+
+    def test_independent_stages_run_concurrently(self):
+        # Each waits for the other to start, so they'd time out if run one at a time
+        abilities_started = threading.Event()
+        graph = StageGraph([
+            Stage('heroes', lambda: None),
+            Stage('advantages', lambda: abilities_started.wait(timeout=5), ['heroes']),
+            Stage('abilities', abilities_started.set, ['heroes']),
+        ])
+        assert graph.run()['advantages']
+
+    def test_runs_selected_stages(self):
+        graph = self.graph(heroes={}, abilities={'depends_on': ['heroes']}, roles={})
+        assert graph.run(['abilities']) == {'abilities': 'ABILITIES'}
+
+    def test_skips_done_stages(self):
+        finished = []
+        graph = self.graph(heroes={}, abilities={'depends_on': ['heroes']})
+        graph.run(done=['heroes'], on_finished=lambda name, result: finished.append(name))
+        assert finished == ['abilities']
+        assert ('start', 'heroes') not in self.recorder.events
+
+    def test_failure_stops_later_stages(self):
+        graph = self.graph(
+            heroes={'fail': True}, abilities={'depends_on': ['heroes']}, roles={})
+        with self.assertRaises(ValueError):
+            graph.run()
+        assert ('start', 'abilities') not in self.recorder.events
+
+    def test_times_each_stage(self):
+        graph = self.graph(heroes={}, roles={'depends_on': ['heroes']})
+        graph.run()
+        assert set(graph.seconds) == {'heroes', 'roles'}
+
+    def test_one_worker_runs_in_order(self):
+        graph = self.graph(
+            workers=1, counters={'depends_on': ['heroes']}, heroes={})
+        assert graph.order() == ['heroes', 'counters']
+        graph.run()
+        assert [name for event, name in self.recorder.events if event == 'start'] == [
+            'heroes', 'counters']
+
+    def test_rejects_bad_graphs(self):
+        with self.assertRaises(ValueError):
+            self.graph(heroes={'depends_on': ['nothing']})
+        with self.assertRaises(ValueError):
+            self.graph(heroes={'depends_on': ['roles']}, roles={'depends_on': ['heroes']})
+        with self.assertRaises(ValueError):
+            self.graph(heroes={}).run(['roles'])
+
+
+class TestStageMetrics(unittest.TestCase):
+    def test_adds_up_from_threads(self):
+        metrics = StageMetrics()
+        threads = [
+            threading.Thread(target=lambda: [metrics.add(errors=1) for _ in range(100)])
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert metrics.counts['errors'] == 400
+
+    def test_rows_from_a_diff(self):
+        diff = TableDiff('Test', {1: {'a': 1, 'b': 2, 'c': 3}})
+        diff.diff(1, {'a': 1, 'b': 5, 'd': 4})
+        metrics = StageMetrics()
+        metrics.add_diff(diff)
+        assert [metrics.counts[c] for c in ('inserted', 'updated', 'unchanged', 'deleted')] == [
+            1, 1, 1, 1]
+
+    def test_round_trip(self):
+        metrics = StageMetrics(wall_seconds=2.5, pages_fetched=3, bytes_fetched=2048)
+        copy = StageMetrics.from_dict(metrics.as_dict())
+        assert copy.as_dict() == metrics.as_dict()
+        assert str(copy).startswith('2.5s, 3 pages fetched (2.0 KB), 0 cached')
@@ -0,0 +1,39 @@
+import unittest
+
+from .table_diff import TableDiff
+
+
+class TestTableDiff(unittest.TestCase):
+    def setUp(self):
+        self.diff = TableDiff('Test', {'a': {'x': 1.0, 'y': 2.0, 'z': 3.0}}, tolerance=0.1)
+
+    def test_diff(self):
+        write, delete = self.diff.diff('a', {'x': 1.05, 'y': 2.5, 'w': 0})
+        assert sorted(write) == ['w', 'y']
+        assert delete == ['z']
+        assert (self.diff.inserted, self.diff.changed, self.diff.deleted, self.diff.unchanged) == (
+            1, 1, 1, 1)
+
+    def test_new_group(self):
+        write, delete = self.diff.diff('b', {'x': 1.0})
+        assert (write, delete) == (['x'], [])
+
+    def test_keep_missing(self):
+        assert self.diff.diff('a', {}, delete_missing=False) == ([], [])
+
+    def test_other_values_are_compared_exactly(self):
+        diff = TableDiff('Test', {'a': {'x': ('text', 1), 'y': ('text', 2)}}, tolerance=10)
+        write, _ = diff.diff('a', {'x': ('text', 1), 'y': ('text', 3)})
+        assert write == ['y']
+        assert diff.largest_movers() == []
+
+    def test_largest_movers(self):
+        self.diff.diff('a', {'x': 5.0, 'y': 1.0, 'z': 3.0})
+        assert [(m.key, m.old, m.new) for m in self.diff.largest_movers()] == [
+            ('x', 1.0, 5.0), ('y', 2.0, 1.0)]
+        assert self.diff.summary() == [
+            'Test: 0 inserted, 2 changed, 0 deleted, 1 unchanged',
+            'Largest movers:',
+            '  a x: 1 -> 5',
+            '  a y: 2 -> 1',
+        ]
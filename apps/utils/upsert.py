@@ -0,0 +1,49 @@
+from django.db import connection
+
+
+# SQLite's limit on the number of parameters in a query, each batch of rows is kept under it
+MAX_PARAMETERS = 999
+
+
+def upsert(model, rows, key, increment=(), replace=()):
+    """Inserts the rows, or for rows whose key already exists updates them.
+
+    rows is a list of dicts of field values, all with the same fields, and key the name of the
+    unique field (or a tuple of the names of the unique_together fields) that identifies a row.
+    For existing rows the increment fields are added to, and the replace fields overwritten.
+
+    Each batch of rows is a single INSERT ... ON CONFLICT, which both PostgreSQL and SQLite
+    support, so it's safe when several processes are updating the same rows.
+    """
+    if not rows:
+        return
+    if isinstance(key, str):
+        key = (key,)
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+
+    def column(name):
+        return quote(model._meta.get_field(name).column)
+
+    fields = [model._meta.get_field(name) for name in rows[0]]
+    updates = [
+        '{0} = {1}.{0} + EXCLUDED.{0}'.format(column(name), table) for name in increment
+    ] + [
+        '{0} = EXCLUDED.{0}'.format(column(name)) for name in replace
+    ]
+    placeholders = '({})'.format(', '.join(['%s'] * len(fields)))
+    batch_size = max(1, MAX_PARAMETERS // len(fields))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            sql = 'INSERT INTO {} ({}) VALUES {} ON CONFLICT ({}) DO UPDATE SET {}'.format(
+                table,
+                ', '.join(quote(f.column) for f in fields),
+                ', '.join([placeholders] * len(batch)),
+                ', '.join(column(name) for name in key),
+                ', '.join(updates))
+            cursor.execute(sql, [
+                f.get_db_prep_save(row[f.name], connection)
+                for row in batch
+                for f in fields
+            ])
@@ -1,8 +1,25 @@
 import os
 
+import pytest
 from django import setup
 
 
 def pytest_configure():
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings.test')
     setup()
+
+
+@pytest.fixture(autouse=True)
+def invalidate_snapshots():
+    """Snapshots are cached between requests, but tests roll back the data they loaded"""
+    from apps.google_assistant.knowledge_base import KnowledgeBase
+    from apps.hero_advantages.advantage_matrix import AdvantageMatrix
+    KnowledgeBase.invalidate()
+    AdvantageMatrix.invalidate()
+
+
+@pytest.fixture(autouse=True)
+def clear_usage_counters():
+    """Don't let the usage counted by one test be saved during another"""
+    from apps.metadata.usage import usage_counters
+    usage_counters.clear()
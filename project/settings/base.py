@@ -39,6 +39,10 @@ SECRET_KEY = get_secret('SECRET_KEY')
 
 USERS_NOT_TO_LOG = get_secret('USERS_NOT_TO_LOG')
 
+# Unique users are counted approximately by metadata.DailyUsers, set this to also keep a row for
+# every user in metadata.User
+LOG_EXACT_USERS = False
+
 
 ALLOWED_HOSTS = [
     'localhost',
@@ -53,6 +57,7 @@ INSTALLED_APPS = [
     'apps.hero_advantages.apps.HeroAdvantagesConfig',
     'apps.hero_abilities.apps.HeroAbilitiesConfig',
     'apps.metadata.apps.MetadataConfig',
+    'apps.google_assistant.apps.GoogleAssistantConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -106,6 +111,13 @@ DATABASES = {
 }
 
 
+# Pages fetched by update_heroes are kept here, so they're only downloaded again if they change
+SCRAPER_CACHE_DIR = BASE_DIR.child('cache', 'pages')
+
+# Advantages (in percentage points) which have moved by no more than this aren't written again
+SCRAPER_ADVANTAGE_TOLERANCE = 0.01
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
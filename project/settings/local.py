@@ -16,23 +16,28 @@ LOGGING = {
         'verbose': {
             'format': '[%(levelname)s %(asctime)s %(name)s] %(message)s',
         },
+        'json': {
+            '()': 'apps.metadata.log_handlers.JsonLinesFormatter',
+        },
     },
     'handlers': {
         'file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'class': 'apps.metadata.log_handlers.BackgroundFileHandler',
             'filename': os.path.join(os.sep, 'var', 'log', 'www', 'true-sight.log'),
             'formatter': 'verbose',
         },
         'good_response_file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': os.path.join(os.sep, 'var', 'log', 'www', 'good-response.log'),
+            'class': 'apps.metadata.log_handlers.BackgroundFileHandler',
+            'filename': os.path.join(os.sep, 'var', 'log', 'www', 'good-response.jsonl'),
+            'formatter': 'json',
         },
         'failed_response_file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': os.path.join(os.sep, 'var', 'log', 'www', 'failed-response.log'),
+            'class': 'apps.metadata.log_handlers.BackgroundFileHandler',
+            'filename': os.path.join(os.sep, 'var', 'log', 'www', 'failed-response.jsonl'),
+            'formatter': 'json',
         },
     },
     'loggers': {
@@ -12,35 +12,38 @@ LOGGING = {
         'time':  {
             'format': '[%(asctime)s] %(message)s',
         },
+        'json': {
+            '()': 'apps.metadata.log_handlers.JsonLinesFormatter',
+        },
     },
     'handlers': {
         'default_file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'class': 'apps.metadata.log_handlers.BackgroundFileHandler',
             'filename': os.path.join(os.sep, 'var', 'log', 'www', 'true-sight.log'),
             'formatter': 'verbose',
         },
         'error_file': {
             'level': 'WARNING',
-            'class': 'logging.FileHandler',
+            'class': 'apps.metadata.log_handlers.BackgroundFileHandler',
             'filename': os.path.join(os.sep, 'var', 'log', 'www', 'error.log'),
             'formatter': 'verbose',
         },
         'good_response_file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': os.path.join(os.sep, 'var', 'log', 'www', 'good-response.log'),
-            'formatter': 'time',
+            'class': 'apps.metadata.log_handlers.BackgroundFileHandler',
+            'filename': os.path.join(os.sep, 'var', 'log', 'www', 'good-response.jsonl'),
+            'formatter': 'json',
         },
         'failed_response_file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': os.path.join(os.sep, 'var', 'log', 'www', 'failed-response.log'),
-            'formatter': 'time',
+            'class': 'apps.metadata.log_handlers.BackgroundFileHandler',
+            'filename': os.path.join(os.sep, 'var', 'log', 'www', 'failed-response.jsonl'),
+            'formatter': 'json',
         },
         'feedback_file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'class': 'apps.metadata.log_handlers.BackgroundFileHandler',
             'filename': os.path.join(os.sep, 'var', 'log', 'www', 'feedback.log'),
             'formatter': 'time',
         },